@@ -0,0 +1,270 @@
+"""Password hashing policy - which bcrypt cost new hashes use"""
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+import bcrypt
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines - single process only
+    fcntl = None
+
+DEFAULT_ROUNDS = 12
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+DEFAULT_TARGET_MS = 250
+
+# Costs bcrypt itself accepts
+BCRYPT_MIN_ROUNDS = 4
+BCRYPT_MAX_ROUNDS = 31
+
+
+def default_policy_file():
+    """Get the path where the calibrated cost is recorded."""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    return os.environ.get('PASSWORD_POLICY_FILE', os.path.join(root, 'instance', 'hashing_policy.json'))
+
+
+def rounds_of(password_hash):
+    """
+    Read the cost factor from a bcrypt hash ("$2b$12$...").
+
+    Args:
+        password_hash: Stored bcrypt hash
+
+    Returns:
+        int or None: Cost, or None if the hash isn't bcrypt
+    """
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def parse_rounds(value):
+    """
+    Validate a configured bcrypt cost.
+
+    Costs below MIN_ROUNDS are raised to it, so a typo or a stale setting
+    can't weaken new hashes.
+
+    Args:
+        value: Cost as a string or int, e.g. from PASSWORD_HASH_ROUNDS
+
+    Returns:
+        int: The cost, at least MIN_ROUNDS
+
+    Raises:
+        ValueError: If it isn't an integer of at most 31
+    """
+    try:
+        rounds = int(value)
+    except (TypeError, ValueError):
+        rounds = None
+    if rounds is None or rounds > BCRYPT_MAX_ROUNDS:
+        raise ValueError(
+            f'PASSWORD_HASH_ROUNDS must be an integer of at most {BCRYPT_MAX_ROUNDS}, got {value!r}'
+        )
+    return max(rounds, MIN_ROUNDS)
+
+
+def measure_hash_seconds(rounds, samples=3):
+    """Best-of-n wall time for one bcrypt hash at the given cost"""
+    salt = bcrypt.gensalt(rounds=rounds)
+    best = None
+    for _ in range(samples):
+        started = time.perf_counter()
+        bcrypt.hashpw(b'calibration-password', salt)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate(target_ms=DEFAULT_TARGET_MS, min_rounds=MIN_ROUNDS, max_rounds=MAX_ROUNDS,
+              measure=measure_hash_seconds):
+    """
+    Pick the highest bcrypt cost whose hash time stays within a target.
+
+    Each extra round doubles the work, so one measurement at `min_rounds`
+    predicts the rest; the chosen cost is then measured to confirm it.
+
+    Args:
+        target_ms: Target hash latency in milliseconds
+        min_rounds: Lowest cost to allow, even on slow hosts
+        max_rounds: Highest cost to consider
+        measure: Callable(rounds) returning seconds per hash
+
+    Returns:
+        tuple: (rounds, measured milliseconds at that cost)
+    """
+    base_ms = measure(min_rounds) * 1000
+    rounds = min_rounds
+    while rounds < max_rounds and base_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+
+    measured_ms = measure(rounds) * 1000 if rounds != min_rounds else base_ms
+    # The estimate can be off on hosts with turbo/throttling; step back if so
+    while measured_ms > target_ms and rounds > min_rounds:
+        rounds -= 1
+        measured_ms = measure(rounds) * 1000
+    return rounds, measured_ms
+
+
+class HashingPolicy:
+    """
+    The bcrypt cost used for new hashes, and where it came from.
+
+    Resolution order:
+    1. PASSWORD_HASH_ROUNDS environment variable (source 'env')
+    2. A cost recorded by a previous calibration in the policy file
+       (source 'recorded') - shared so every worker agrees on the cost
+    3. Calibration at startup when PASSWORD_HASH_CALIBRATE=true, which
+       records its result (source 'calibrated'). Workers starting together
+       take turns on a lock file, so only the first one benchmarks and the
+       rest load what it recorded.
+    4. DEFAULT_ROUNDS (source 'default')
+    """
+    def __init__(self, rounds=DEFAULT_ROUNDS, source='default', path=None):
+        self.rounds = rounds
+        self.source = source
+        self.path = path or default_policy_file()
+        self.measured_ms = None
+        self.target_ms = None
+        self.calibrated_at = None
+
+    @classmethod
+    def from_env(cls):
+        """Build the policy following the resolution order above"""
+        policy = cls()
+        env_rounds = os.environ.get('PASSWORD_HASH_ROUNDS')
+        if env_rounds:
+            policy.rounds = parse_rounds(env_rounds)
+            policy.source = 'env'
+        elif policy.load():
+            pass
+        elif os.environ.get('PASSWORD_HASH_CALIBRATE', '').lower() == 'true':
+            policy.calibrate_once(int(os.environ.get('PASSWORD_HASH_TARGET_MS', DEFAULT_TARGET_MS)))
+        return policy
+
+    def load(self):
+        """
+        Load a recorded calibration.
+
+        Returns:
+            bool: True if a recorded cost was found
+        """
+        try:
+            with open(self.path) as f:
+                record = json.load(f)
+            rounds = parse_rounds(record['rounds'])
+        except (OSError, ValueError, TypeError, KeyError):
+            return False
+        self.rounds = rounds
+        self.source = 'recorded'
+        self.measured_ms = record.get('measured_ms')
+        self.target_ms = record.get('target_ms')
+        self.calibrated_at = record.get('calibrated_at')
+        return True
+
+    def calibrate(self, target_ms=DEFAULT_TARGET_MS, measure=measure_hash_seconds):
+        """
+        Benchmark this host, adopt the resulting cost and record it.
+
+        Args:
+            target_ms: Target hash latency in milliseconds
+            measure: Callable(rounds) returning seconds per hash
+
+        Returns:
+            int: The chosen cost
+        """
+        self.rounds, self.measured_ms = calibrate(target_ms, measure=measure)
+        self.target_ms = target_ms
+        self.calibrated_at = datetime.utcnow().isoformat()
+        self.source = 'calibrated'
+
+        try:
+            self._record()
+        except OSError as e:
+            print(f"Error recording hashing policy: {e}")
+        return self.rounds
+
+    def calibrate_once(self, target_ms=DEFAULT_TARGET_MS, measure=measure_hash_seconds):
+        """
+        Calibrate unless another process already has, under an exclusive lock.
+
+        The policy file is read again once the lock is held, so workers that
+        waited for the first one adopt its result instead of benchmarking.
+
+        Args:
+            target_ms: Target hash latency in milliseconds
+            measure: Callable(rounds) returning seconds per hash
+
+        Returns:
+            int: The cost in use
+        """
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            lock = open(self.path + '.lock', 'a')
+        except OSError as e:
+            print(f"Error locking hashing policy: {e}")
+            return self.calibrate(target_ms, measure)
+
+        with lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self.load():
+                    return self.rounds
+                return self.calibrate(target_ms, measure)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _record(self):
+        """Write the policy file atomically, so readers never see half of it"""
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.hashing_policy-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def needs_rehash(self, password_hash):
+        """
+        True if a stored hash uses a lower cost than the policy.
+
+        Hashes above the policy cost are kept, so lowering the cost (or a
+        host calibrating lower than its peers) never downgrades them.
+        """
+        rounds = rounds_of(password_hash)
+        return rounds is not None and rounds < self.rounds
+
+    def snapshot(self):
+        """
+        Get the policy for JSON output.
+
+        Returns:
+            dict: Cost in use, its source and calibration details
+        """
+        return {
+            'rounds': self.rounds,
+            'source': self.source,
+            'target_ms': self.target_ms,
+            'measured_ms': round(self.measured_ms, 3) if self.measured_ms is not None else None,
+            'calibrated_at': self.calibrated_at,
+        }
+
+
+# Global policy - resolved once per process
+policy = HashingPolicy.from_env()
@@ -1,6 +1,225 @@
 """Password hashing and verification utilities using bcrypt"""
+import os
+import random
+import tempfile
+import threading
+import time
 import bcrypt
 
+try:
+    import fcntl
+except ImportError:  # Windows development machines - per-process limit only
+    fcntl = None
+from app.auth.hashing_policy import policy
+
+
+class PasswordWorkBusy(Exception):
+    """Raised when the password hashing pool is saturated"""
+    def __init__(self, retry_after):
+        super().__init__('Password hashing is saturated, retry later')
+        self.retry_after = retry_after
+
+
+class _ThreadSlots:
+    """Concurrency slots shared by the threads of one process"""
+    def __init__(self, count):
+        self._semaphore = threading.BoundedSemaphore(count)
+    
+    def acquire(self, timeout=0):
+        """Take a slot, waiting up to `timeout` seconds; returns a token or None"""
+        if timeout:
+            return self._semaphore.acquire(timeout=timeout) or None
+        return self._semaphore.acquire(blocking=False) or None
+    
+    def release(self, token):
+        self._semaphore.release()
+
+
+class _FileSlots:
+    """
+    Host-wide concurrency slots: one flock'd file per slot in `directory`.
+    
+    Every process using the same directory shares the slots, so the limit
+    holds across gunicorn's sync workers. A lock dies with its process, so
+    a crashed worker can't leak a slot. Waiters poll, so admission is not
+    strictly first come, first served.
+    """
+    poll_interval = 0.005
+    
+    def __init__(self, directory, count):
+        self.directory = directory
+        self.count = count
+        self._ready = False
+    
+    def _try_slots(self):
+        if not self._ready:
+            os.makedirs(self.directory, exist_ok=True)
+            self._ready = True
+        # Start at a random slot so processes don't all contend for slot 0
+        first = random.randrange(self.count)
+        for n in range(self.count):
+            f = open(os.path.join(self.directory, f'slot-{(first + n) % self.count}.lock'), 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except BlockingIOError:
+                f.close()
+        return None
+    
+    def acquire(self, timeout=0):
+        """Take a slot, waiting up to `timeout` seconds; returns a token or None"""
+        deadline = time.monotonic() + timeout
+        while True:
+            token = self._try_slots()
+            if token is not None or time.monotonic() >= deadline:
+                return token
+            time.sleep(self.poll_interval)
+    
+    def release(self, token):
+        fcntl.flock(token, fcntl.LOCK_UN)
+        token.close()
+
+
+class PasswordWorkPool:
+    """
+    Admission control for bcrypt work.
+    
+    At most `max_concurrency` hashes run at once; callers beyond that wait
+    up to `queue_timeout` seconds for a slot, and once `max_waiting` callers
+    are already queued in this process new ones are rejected immediately.
+    Rejected callers get PasswordWorkBusy so the route can answer 503
+    quickly instead of tying up a worker behind a burst of logins.
+    
+    With `slot_dir` the concurrency limit is host-wide: slots are flock'd
+    files shared by every process pointing at the directory, which is what
+    makes the limit mean anything under gunicorn's sync workers (one
+    request per process). Without it (or without fcntl) the limit only
+    covers the threads of one process.
+    
+    Work runs on the caller's thread once admitted - bcrypt releases the GIL,
+    so a hand-off to another thread would only add latency.
+    """
+    def __init__(self, max_concurrency=None, max_waiting=None, queue_timeout=2.0, slot_dir=None):
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.max_waiting = self.max_concurrency * 4 if max_waiting is None else max_waiting
+        self.queue_timeout = queue_timeout
+        if slot_dir and fcntl is not None:
+            self._slots = _FileSlots(slot_dir, self.max_concurrency)
+        else:
+            self._slots = _ThreadSlots(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        
+        # Metrics
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_work_ms = 0.0
+        self.max_work_ms = 0.0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+    
+    def run(self, fn, *args):
+        """
+        Run password work once a slot is free.
+        
+        Args:
+            fn: Callable doing the bcrypt work
+            *args: Arguments for fn
+        
+        Returns:
+            fn's return value
+        
+        Raises:
+            PasswordWorkBusy: If the wait queue is full or the wait timed out
+        """
+        queued = time.monotonic()
+        slot = self._slots.acquire()
+        if slot is None:
+            with self._lock:
+                if self._waiting >= self.max_waiting:
+                    self.rejected += 1
+                    raise PasswordWorkBusy(self._retry_after())
+                self._waiting += 1
+            
+            slot = self._slots.acquire(timeout=self.queue_timeout)
+            with self._lock:
+                self._waiting -= 1
+                if slot is None:
+                    self.timed_out += 1
+                    raise PasswordWorkBusy(self._retry_after())
+        
+        wait_ms = (time.monotonic() - queued) * 1000
+        with self._lock:
+            self._in_flight += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        
+        started = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            work_ms = (time.monotonic() - started) * 1000
+            self._slots.release(slot)
+            with self._lock:
+                self._in_flight -= 1
+                self.completed += 1
+                self.total_work_ms += work_ms
+                self.max_work_ms = max(self.max_work_ms, work_ms)
+    
+    def _retry_after(self):
+        """Seconds a rejected client should wait, from the average hash time"""
+        if not self.completed:
+            return 1
+        avg_seconds = self.total_work_ms / self.completed / 1000
+        backlog = (self._waiting + self._in_flight) / self.max_concurrency
+        return max(1, round(avg_seconds * backlog))
+    
+    def stats(self):
+        """
+        Get pool metrics.
+        
+        Returns:
+            dict: Limits, current load, rejections and hash/wait latency
+        """
+        with self._lock:
+            completed = self.completed
+            admitted = completed + self._in_flight
+            return {
+                'max_concurrency': self.max_concurrency,
+                'max_waiting': self.max_waiting,
+                'queue_timeout': self.queue_timeout,
+                'in_flight': self._in_flight,
+                'waiting': self._waiting,
+                'completed': completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'avg_hash_ms': round(self.total_work_ms / completed, 3) if completed else 0.0,
+                'max_hash_ms': round(self.max_work_ms, 3),
+                'avg_wait_ms': round(self.total_wait_ms / admitted, 3) if admitted else 0.0,
+                'max_wait_ms': round(self.max_wait_ms, 3),
+            }
+
+
+# Global pool - concurrency is limited host-wide through the slot
+# directory; the wait queue is per process
+password_pool = PasswordWorkPool(
+    max_concurrency=int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 0)) or None,
+    max_waiting=int(os.environ['PASSWORD_HASH_MAX_WAITING']) if os.environ.get('PASSWORD_HASH_MAX_WAITING') else None,
+    queue_timeout=float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT', 2.0)),
+    slot_dir=os.environ.get('PASSWORD_HASH_SLOT_DIR', os.path.join(tempfile.gettempdir(), 'restaurant-app-password-slots'))
+)
+
+
+def _hash(password, rounds):
+    salt = bcrypt.gensalt(rounds=rounds)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
+def _check(password, password_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
 
 def hash_password(password: str) -> str:
     """
@@ -11,9 +230,12 @@ def hash_password(password: str) -> str:
         
     Returns:
         Hashed password (bcrypt hash)
+    
+    Raises:
+        PasswordWorkBusy: If the hashing pool is saturated
     """
-    salt = bcrypt.gensalt(rounds=12)  # 12 rounds provides good security/performance balance
-    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+    # Cost comes from the hashing policy (calibrated or configured)
+    return password_pool.run(_hash, password, policy.rounds)
 
 
 def verify_password(password: str, password_hash: str) -> bool:
@@ -26,9 +248,25 @@ def verify_password(password: str, password_hash: str) -> bool:
         
     Returns:
         True if password matches, False otherwise
+    
+    Raises:
+        PasswordWorkBusy: If the hashing pool is saturated
     """
     try:
-        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+        return password_pool.run(_check, password, password_hash)
     except (ValueError, TypeError):
         # Handle cases where hash is invalid
         return False
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """
+    Check whether a stored hash was made with a lower cost than policy.
+    
+    Args:
+        password_hash: Stored bcrypt hash
+        
+    Returns:
+        True if the password should be re-hashed at the current cost
+    """
+    return policy.needs_rehash(password_hash)
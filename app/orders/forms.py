@@ -1,6 +1,6 @@
 """Forms for order creation and management"""
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SubmitField
+from wtforms import StringField, TextAreaField, SubmitField, HiddenField
 from wtforms.validators import DataRequired, Length, Optional
 
 class OrderForm(FlaskForm):
@@ -18,4 +18,8 @@ class OrderForm(FlaskForm):
         render_kw={'class': 'form-control', 'placeholder': 'Any special requests, allergies, or additional notes?', 'rows': 3}
     )
     
+    # Same value for every submit of one checkout page, so double-clicks
+    # and retries place a single order
+    idempotency_key = HiddenField()
+    
     submit = SubmitField('Place Order', render_kw={'class': 'btn btn-primary btn-lg w-100'})
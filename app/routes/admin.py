@@ -1,14 +1,32 @@
 """Admin routes for order management and dashboard"""
+from datetime import datetime, timedelta
 from functools import wraps
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from sqlalchemy import func
 from database.postgres import SessionLocal
-from database.models import Order, OrderStatus, User
-from app.services.notifications import notify_status_change
+from database.models import Order, OrderStatus
+from database.firestore import firestore_db
+from app.services.notifications import hub as notification_hub, get_order_timeline
+from app.services.outbox import (
+    record_order_event, record_order_events, ORDER_STATUS_CHANGED, pending_count, delivery_counts
+)
+from app.services.events import bus as event_bus, OrderStatusChanged, MenuChanged
+from app.services.order_metrics import lifecycle
+from app.services.price_index import price_index
+from app.services.order_detail import load_order_detail
+from app.services import order_state, order_history, kitchen_queue
+from app.auth.utils import password_pool
+from app.auth.hashing_policy import policy as hashing_policy
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
+# Upper bound on orders changed by one bulk status request
+MAX_BULK_ORDERS = 200
+
+# Longest window the stage-duration analytics will aggregate (90 days)
+MAX_ANALYTICS_HOURS = 90 * 24
+
 
 def admin_required(f):
     """Decorator to require admin access"""
@@ -101,18 +119,16 @@ def order_detail(order_id):
     """
     session = SessionLocal()
     try:
-        order = session.query(Order).filter_by(id=order_id).first()
+        # Order with customer, restaurant, payment and items in two queries
+        order = load_order_detail(session, order_id)
         
         if not order:
             return render_template('errors/404.html'), 404
         
-        # Get user info
-        user = session.query(User).filter_by(id=order.user_id).first()
-        
         return render_template(
             'admin/order_detail.html',
             order=order,
-            user=user
+            user=order.user
         )
     
     finally:
@@ -128,7 +144,8 @@ def update_order_status(order_id):
     
     JSON body:
     {
-        'status': 'confirmed|preparing|ready|delivered|cancelled'
+        'status': 'confirmed|preparing|ready|delivered|cancelled',
+        'version': 3  (optional - reject with 409 if the order has changed since)
     }
     
     Args:
@@ -148,42 +165,41 @@ def update_order_status(order_id):
         except KeyError:
             return jsonify({'success': False, 'message': 'Invalid status'}), 400
         
-        # Get order
-        order = session.query(Order).filter_by(id=order_id).first()
-        if not order:
-            return jsonify({'success': False, 'message': 'Order not found'}), 404
-        
-        # Validate status transition
-        old_status = order.status
-        
-        # Simple validation: can't go backwards in workflow
-        valid_transitions = {
-            OrderStatus.PENDING: [OrderStatus.CONFIRMED, OrderStatus.CANCELLED],
-            OrderStatus.CONFIRMED: [OrderStatus.PREPARING, OrderStatus.CANCELLED],
-            OrderStatus.PREPARING: [OrderStatus.READY, OrderStatus.CANCELLED],
-            OrderStatus.READY: [OrderStatus.DELIVERED],
-            OrderStatus.DELIVERED: [],
-            OrderStatus.CANCELLED: [],
-        }
+        expected_version = data.get('version')
+        if expected_version in (None, ''):
+            expected_version = None
+        else:
+            try:
+                expected_version = int(expected_version)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'version must be an integer'}), 400
         
-        if new_status not in valid_transitions.get(old_status, []):
-            if new_status == old_status:
-                return jsonify({'success': False, 'message': 'Status unchanged'}), 400
-            else:
-                return jsonify({'success': False, 'message': f'Cannot transition from {old_status.value} to {new_status.value}'}), 400
+        # Check and apply the transition in one conditional UPDATE
+        result = order_state.transition(session, order_id, new_status, expected_version=expected_version)
+        if result.outcome == order_state.NOT_FOUND:
+            return jsonify({'success': False, 'message': result.message}), 404
+        if not result.ok:
+            return jsonify({
+                'success': False,
+                'message': result.message,
+                'status': result.current_status.value,
+                'version': result.version
+            }), 409 if result.stale else 400
         
-        # Update status
-        order.status = new_status
+        # Queue the notification in the same transaction
+        old_status = result.old_status
+        record_order_event(
+            session, ORDER_STATUS_CHANGED, order_id,
+            old_status=old_status.value, new_status=new_status.value
+        )
         session.commit()
-        
-        # Send notification
-        notify_status_change(order, old_status, new_status)
+        event_bus.publish(OrderStatusChanged(order_id, old_status.value, new_status.value))
         
         flash(f'Order #{order_id} status updated to {new_status.value}', 'success')
         
         # Return based on request type
         if request.is_json:
-            return jsonify({'success': True, 'message': 'Status updated'})
+            return jsonify({'success': True, 'message': result.message, 'version': result.version})
         else:
             return redirect(url_for('admin.order_detail', order_id=order_id))
     
@@ -200,6 +216,75 @@ def update_order_status(order_id):
         session.close()
 
 
+@bp.route('/orders/status', methods=['POST'])
+@login_required
+@admin_required
+def bulk_update_order_status():
+    """
+    Move many orders to one status in a single transaction.
+    
+    Eligible orders are changed by one conditional UPDATE; the rest are
+    reported with their current status. Notifications for every changed
+    order are queued as one outbox insert.
+    
+    JSON body:
+    {
+        'order_ids': [12, 13, 14],
+        'status': 'confirmed|preparing|ready|delivered|cancelled'
+    }
+    
+    Returns:
+        JSON with a result per order and the number updated
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        new_status = OrderStatus[str(data.get('status', '')).upper()]
+    except KeyError:
+        return jsonify({'success': False, 'message': 'Invalid status'}), 400
+    
+    order_ids = data.get('order_ids')
+    if not isinstance(order_ids, list) or not order_ids:
+        return jsonify({'success': False, 'message': 'order_ids must be a non-empty list'}), 400
+    if len(order_ids) > MAX_BULK_ORDERS:
+        return jsonify({'success': False, 'message': f'At most {MAX_BULK_ORDERS} orders per request'}), 400
+    try:
+        order_ids = [int(order_id) for order_id in order_ids]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'order_ids must be integers'}), 400
+    
+    session = SessionLocal()
+    try:
+        results = order_state.transition_many(session, order_ids, new_status)
+        changed = [result for result in results if result.ok]
+        record_order_events(session, ORDER_STATUS_CHANGED, [
+            (result.order_id, {'old_status': result.old_status.value, 'new_status': new_status.value})
+            for result in changed
+        ])
+        session.commit()
+        
+        for result in changed:
+            event_bus.publish(OrderStatusChanged(result.order_id, result.old_status.value, new_status.value))
+        
+        return jsonify({
+            'success': True,
+            'updated': len(changed),
+            'results': [{
+                'order_id': result.order_id,
+                'outcome': result.outcome,
+                'message': result.message,
+                'status': result.current_status.value if result.current_status else None,
+                'version': result.version
+            } for result in results]
+        })
+    
+    except Exception as e:
+        session.rollback()
+        return jsonify({'success': False, 'message': f'Error updating orders: {str(e)}'}), 500
+    
+    finally:
+        session.close()
+
+
 @bp.route('/stats', methods=['GET'])
 @login_required
 @admin_required
@@ -227,3 +312,209 @@ def stats():
     
     finally:
         session.close()
+
+
+@bp.route('/firestore', methods=['GET'])
+@login_required
+@admin_required
+def firestore_status():
+    """
+    Get Firestore circuit breaker state and call metrics as JSON.
+    
+    Returns:
+        JSON with breaker state, failure counters and deadline
+    """
+    return jsonify(firestore_db.status())
+
+
+@bp.route('/notifications', methods=['GET'])
+@login_required
+@admin_required
+def notification_status():
+    """
+    Get notification delivery backlog as JSON.
+    
+    Deliveries are sent by outbox_worker.py, so the backlog is read from
+    the outbox tables rather than this process's dispatchers.
+    
+    Returns:
+        JSON with events not yet handed off and, per sink, the pending
+        and dead-lettered deliveries
+    """
+    session = SessionLocal()
+    try:
+        sinks = {name: {'pending': 0, 'dead': 0} for name in notification_hub.sink_names()}
+        sinks.update(delivery_counts(session))
+        return jsonify({'pending_events': pending_count(session), 'sinks': sinks})
+    finally:
+        session.close()
+
+
+@bp.route('/events', methods=['GET'])
+@login_required
+@admin_required
+def event_status():
+    """
+    Get domain event bus metrics as JSON.
+    
+    Returns:
+        JSON with publish counts, async queue depth, subscriber timings and
+        this worker's order lifecycle counters
+    """
+    return jsonify({**event_bus.stats(), 'lifecycle': lifecycle.snapshot()})
+
+
+@bp.route('/price-index', methods=['GET'])
+@login_required
+@admin_required
+def price_index_status():
+    """
+    Get menu price index metrics as JSON.
+    
+    Returns:
+        JSON with cached restaurants and items, hits, loads and failures
+    """
+    return jsonify(price_index.stats())
+
+
+@bp.route('/restaurants/<int:restaurant_id>/prices/refresh', methods=['POST'])
+@login_required
+@admin_required
+def refresh_prices(restaurant_id):
+    """
+    Announce that a restaurant's menu changed.
+    
+    Publishes MenuChanged so the price index reloads the menu on next use.
+    
+    Args:
+        restaurant_id: ID of the restaurant whose menu changed
+    
+    Returns:
+        JSON confirmation
+    """
+    event_bus.publish(MenuChanged(restaurant_id))
+    return jsonify({'success': True, 'restaurant_id': restaurant_id})
+
+
+@bp.route('/restaurants/<int:restaurant_id>/stage-durations', methods=['GET'])
+@login_required
+@admin_required
+def stage_durations(restaurant_id):
+    """
+    Get how long a restaurant's orders spend in each stage, as JSON.
+    
+    Query params:
+        hours: Window to report on in whole hours, ending with the current
+            hour (default 24, max 2160)
+        interval: Optional hours per entry of a time series over the window
+    
+    Args:
+        restaurant_id: ID of the restaurant
+    
+    Returns:
+        JSON with order count and p50/p90/p99 seconds per stage
+    """
+    hours = request.args.get('hours', 24, type=int)
+    interval = request.args.get('interval', type=int)
+    if not 0 < hours <= MAX_ANALYTICS_HOURS or (interval is not None and interval <= 0):
+        return jsonify({'success': False, 'message': 'Invalid window'}), 400
+    
+    session = SessionLocal()
+    try:
+        # Whole hours, ending with the current one
+        until = order_history.hour_of(datetime.utcnow()) + timedelta(hours=1)
+        durations = order_history.stage_durations(
+            session, restaurant_id, until - timedelta(hours=hours), until=until,
+            interval=timedelta(hours=interval) if interval else None
+        )
+        return jsonify({'success': True, 'restaurant_id': restaurant_id, 'hours': hours, **durations})
+    
+    finally:
+        session.close()
+
+
+@bp.route('/restaurants/<int:restaurant_id>/kitchen-queue', methods=['GET'])
+@login_required
+@admin_required
+def kitchen_queue_view(restaurant_id):
+    """
+    Get a restaurant's active orders (pending through ready) as JSON.
+    
+    Without a cursor this is every active order, oldest first. Pass back
+    the returned cursor to get only orders that changed since; an empty
+    poll costs one index lookup.
+    
+    Query params:
+        cursor: 'cursor' from the previous response
+    
+    Args:
+        restaurant_id: ID of the restaurant
+    
+    Returns:
+        JSON with cursor, reset flag, changed or all active orders and the
+        ids of orders that left the queue
+    """
+    cursor = request.args.get('cursor', type=int)
+    session = SessionLocal()
+    try:
+        if cursor is None or cursor < 0:
+            queue = kitchen_queue.snapshot(session, restaurant_id)
+        else:
+            queue = kitchen_queue.changes_since(session, restaurant_id, cursor)
+        return jsonify({'success': True, 'restaurant_id': restaurant_id, **queue})
+    
+    finally:
+        session.close()
+
+
+@bp.route('/cart-persistence', methods=['GET'])
+@login_required
+@admin_required
+def cart_persistence_status():
+    """
+    Get durable cart writer metrics as JSON.
+    
+    Returns:
+        JSON with saves, coalesced writes, failures and pending carts,
+        or enabled=false when per-user carts are off
+    """
+    persistence = current_app.extensions.get('cart_persistence')
+    if persistence is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **persistence.stats()})
+
+
+@bp.route('/password-hashing', methods=['GET'])
+@login_required
+@admin_required
+def password_hashing_status():
+    """
+    Get password hashing pool metrics as JSON.
+    
+    Returns:
+        JSON with the bcrypt cost policy, concurrency limits, rejections,
+        hash latency and queue wait
+    """
+    return jsonify({**password_pool.stats(), 'policy': hashing_policy.snapshot()})
+
+
+@bp.route('/orders/<int:order_id>/notifications', methods=['GET'])
+@login_required
+@admin_required
+def order_notifications(order_id):
+    """
+    Get an order's notification timeline as JSON.
+    
+    Entries are read from the notification log's order index, so only the
+    order's own entries are loaded.
+    
+    Args:
+        order_id: Order ID
+    
+    Returns:
+        JSON with the order id and its notification entries, oldest first
+    """
+    return jsonify({
+        'order_id': order_id,
+        'notifications': get_order_timeline(order_id)
+    })
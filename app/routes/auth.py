@@ -4,12 +4,30 @@ from flask_login import login_user, logout_user, login_required, current_user
 from database.postgres import SessionLocal
 from database.models import User
 from app.auth.forms import RegistrationForm, LoginForm
-from app.auth.utils import hash_password, verify_password
+from app.auth.utils import hash_password, verify_password, needs_rehash, PasswordWorkBusy
+from app.services.rate_limit import rate_limited
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 
+def busy_response(template, form, error):
+    """
+    Fast 503 for when password hashing is saturated.
+    
+    Args:
+        template: Form template to re-render
+        form: The submitted form
+        error: PasswordWorkBusy raised by the hashing pool
+    
+    Returns:
+        Response tuple with a Retry-After header
+    """
+    flash('We are handling a lot of sign-ins right now. Please try again in a moment.', 'error')
+    return render_template(template, form=form), 503, {'Retry-After': str(error.retry_after)}
+
+
 @bp.route('/register', methods=['GET', 'POST'])
+@rate_limited('register')
 def register():
     """
     User registration endpoint.
@@ -34,6 +52,9 @@ def register():
             
             flash('Registration successful! Please log in.', 'success')
             return redirect(url_for('auth.login'))
+        except PasswordWorkBusy as e:
+            session.rollback()
+            return busy_response('register.html', form, e)
         except Exception as e:
             session.rollback()
             flash('An error occurred during registration. Please try again.', 'error')
@@ -44,6 +65,7 @@ def register():
 
 
 @bp.route('/login', methods=['GET', 'POST'])
+@rate_limited('login')
 def login():
     """
     User login endpoint.
@@ -60,6 +82,16 @@ def login():
             user = session.query(User).filter_by(email=form.email.data).first()
             
             if user and verify_password(form.password.data, user.password_hash):
+                # Bring the hash up to the current cost while we have the password
+                if needs_rehash(user.password_hash):
+                    try:
+                        user.password_hash = hash_password(form.password.data)
+                        session.commit()
+                    except Exception as e:
+                        # Best effort - the login itself already succeeded
+                        session.rollback()
+                        print(f"Error rehashing password for user {user.id}: {e}")
+                
                 # Use Flask-Login to create session
                 login_user(user)
                 flash(f'Welcome back, {user.username}!', 'success')
@@ -71,6 +103,8 @@ def login():
                 return redirect(url_for('main.home'))
             else:
                 flash('Invalid email or password. Please try again.', 'error')
+        except PasswordWorkBusy as e:
+            return busy_response('login.html', form, e)
         finally:
             session.close()
     
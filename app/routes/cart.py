@@ -1,50 +1,159 @@
 """Shopping cart routes and operations"""
-from flask import Blueprint, render_template, request, jsonify, session as flask_session
+from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required
 from database.postgres import SessionLocal
-from database.models import Restaurant
-from database.firestore import firestore_db
+from app.services.rate_limit import rate_limited
+from app.services import cart_store
+from app.services.price_index import price_index, MenuUnavailable, UnknownRestaurant
+from app.services.cart_view import build_cart_view
 
 bp = Blueprint('cart', __name__, url_prefix='/cart')
 
+# Most operations accepted in one /cart/batch request
+MAX_BATCH_OPS = 50
+
 
 def get_cart():
     """
-    Get current cart from session.
+    Get current cart from the server-side cart store.
+    
+    Returns:
+        Cart: Cart indexed by restaurant and item id with running totals
+    """
+    return cart_store.load_cart()
+
+
+def cart_summary(cart):
+    """Counts and totals returned by the cart-changing endpoints"""
+    return {
+        'item_count': cart.item_count,
+        'cart_total': cart.total,
+        'revision': cart.revision
+    }
+
+
+def parse_restaurant_id(value):
+    """
+    Validate a client-supplied restaurant id.
+    
+    Returns:
+        str: The id in canonical form (cart keys are strings)
+    
+    Raises:
+        ValueError: If it isn't a positive integer
+    """
+    try:
+        restaurant_id = int(value)
+    except (TypeError, ValueError):
+        restaurant_id = 0
+    if isinstance(value, bool) or restaurant_id <= 0:
+        raise ValueError('Invalid restaurant_id')
+    return str(restaurant_id)
+
+
+def canonical_item(restaurant_id, item_id):
+    """
+    Name and price to store for an item, taken from the menu.
+    
+    Client-supplied names and prices are never used; checkout reprices
+    every line from the menu again before an order is placed.
     
     Returns:
-        dict: Cart data structure {restaurant_id: {items: [...], total: X}}
+        tuple: (name, price)
+    
+    Raises:
+        MenuUnavailable: If the menu can't be loaded right now
+        ValueError: If the restaurant doesn't exist or the item isn't on its menu
     """
-    if 'cart' not in flask_session:
-        flask_session['cart'] = {}
-    return flask_session['cart']
+    try:
+        found = price_index.lookup(restaurant_id, item_id)
+    except UnknownRestaurant:
+        raise ValueError('Unknown restaurant')
+    
+    if found is None:
+        raise ValueError('Item is not on the menu')
+    return found[0], found[1] / 100
 
 
-def calculate_item_total(item):
+def parse_batch_op(op):
     """
-    Calculate total for a cart item.
+    Validate one /cart/batch operation.
     
     Args:
-        item: Cart item with quantity and price
+        op: {'op': 'add'|'update'|'remove', 'restaurant_id', 'item_id', ...}
     
     Returns:
-        float: Item total (quantity * price)
+        tuple: Normalized (op, restaurant_id, item_id, quantity)
+    
+    Raises:
+        ValueError: If the operation is invalid
     """
-    return item['quantity'] * item['price']
+    kind = op.get('op')
+    item_id = op.get('item_id')
+    if not op.get('restaurant_id') or not item_id:
+        raise ValueError('restaurant_id and item_id are required')
+    restaurant_id = parse_restaurant_id(op.get('restaurant_id'))
+    
+    if kind == 'add':
+        quantity = int(op.get('quantity', 1))
+        if quantity <= 0:
+            raise ValueError('Invalid item data')
+        return kind, restaurant_id, item_id, quantity
+    
+    if kind == 'update':
+        quantity = int(op.get('quantity', 1))
+        if quantity < 0:
+            raise ValueError('Invalid quantity')
+        return kind, restaurant_id, item_id, quantity
+    
+    if kind == 'remove':
+        return kind, restaurant_id, item_id, 0
+    
+    raise ValueError(f'Unknown operation: {kind}')
+
+
+def menu_unavailable_response():
+    """503 for cart additions while the menu can't be priced"""
+    return jsonify({'success': False, 'message': 'The menu is unavailable right now, please try again'}), 503
 
 
-def calculate_cart_total(items):
+def cart_contents(cart):
+    """Whole cart as {restaurant_id: {'items': [...], 'total': X}} (no database lookups)"""
+    return {
+        restaurant_id: {
+            'items': cart.items(restaurant_id),
+            'total': cart.restaurant_total(restaurant_id)
+        }
+        for restaurant_id in cart.restaurant_ids()
+    }
+
+
+def cart_delta(cart, changes):
     """
-    Calculate total for all items in cart.
+    Lines changed since the client's revision.
     
     Args:
-        items: List of cart items
+        cart: Current Cart
+        changes: Output of Cart.changes_since()
     
     Returns:
-        float: Total price rounded to 2 decimals
+        dict: {'lines': [...], 'restaurant_totals': {restaurant_id: total}};
+            removed lines come back as {'restaurant_id', 'item_id', 'removed': True}
     """
-    total = sum(calculate_item_total(item) for item in items)
-    return round(total, 2)
+    lines = []
+    restaurant_ids = []
+    for restaurant_id, item_id in changes:
+        line = cart.item(restaurant_id, item_id)
+        if line is None:
+            line = {'item_id': item_id, 'removed': True}
+        lines.append({'restaurant_id': restaurant_id, **line})
+        if restaurant_id not in restaurant_ids:
+            restaurant_ids.append(restaurant_id)
+    
+    return {
+        'lines': lines,
+        'restaurant_totals': {rid: cart.restaurant_total(rid) for rid in restaurant_ids}
+    }
 
 
 @bp.route('', methods=['GET'])
@@ -59,34 +168,12 @@ def view_cart():
         Rendered HTML template with cart contents
     """
     cart = get_cart()
-    cart_data = []
-    grand_total = 0
     
     session = SessionLocal()
     try:
-        for restaurant_id_str, restaurant_cart in cart.items():
-            restaurant_id = int(restaurant_id_str)
-            restaurant = session.query(Restaurant).filter_by(id=restaurant_id).first()
-            
-            if restaurant:
-                items = restaurant_cart.get('items', [])
-                total = calculate_cart_total(items)
-                grand_total += total
-                
-                # Don't include the SQLAlchemy object, convert to dict
-                cart_data.append({
-                    'restaurant_id': restaurant.id,
-                    'restaurant_name': restaurant.name,
-                    'items': items,
-                    'total': total
-                })
+        view = build_cart_view(cart, session, cart_store.current_cart_id())
         
-        return render_template(
-            'cart.html',
-            cart_data=cart_data,
-            grand_total=round(grand_total, 2),
-            item_count=sum(len(rc.get('items', [])) for rc in cart.values())
-        )
+        return render_template('cart.html', **view)
     
     finally:
         session.close()
@@ -94,6 +181,7 @@ def view_cart():
 
 @bp.route('/add', methods=['POST'])
 @login_required
+@rate_limited('cart')
 def add_item():
     """
     Add item to shopping cart via AJAX.
@@ -102,65 +190,48 @@ def add_item():
     {
         'restaurant_id': int,
         'item_id': str,
-        'name': str,
-        'price': float,
         'quantity': int (default 1)
     }
     
+    The name and price come from the menu; any sent by the client are ignored.
+    
     Returns:
-        JSON response with success status and updated cart
+        JSON response with success status and updated cart (503 while the
+        menu can't be loaded)
     """
     try:
         data = request.get_json()
-        restaurant_id = str(data.get('restaurant_id'))
+        restaurant_id = parse_restaurant_id(data.get('restaurant_id'))
         item_id = data.get('item_id')
-        name = data.get('name')
-        price = float(data.get('price', 0))
         quantity = int(data.get('quantity', 1))
         
         # Validate inputs
-        if not all([restaurant_id, item_id, name, price > 0, quantity > 0]):
+        if not item_id or quantity <= 0:
             return jsonify({'success': False, 'message': 'Invalid item data'}), 400
         
+        name, price = canonical_item(restaurant_id, item_id)
         cart = get_cart()
         
-        # Initialize restaurant cart if not exists
-        if restaurant_id not in cart:
-            cart[restaurant_id] = {'items': []}
-        
-        # Check if item already in cart
-        items = cart[restaurant_id]['items']
-        existing_item = next((i for i in items if i['item_id'] == item_id), None)
-        
-        if existing_item:
-            # Update quantity
-            existing_item['quantity'] += quantity
-        else:
-            # Add new item
-            items.append({
-                'item_id': item_id,
-                'name': name,
-                'price': price,
-                'quantity': quantity
-            })
-        
-        # Calculate total
-        cart[restaurant_id]['total'] = calculate_cart_total(items)
-        flask_session.modified = True
+        # Adds a line, or increases the quantity of an existing one
+        cart.add(restaurant_id, item_id, name, price, quantity)
+        cart_store.mark_cart_modified()
         
         return jsonify({
             'success': True,
             'message': f'{name} added to cart',
-            'item_count': sum(len(rc.get('items', [])) for rc in cart.values()),
-            'cart_total': sum(rc.get('total', 0) for rc in cart.values())
+            **cart_summary(cart)
         })
     
+    except MenuUnavailable:
+        return menu_unavailable_response()
+    
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 400
 
 
 @bp.route('/remove', methods=['POST'])
 @login_required
+@rate_limited('cart')
 def remove_item():
     """
     Remove item from shopping cart.
@@ -181,25 +252,14 @@ def remove_item():
         
         cart = get_cart()
         
-        if restaurant_id in cart:
-            items = cart[restaurant_id]['items']
-            # Remove item
-            items[:] = [i for i in items if i['item_id'] != item_id]
-            
-            # Recalculate total
-            if items:
-                cart[restaurant_id]['total'] = calculate_cart_total(items)
-            else:
-                # Remove restaurant from cart if no items
-                del cart[restaurant_id]
-            
-            flask_session.modified = True
+        # Removes the restaurant too once it has no items left
+        if cart.remove(restaurant_id, item_id):
+            cart_store.mark_cart_modified()
         
         return jsonify({
             'success': True,
             'message': 'Item removed from cart',
-            'item_count': sum(len(rc.get('items', [])) for rc in cart.values()),
-            'cart_total': sum(rc.get('total', 0) for rc in cart.values())
+            **cart_summary(cart)
         })
     
     except Exception as e:
@@ -208,6 +268,7 @@ def remove_item():
 
 @bp.route('/update', methods=['POST'])
 @login_required
+@rate_limited('cart')
 def update_item():
     """
     Update item quantity in shopping cart.
@@ -234,39 +295,93 @@ def update_item():
         
         cart = get_cart()
         
-        if restaurant_id in cart:
-            items = cart[restaurant_id]['items']
-            
-            if quantity == 0:
-                # Remove item if quantity is 0
-                items[:] = [i for i in items if i['item_id'] != item_id]
-            else:
-                # Update quantity
-                for item in items:
-                    if item['item_id'] == item_id:
-                        item['quantity'] = quantity
-                        break
-            
-            # Recalculate total
-            if items:
-                cart[restaurant_id]['total'] = calculate_cart_total(items)
-            else:
-                # Remove restaurant from cart if no items
-                del cart[restaurant_id]
-            
-            flask_session.modified = True
+        # A quantity of 0 removes the item
+        if cart.set_quantity(restaurant_id, item_id, quantity):
+            cart_store.mark_cart_modified()
         
         return jsonify({
             'success': True,
             'message': 'Cart updated',
-            'item_count': sum(len(rc.get('items', [])) for rc in cart.values()),
-            'cart_total': sum(rc.get('total', 0) for rc in cart.values())
+            **cart_summary(cart)
         })
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 400
 
 
+@bp.route('/batch', methods=['POST'])
+@login_required
+@rate_limited('cart')
+def batch():
+    """
+    Apply several cart operations at once and return the resulting cart.
+    
+    All operations are validated before any is applied, so either all of
+    them take effect or none do.
+    
+    JSON body:
+    {
+        'ops': [
+            {'op': 'add', 'restaurant_id': int, 'item_id': str, 'quantity': int},
+            {'op': 'update', 'restaurant_id': int, 'item_id': str, 'quantity': int},
+            {'op': 'remove', 'restaurant_id': int, 'item_id': str}
+        ],
+        'since': int (optional cart revision the client already has)
+    }
+    
+    Added items are named and priced from the menu.
+    
+    Returns:
+        JSON with counts, totals and the new revision, plus either 'delta'
+        (lines changed since `since`) or 'cart' (the whole cart); 503 if
+        an add can't be priced because the menu can't be loaded
+    """
+    data = request.get_json(silent=True) or {}
+    raw_ops = data.get('ops') or []
+    
+    if not isinstance(raw_ops, list) or len(raw_ops) > MAX_BATCH_OPS:
+        return jsonify({'success': False, 'message': f'ops must be a list of at most {MAX_BATCH_OPS}'}), 400
+    
+    try:
+        ops = []
+        for raw_op in raw_ops:
+            kind, restaurant_id, item_id, quantity = parse_batch_op(raw_op)
+            name = price = None
+            if kind == 'add':
+                name, price = canonical_item(restaurant_id, item_id)
+            ops.append((kind, restaurant_id, item_id, name, price, quantity))
+    except MenuUnavailable:
+        return menu_unavailable_response()
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    cart = get_cart()
+    
+    changed = False
+    for kind, restaurant_id, item_id, name, price, quantity in ops:
+        if kind == 'add':
+            cart.add(restaurant_id, item_id, name, price, quantity)
+            changed = True
+        elif kind == 'update':
+            changed = cart.set_quantity(restaurant_id, item_id, quantity) or changed
+        else:
+            changed = cart.remove(restaurant_id, item_id) or changed
+    
+    if changed:
+        cart_store.mark_cart_modified()
+    
+    response = {'success': True, **cart_summary(cart)}
+    
+    since = data.get('since')
+    changes = cart.changes_since(since) if isinstance(since, int) else None
+    if changes is None:
+        response['cart'] = cart_contents(cart)
+    else:
+        response['delta'] = cart_delta(cart, changes)
+    
+    return jsonify(response)
+
+
 @bp.route('/clear', methods=['POST'])
 @login_required
 def clear_cart():
@@ -276,8 +391,7 @@ def clear_cart():
     Returns:
         JSON response with success status
     """
-    flask_session['cart'] = {}
-    flask_session.modified = True
+    cart_store.clear_cart()
     
     return jsonify({
         'success': True,
@@ -297,31 +411,9 @@ def get_cart_data():
     cart = get_cart()
     session = SessionLocal()
     try:
-        cart_data = []
-        grand_total = 0
+        view = build_cart_view(cart, session, cart_store.current_cart_id())
         
-        for restaurant_id_str, restaurant_cart in cart.items():
-            restaurant_id = int(restaurant_id_str)
-            restaurant = session.query(Restaurant).filter_by(id=restaurant_id).first()
-            
-            if restaurant:
-                items = restaurant_cart.get('items', [])
-                total = calculate_cart_total(items)
-                grand_total += total
-                
-                cart_data.append({
-                    'restaurant_id': restaurant.id,
-                    'restaurant_name': restaurant.name,
-                    'items': items,
-                    'total': total
-                })
-        
-        return jsonify({
-            'success': True,
-            'cart_data': cart_data,
-            'grand_total': round(grand_total, 2),
-            'item_count': sum(len(rc.get('items', [])) for rc in cart.values())
-        })
+        return jsonify({'success': True, **view})
     
     finally:
         session.close()
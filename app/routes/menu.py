@@ -1,9 +1,10 @@
 """Menu and menu items routes"""
-from flask import Blueprint, render_template, jsonify, session as flask_session
+from flask import Blueprint, render_template, jsonify
 from flask_login import login_required
 from database.postgres import SessionLocal
 from database.models import Restaurant
 from database.firestore import firestore_db
+from app.services.cart_store import load_cart
 
 bp = Blueprint('menu', __name__, url_prefix='/menu')
 
@@ -31,10 +32,8 @@ def restaurant_menu(restaurant_id):
         if not restaurant:
             return render_template('errors/404.html'), 404
         
-        # Get menu items from Firestore using Firestore document ID
-        # Convert restaurant ID to Firestore format
-        firestore_restaurant_id = restaurant.name.lower().replace(' ', '_')
-        menu_items = firestore_db.get_menu_items(firestore_restaurant_id)
+        # Get menu items from Firestore using the restaurant's stable slug
+        menu_items = firestore_db.get_menu_items(restaurant.slug)
         
         # Group items by category
         items_by_category = {}
@@ -45,15 +44,11 @@ def restaurant_menu(restaurant_id):
             items_by_category[category].append(item)
         
         # Get current cart data
-        cart = flask_session.get('cart', {})
-        cart_items = []
-        cart_total = 0
+        cart = load_cart()
         
-        # If items from this restaurant exist in cart, build the display
-        restaurant_id_str = str(restaurant_id)
-        if restaurant_id_str in cart:
-            cart_items = cart[restaurant_id_str].get('items', [])
-            cart_total = cart[restaurant_id_str].get('total', 0)
+        # Items from this restaurant already in the cart (empty if none)
+        cart_items = cart.items(restaurant_id)
+        cart_total = cart.restaurant_total(restaurant_id)
         
         return render_template(
             'menu/items.html',
@@ -61,7 +56,8 @@ def restaurant_menu(restaurant_id):
             items_by_category=items_by_category,
             all_items=menu_items,
             cart_items=cart_items,
-            cart_total=cart_total
+            cart_total=cart_total,
+            cart_revision=cart.revision
         )
     
     finally:
@@ -89,8 +85,7 @@ def restaurant_menu_api(restaurant_id):
             return jsonify({'error': 'Restaurant not found'}), 404
         
         # Get menu items from Firestore
-        firestore_restaurant_id = restaurant.name.lower().replace(' ', '_')
-        menu_items = firestore_db.get_menu_items(firestore_restaurant_id)
+        menu_items = firestore_db.get_menu_items(restaurant.slug)
         
         return jsonify({
             'success': True,
@@ -1,13 +1,29 @@
 """Order creation, management, and tracking routes"""
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session as flask_session
+import secrets
+from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
 from database.postgres import SessionLocal
 from database.models import Order, OrderItem, Restaurant, Payment, OrderStatus, PaymentStatus
 from app.orders.forms import OrderForm
+from app.services.outbox import record_order_event, ORDER_CREATED, ORDER_CANCELLED
+from app.services.events import bus, OrderCreated, OrderCancelled
+from app.services.cart_store import load_cart, clear_cart, mark_cart_modified, current_cart_id
+from app.services import idempotency
+from app.services.order_detail import load_order_detail
+from app.services import order_state, order_history
+from app.services.price_index import reprice_cart, MenuUnavailable
 
 bp = Blueprint('orders', __name__, url_prefix='/orders')
 
 
+def already_placed(order_id):
+    """Answer a repeated submit with the order it already created"""
+    flash(f'Order #{order_id} has already been placed.', 'info')
+    return redirect(url_for('orders.detail', order_id=order_id))
+
+
 @bp.route('', methods=['GET'])
 @login_required
 def list_orders():
@@ -52,30 +68,17 @@ def detail(order_id):
     """
     session = SessionLocal()
     try:
-        # Get order and verify ownership
-        order = session.query(Order).filter_by(
-            id=order_id,
-            user_id=current_user.id
-        ).first()
+        # Get order (with restaurant, payment and items) and verify ownership
+        order = load_order_detail(session, order_id, user_id=current_user.id)
         
         if not order:
             return render_template('errors/404.html'), 404
         
-        # Get restaurant info
-        restaurant = session.query(Restaurant).filter_by(
-            id=order.restaurant_id
-        ).first()
-        
-        # Get payment info
-        payment = session.query(Payment).filter_by(
-            order_id=order_id
-        ).first()
-        
         return render_template(
             'orders/detail.html',
             order=order,
-            restaurant=restaurant,
-            payment=payment
+            restaurant=order.restaurant,
+            payment=order.payment
         )
     
     finally:
@@ -91,10 +94,29 @@ def create():
     GET: Display order creation form with cart review
     POST: Process order creation with validation
     
+    Submits carry an idempotency key (Idempotency-Key header or the form's
+    hidden field), so a double-click or a retried POST returns the original
+    order instead of creating another. Keyless submits fall back to a
+    fingerprint of the cart, which only catches concurrent double-submits
+    (see idempotency.cart_fingerprint).
+    
     Returns:
         Rendered form template or redirect to order confirmation
     """
-    cart = flask_session.get('cart', {})
+    # A retry after success finds an empty cart, so check the key first
+    key = None
+    if request.method == 'POST':
+        key = idempotency.request_key(request.form.get('idempotency_key'))
+        if key:
+            session = SessionLocal()
+            try:
+                order_id = idempotency.find_order_id(session, current_user.id, key)
+            finally:
+                session.close()
+            if order_id:
+                return already_placed(order_id)
+    
+    cart = load_cart()
     
     # Validate cart not empty
     if not cart:
@@ -106,10 +128,8 @@ def create():
         flash('You can only order from one restaurant at a time.', 'error')
         return redirect(url_for('cart.view_cart'))
     
-    restaurant_id_str = list(cart.keys())[0]
+    restaurant_id_str = cart.restaurant_ids()[0]
     restaurant_id = int(restaurant_id_str)
-    cart_items = cart[restaurant_id_str]['items']
-    cart_total = cart[restaurant_id_str]['total']
     
     session = SessionLocal()
     try:
@@ -122,9 +142,32 @@ def create():
             flash('Selected restaurant no longer exists.', 'error')
             return redirect(url_for('restaurants.list_restaurants'))
         
+        # Reprice from the menu - the order never uses client-supplied prices
+        try:
+            repriced, removed = reprice_cart(cart, restaurant_id)
+        except MenuUnavailable:
+            flash('Menu prices could not be verified right now. Please try again shortly.', 'error')
+            return redirect(url_for('cart.view_cart'))
+        
+        if repriced or removed:
+            mark_cart_modified()
+            if removed:
+                flash(f'No longer on the menu and removed from your cart: {", ".join(removed)}', 'warning')
+            if repriced:
+                flash(f'Prices have changed for: {", ".join(repriced)}. Please review your order.', 'warning')
+            # Don't place an order the customer hasn't seen the new total for
+            if request.method == 'POST' or not cart:
+                return redirect(url_for('orders.create'))
+        
+        cart_items = cart.items(restaurant_id_str)
+        cart_total = cart.restaurant_total(restaurant_id_str)
+        
         form = OrderForm()
+        if not form.idempotency_key.data:
+            form.idempotency_key.data = secrets.token_urlsafe(16)
         
         if form.validate_on_submit():
+            key = key or idempotency.cart_fingerprint(cart, current_cart_id())
             try:
                 # Create order
                 order = Order(
@@ -138,6 +181,9 @@ def create():
                 session.add(order)
                 session.flush()  # Get order ID without committing
                 
+                # Fails here if a concurrent submit with the same key got in first
+                idempotency.claim(session, current_user.id, key, order.id)
+                
                 # Create order items
                 for item in cart_items:
                     order_item = OrderItem(
@@ -157,16 +203,27 @@ def create():
                 )
                 session.add(payment)
                 
+                # Queue confirmation notification in the same transaction
+                record_order_event(session, ORDER_CREATED, order)
+                order_history.record_created(session, order)
+                
                 # Commit transaction
                 session.commit()
+                bus.publish(OrderCreated(order.id, current_user.id, restaurant_id, cart_total))
                 
                 # Clear cart
-                flask_session['cart'] = {}
-                flask_session.modified = True
+                clear_cart()
                 
                 flash(f'Order #{order.id} created successfully!', 'success')
                 return redirect(url_for('orders.detail', order_id=order.id))
             
+            except IntegrityError:
+                session.rollback()
+                order_id = idempotency.find_order_id(session, current_user.id, key)
+                if order_id:
+                    return already_placed(order_id)
+                flash('Error creating order. Please try again.', 'error')
+            
             except Exception as e:
                 session.rollback()
                 flash(f'Error creating order: {str(e)}', 'error')
@@ -200,30 +257,34 @@ def cancel(order_id):
     """
     session = SessionLocal()
     try:
-        # Get order and verify ownership
-        order = session.query(Order).filter_by(
-            id=order_id,
-            user_id=current_user.id
-        ).first()
+        # Customers can only cancel their own pending orders; checked and
+        # applied in one UPDATE so a concurrent admin change can't slip between
+        result = order_state.transition(
+            session, order_id, OrderStatus.CANCELLED,
+            allowed_from=[OrderStatus.PENDING], user_id=current_user.id
+        )
         
-        if not order:
+        if result.outcome == order_state.NOT_FOUND:
             flash('Order not found.', 'error')
             return redirect(url_for('orders.list_orders'))
         
-        # Can only cancel pending orders
-        if order.status != OrderStatus.PENDING:
-            flash(f'Cannot cancel {order.status.value} orders.', 'error')
+        if not result.ok:
+            flash(f'Cannot cancel {result.current_status.value} orders.', 'error')
             return redirect(url_for('orders.detail', order_id=order_id))
         
-        # Update order status
-        order.status = OrderStatus.CANCELLED
+        old_status = result.old_status
         
         # Update payment status
-        payment = session.query(Payment).filter_by(order_id=order_id).first()
-        if payment:
-            payment.status = PaymentStatus.REFUNDED
+        session.execute(
+            update(Payment).where(Payment.order_id == order_id).values(status=PaymentStatus.REFUNDED)
+        )
         
+        record_order_event(
+            session, ORDER_CANCELLED, order_id,
+            old_status=old_status.value, new_status=OrderStatus.CANCELLED.value
+        )
         session.commit()
+        bus.publish(OrderCancelled(order_id, old_status.value))
         flash(f'Order #{order_id} has been cancelled.', 'success')
         
     except Exception as e:
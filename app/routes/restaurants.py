@@ -4,6 +4,7 @@ from flask_login import login_required
 from sqlalchemy import func
 from database.postgres import SessionLocal
 from database.models import Restaurant, Order
+from database.firestore import firestore_db
 
 bp = Blueprint('restaurants', __name__, url_prefix='/restaurants')
 
@@ -38,6 +39,9 @@ def list_restaurants():
         # Get all restaurants
         restaurants = query.all()
         
+        # Ratings for every listed restaurant in one batched Firestore lookup
+        ratings = firestore_db.get_rating_summaries([r.slug for r in restaurants])
+        
         # Get unique cities for filter dropdown
         all_cities = session.query(
             Restaurant.city
@@ -47,6 +51,7 @@ def list_restaurants():
         return render_template(
             'restaurants/list.html',
             restaurants=restaurants,
+            ratings=ratings,
             cities=cities,
             selected_city=city,
             selected_search=search
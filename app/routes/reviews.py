@@ -5,6 +5,7 @@ from database.postgres import SessionLocal
 from database.models import Restaurant
 from database.firestore import firestore_db
 from app.reviews.forms import ReviewForm
+from app.services.events import bus, ReviewSubmitted
 
 bp = Blueprint('reviews', __name__, url_prefix='/reviews')
 
@@ -33,7 +34,7 @@ def submit_review(restaurant_id):
             try:
                 # Prepare review data
                 review_data = {
-                    'restaurant_id': restaurant.name.lower().replace(' ', '_'),
+                    'restaurant_id': restaurant.slug,
                     'user_id': current_user.id,
                     'username': current_user.username,
                     'rating': form.rating.data,
@@ -43,12 +44,13 @@ def submit_review(restaurant_id):
                 
                 # Store review in Firestore
                 success = firestore_db.add_review(
-                    restaurant.name.lower().replace(' ', '_'),
+                    restaurant.slug,
                     current_user.id,
                     review_data
                 )
                 
                 if success:
+                    bus.publish(ReviewSubmitted(restaurant_id, current_user.id, form.rating.data))
                     flash('Your review has been submitted!', 'success')
                     return redirect(url_for('restaurants.detail', restaurant_id=restaurant_id))
                 else:
@@ -83,8 +85,7 @@ def list_reviews(restaurant_id):
             return jsonify({'error': 'Restaurant not found'}), 404
         
         # Get reviews from Firestore
-        firestore_restaurant_id = restaurant.name.lower().replace(' ', '_')
-        reviews = firestore_db.get_reviews(firestore_restaurant_id)
+        reviews = firestore_db.get_reviews(restaurant.slug)
         
         # Return as JSON
         return jsonify({
@@ -0,0 +1,277 @@
+"""Shopping cart model - lines indexed by item id with running totals"""
+
+# Version of the stored cart layout (see Cart.to_dict). Carts without a
+# version are the original {restaurant_id: {'items': [...], 'total': X}} dicts.
+SCHEMA_VERSION = 2
+
+# How many recent line changes are kept for changes_since()
+CHANGE_LOG_SIZE = 50
+
+
+def to_cents(amount):
+    """Convert a price in currency units to integer cents"""
+    return int(round(float(amount) * 100))
+
+
+class Cart:
+    """
+    A user's cart, grouped by restaurant.
+
+    Lines are keyed by item_id, so finding or changing one is a dict lookup.
+    Restaurant subtotals, the grand total (in integer cents, so repeated
+    updates don't accumulate float error) and the line count are adjusted
+    as each line changes rather than recomputed over the whole cart.
+
+    Every change bumps `revision` and is noted in a short change log, so a
+    client holding an older revision can be sent just the lines that changed.
+    """
+
+    def __init__(self):
+        # restaurant_id (str) -> {'lines': {item_id: line}, 'total_cents': int}
+        self._restaurants = {}
+        self.total_cents = 0
+        self.item_count = 0  # distinct lines, as shown in the cart badge
+        self.revision = 0
+        self._changes = []  # [revision, restaurant_id, item_id], oldest first
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a cart from its stored form, migrating older layouts.
+
+        Args:
+            data: Output of to_dict(), a legacy cart dict, or None
+
+        Returns:
+            Cart
+        """
+        cart = cls()
+        if not data:
+            return cart
+
+        if data.get('version') == SCHEMA_VERSION:
+            for restaurant_id, lines in data['restaurants'].items():
+                for item_id, (name, price_cents, quantity) in lines.items():
+                    cart._add_cents(restaurant_id, item_id, name, price_cents, quantity)
+            cart.revision = data.get('revision', 0)
+            cart._changes = data.get('changes', [])
+        else:
+            for restaurant_id, restaurant_cart in data.items():
+                for item in restaurant_cart.get('items', []):
+                    cart.add(restaurant_id, item['item_id'], item['name'], item['price'], item['quantity'])
+        return cart
+
+    def to_dict(self):
+        """
+        Compact, JSON-serializable form of the cart.
+
+        Returns:
+            dict: {'version': 2, 'revision': n, 'changes': [...],
+                'restaurants': {restaurant_id: {item_id: [name, price_cents, quantity]}}}
+        """
+        return {
+            'version': SCHEMA_VERSION,
+            'revision': self.revision,
+            'changes': self._changes,
+            'restaurants': {
+                restaurant_id: {
+                    item_id: [line['name'], line['price_cents'], line['quantity']]
+                    for item_id, line in restaurant['lines'].items()
+                }
+                for restaurant_id, restaurant in self._restaurants.items()
+            }
+        }
+
+    def __bool__(self):
+        return self.item_count > 0
+
+    def __len__(self):
+        """Number of restaurants with items in the cart"""
+        return len(self._restaurants)
+
+    def __contains__(self, restaurant_id):
+        return str(restaurant_id) in self._restaurants
+
+    def restaurant_ids(self):
+        """Restaurant ids (as strings) in the order they were added"""
+        return list(self._restaurants)
+
+    def get_line(self, restaurant_id, item_id):
+        """Return the line for an item, or None"""
+        restaurant = self._restaurants.get(str(restaurant_id))
+        return restaurant['lines'].get(item_id) if restaurant else None
+
+    def add(self, restaurant_id, item_id, name, price, quantity=1):
+        """
+        Add an item, or increase its quantity if it's already in the cart.
+
+        Args:
+            restaurant_id: Restaurant the item belongs to
+            item_id: Menu item id
+            name: Display name
+            price: Unit price in currency units
+            quantity: Quantity to add
+
+        Returns:
+            dict: The cart line
+        """
+        restaurant_id = str(restaurant_id)
+        self._record(restaurant_id, item_id)
+        return self._add_cents(restaurant_id, item_id, name, to_cents(price), quantity)
+
+    def _add_cents(self, restaurant_id, item_id, name, price_cents, quantity):
+        restaurant = self._restaurants.get(restaurant_id)
+        if restaurant is None:
+            restaurant = self._restaurants[restaurant_id] = {'lines': {}, 'total_cents': 0}
+
+        line = restaurant['lines'].get(item_id)
+        if line is None:
+            line = restaurant['lines'][item_id] = {
+                'item_id': item_id,
+                'name': name,
+                'price_cents': price_cents,
+                'quantity': 0
+            }
+            self.item_count += 1
+
+        line['quantity'] += quantity
+        self._adjust(restaurant, line['price_cents'] * quantity)
+        return line
+
+    def set_quantity(self, restaurant_id, item_id, quantity):
+        """
+        Set an item's quantity; zero removes it.
+
+        Returns:
+            bool: False if the item isn't in the cart
+        """
+        if quantity <= 0:
+            return self.remove(restaurant_id, item_id)
+
+        line = self.get_line(restaurant_id, item_id)
+        if line is None:
+            return False
+
+        restaurant_id = str(restaurant_id)
+        self._adjust(self._restaurants[restaurant_id], line['price_cents'] * (quantity - line['quantity']))
+        line['quantity'] = quantity
+        self._record(restaurant_id, item_id)
+        return True
+
+    def set_price(self, restaurant_id, item_id, name, price_cents):
+        """
+        Update an item's name and unit price (e.g. from the menu).
+
+        Returns:
+            bool: True if anything changed
+        """
+        line = self.get_line(restaurant_id, item_id)
+        if line is None or (line['name'], line['price_cents']) == (name, price_cents):
+            return False
+
+        restaurant_id = str(restaurant_id)
+        self._adjust(self._restaurants[restaurant_id], (price_cents - line['price_cents']) * line['quantity'])
+        line['name'] = name
+        line['price_cents'] = price_cents
+        self._record(restaurant_id, item_id)
+        return True
+
+    def remove(self, restaurant_id, item_id):
+        """
+        Remove an item, and its restaurant once that has no items left.
+
+        Returns:
+            bool: False if the item isn't in the cart
+        """
+        restaurant_id = str(restaurant_id)
+        restaurant = self._restaurants.get(restaurant_id)
+        if restaurant is None or item_id not in restaurant['lines']:
+            return False
+
+        line = restaurant['lines'].pop(item_id)
+        self._adjust(restaurant, -line['price_cents'] * line['quantity'])
+        self.item_count -= 1
+        if not restaurant['lines']:
+            del self._restaurants[restaurant_id]
+        self._record(restaurant_id, item_id)
+        return True
+
+    def clear(self):
+        """Remove everything"""
+        self._restaurants.clear()
+        self.total_cents = 0
+        self.item_count = 0
+        # Nothing before a clear can be expressed as line changes
+        self.revision += 1
+        self._changes = []
+
+    def _record(self, restaurant_id, item_id):
+        self.revision += 1
+        self._changes.append([self.revision, restaurant_id, item_id])
+        if len(self._changes) > CHANGE_LOG_SIZE:
+            del self._changes[0]
+
+    def changes_since(self, revision):
+        """
+        Lines changed after a given revision.
+
+        Args:
+            revision: Revision the client last saw
+
+        Returns:
+            list or None: [(restaurant_id, item_id), ...] in change order, or
+                None if the log no longer reaches back that far
+        """
+        log_start = self._changes[0][0] - 1 if self._changes else self.revision
+        if revision > self.revision or revision < log_start:
+            return None
+
+        changed = {}
+        for change_revision, restaurant_id, item_id in self._changes:
+            if change_revision > revision:
+                changed[(restaurant_id, item_id)] = None
+        return list(changed)
+
+    def _adjust(self, restaurant, delta_cents):
+        restaurant['total_cents'] += delta_cents
+        self.total_cents += delta_cents
+
+    def items(self, restaurant_id):
+        """
+        Lines for one restaurant in the format templates and JSON responses use.
+
+        Returns:
+            list: [{'item_id', 'name', 'price', 'quantity'}, ...]
+        """
+        restaurant = self._restaurants.get(str(restaurant_id))
+        if restaurant is None:
+            return []
+        return [self._line_view(line) for line in restaurant['lines'].values()]
+
+    def item(self, restaurant_id, item_id):
+        """One line in the items() format, or None"""
+        line = self.get_line(restaurant_id, item_id)
+        return self._line_view(line) if line else None
+
+    @staticmethod
+    def _line_view(line):
+        return {
+            'item_id': line['item_id'],
+            'name': line['name'],
+            'price': line['price_cents'] / 100,
+            'quantity': line['quantity']
+        }
+
+    def restaurant_total_cents(self, restaurant_id):
+        """Subtotal for one restaurant in cents"""
+        restaurant = self._restaurants.get(str(restaurant_id))
+        return restaurant['total_cents'] if restaurant else 0
+
+    def restaurant_total(self, restaurant_id):
+        """Subtotal for one restaurant in currency units"""
+        return self.restaurant_total_cents(restaurant_id) / 100
+
+    @property
+    def total(self):
+        """Grand total in currency units"""
+        return self.total_cents / 100
@@ -0,0 +1,175 @@
+"""Durable per-user carts in the database, written in coalesced batches"""
+import atexit
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import select
+from database.postgres import SessionLocal
+from database.models import UserCart
+
+DEFAULT_WINDOW = 2.0
+
+
+def _upsert_statement(session):
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f'Cart persistence does not support {dialect}')
+
+    statement = insert(UserCart)
+    return statement.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={'data': statement.excluded.data, 'updated_at': statement.excluded.updated_at}
+    )
+
+
+class CartPersistence:
+    """
+    Keep each user's latest cart blob in the `carts` table.
+
+    save() only records the blob in memory; a background thread writes
+    everything saved during the last `window` seconds in one upsert, so a
+    burst of cart clicks costs one database write. load() sees pending
+    blobs first. If a write fails the blobs stay pending and are retried
+    on the next window; database errors never reach the request.
+    """
+
+    def __init__(self, session_factory=SessionLocal, window=DEFAULT_WINDOW, max_pending=10000):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_pending = max_pending
+        self._pending = {}  # user_id -> blob
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        # Metrics
+        self.saves = 0
+        self.writes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def load(self, user_id):
+        """
+        Get a user's saved cart blob.
+
+        Returns:
+            bytes or None: The blob, or None if there is none or the read failed
+        """
+        with self._lock:
+            if user_id in self._pending:
+                return self._pending[user_id]
+
+        session = self.session_factory()
+        try:
+            return session.execute(select(UserCart.data).where(UserCart.user_id == user_id)).scalar()
+        except Exception as e:
+            print(f"Error loading saved cart for user {user_id}: {e}")
+            return None
+        finally:
+            session.close()
+
+    def save(self, user_id, blob):
+        """Queue a user's cart blob for the next coalesced write"""
+        self._ensure_started()
+        with self._lock:
+            if user_id not in self._pending and len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending[user_id] = blob
+            self.saves += 1
+
+    def _ensure_started(self):
+        """Start the writer thread (again after a fork, e.g. gunicorn workers)"""
+        if self._thread and self._pid == os.getpid():
+            return
+        with self._lock:
+            if not self._thread or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pending = {}
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='cart-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.window)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Write all pending carts now.
+
+        Returns:
+            int: Number of carts written
+        """
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        now = datetime.utcnow()
+        rows = [{'user_id': user_id, 'data': blob, 'updated_at': now} for user_id, blob in batch.items()]
+        session = self.session_factory()
+        try:
+            session.execute(_upsert_statement(session), rows)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Error saving {len(rows)} carts: {e}")
+            with self._lock:
+                self.failures += 1
+                # Keep anything newer that was saved while we were writing
+                for user_id, blob in batch.items():
+                    self._pending.setdefault(user_id, blob)
+            return 0
+        finally:
+            session.close()
+
+        with self._lock:
+            self.writes += 1
+            self.rows_written += len(rows)
+        return len(rows)
+
+    def shutdown(self, timeout=5.0):
+        """Stop the writer thread and write what is still pending"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout)
+        if self._pid == os.getpid():
+            self.flush()
+
+    def stats(self):
+        """
+        Get writer metrics.
+
+        Returns:
+            dict: Saves, coalesced writes, rows written, failures and pending carts
+        """
+        with self._lock:
+            return {
+                'window_seconds': self.window,
+                'pending': len(self._pending),
+                'saves': self.saves,
+                'writes': self.writes,
+                'rows_written': self.rows_written,
+                'failures': self.failures,
+                'dropped': self.dropped,
+            }
+
+
+def init_app(app):
+    """Attach a CartPersistence to the app when CART_PERSIST_ENABLED is set"""
+    if not app.config.get('CART_PERSIST_ENABLED'):
+        return
+    persistence = CartPersistence(window=app.config.get('CART_PERSIST_WINDOW_SECONDS', DEFAULT_WINDOW))
+    app.extensions['cart_persistence'] = persistence
+    atexit.register(persistence.shutdown)
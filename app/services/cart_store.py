@@ -0,0 +1,434 @@
+"""Server-side cart storage - the session cookie only carries a cart id"""
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, unquote
+from flask import current_app, request, session as flask_session
+from flask_login import current_user
+from sqlalchemy import select, delete
+from database.postgres import SessionLocal
+from database.models import SessionCart
+from app.services.cart import Cart
+
+# Blob format: one version byte, then zlib-compressed compact JSON
+FORMAT_VERSION = 1
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def encode_cart(cart):
+    """Serialize a cart to a compact binary blob"""
+    body = json.dumps(cart, separators=(',', ':')).encode('utf-8')
+    return bytes([FORMAT_VERSION]) + zlib.compress(body, 6)
+
+
+def decode_cart(blob):
+    """Deserialize a blob written by encode_cart()"""
+    if not blob or blob[0] != FORMAT_VERSION:
+        return {}
+    return json.loads(zlib.decompress(blob[1:]))
+
+
+class MemoryCartBackend:
+    """Per-process dict - for tests and single-process development"""
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._carts = {}
+        self._lock = threading.Lock()
+
+    def get(self, cart_id):
+        with self._lock:
+            entry = self._carts.get(cart_id)
+        if entry and entry[1] > time.time():
+            return entry[0]
+        return None
+
+    def set(self, cart_id, blob):
+        with self._lock:
+            self._carts[cart_id] = (blob, time.time() + self.ttl)
+
+    def delete(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+
+class SQLiteCartBackend:
+    """
+    Carts in a local SQLite file, shared by the workers on one host.
+
+    Uses WAL mode so readers don't block the writer; each thread keeps its
+    own connection. Expired carts are ignored on read and purged now and then.
+    The file (and its directory) is only created on first use, not when the
+    app starts.
+    """
+    def __init__(self, path, ttl=DEFAULT_TTL, purge_every=1000):
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._writes = 0
+        self._ready = False
+        self._setup_lock = threading.Lock()
+
+    def _setup(self, conn):
+        with self._setup_lock:
+            if self._ready:
+                return
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS carts '
+                '(id TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._ready = True
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            if not self._ready:
+                self._setup(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, cart_id):
+        row = self._connect().execute(
+            'SELECT data FROM carts WHERE id = ? AND expires_at > ?', (cart_id, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, cart_id, blob):
+        conn = self._connect()
+        conn.execute(
+            'INSERT INTO carts (id, data, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at',
+            (cart_id, blob, time.time() + self.ttl)
+        )
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            conn.execute('DELETE FROM carts WHERE expires_at <= ?', (time.time(),))
+
+    def delete(self, cart_id):
+        self._connect().execute('DELETE FROM carts WHERE id = ?', (cart_id,))
+
+
+def _upsert_statement(session):
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f'Database cart store does not support {dialect}')
+
+    statement = insert(SessionCart)
+    return statement.on_conflict_do_update(
+        index_elements=['id'],
+        set_={'data': statement.excluded.data, 'expires_at': statement.excluded.expires_at}
+    )
+
+
+class DatabaseCartBackend:
+    """
+    Carts in the application database (cart_sessions table), shared by
+    every worker and instance without extra infrastructure.
+
+    Each read is a primary-key lookup and each write one upsert. Expired
+    carts are ignored on read and purged now and then.
+    """
+    def __init__(self, session_factory=SessionLocal, ttl=DEFAULT_TTL, purge_every=1000):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._writes = 0
+
+    def get(self, cart_id):
+        session = self.session_factory()
+        try:
+            return session.execute(
+                select(SessionCart.data).where(SessionCart.id == cart_id, SessionCart.expires_at > datetime.utcnow())
+            ).scalar()
+        finally:
+            session.close()
+
+    def set(self, cart_id, blob):
+        session = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            session.execute(_upsert_statement(session).values(
+                id=cart_id, data=blob, expires_at=now + timedelta(seconds=self.ttl)
+            ))
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                session.execute(delete(SessionCart).where(SessionCart.expires_at <= now))
+            session.commit()
+        finally:
+            session.close()
+
+    def delete(self, cart_id):
+        session = self.session_factory()
+        try:
+            session.execute(delete(SessionCart).where(SessionCart.id == cart_id))
+            session.commit()
+        finally:
+            session.close()
+
+
+class RespConnection:
+    """
+    Minimal Redis protocol (RESP2) client - just enough for GET/SET/DEL.
+
+    Works with Redis, Valkey, KeyDB, Dragonfly and Memorystore.
+    """
+    def __init__(self, host, port, db=0, password=None, timeout=2.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.reader = self.sock.makefile('rb')
+        if password:
+            self.command('AUTH', password)
+        if db:
+            self.command('SELECT', db)
+
+    def command(self, *args):
+        """Send a command and return its parsed reply"""
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self.sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RuntimeError(f'Redis error: {rest.decode()}')
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length == -1:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(rest)
+            return None if count == -1 else [self._read_reply() for _ in range(count)]
+        raise RuntimeError(f'Unexpected reply from server: {line!r}')
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisCartBackend:
+    """
+    Carts in Redis (or any RESP-compatible server), shared by every worker.
+
+    One connection per thread, reconnecting once if the connection dropped.
+    """
+    def __init__(self, host='localhost', port=6379, db=0, password=None, ttl=DEFAULT_TTL,
+                 timeout=2.0, prefix='cart:'):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.ttl = ttl
+        self.timeout = timeout
+        self.prefix = prefix
+        self._local = threading.local()
+
+    def _command(self, *args):
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+                conn = RespConnection(self.host, self.port, self.db, self.password, self.timeout)
+                self._local.conn = conn
+                self._local.pid = os.getpid()
+            try:
+                return conn.command(*args)
+            except (ConnectionError, OSError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def get(self, cart_id):
+        return self._command('GET', self.prefix + cart_id)
+
+    def set(self, cart_id, blob):
+        self._command('SET', self.prefix + cart_id, blob, 'EX', self.ttl)
+
+    def delete(self, cart_id):
+        self._command('DEL', self.prefix + cart_id)
+
+
+def build_cart_backend(url, ttl=DEFAULT_TTL):
+    """
+    Create a backend from a CART_STORE URL.
+
+    Backends connect on first use, so building one touches no files or
+    servers.
+
+    Args:
+        url: 'memory://', 'database://' (the app's own database),
+            'sqlite:///path/to/carts.db' or 'redis://[:password@]host[:port][/db]'
+        ttl: Seconds an untouched cart is kept
+
+    Returns:
+        Backend with get/set/delete
+    """
+    if not url:
+        raise ValueError(
+            'CART_STORE is not set; use redis://host:port/db or database:// '
+            '(sqlite:/// only suits a single host)'
+        )
+    parsed = urlparse(url)
+    if parsed.scheme == 'memory':
+        return MemoryCartBackend(ttl)
+    if parsed.scheme == 'database':
+        return DatabaseCartBackend(ttl=ttl)
+    if parsed.scheme == 'sqlite':
+        # Same convention as SQLAlchemy: three slashes relative, four absolute
+        return SQLiteCartBackend(parsed.path[1:], ttl)
+    if parsed.scheme == 'redis':
+        return RedisCartBackend(
+            host=parsed.hostname or 'localhost',
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip('/') or 0),
+            password=unquote(parsed.password) if parsed.password else None,
+            ttl=ttl
+        )
+    raise ValueError(f'Unsupported CART_STORE: {url}')
+
+
+def init_app(app):
+    """Attach the configured cart backend and the save hook to an app"""
+    app.extensions['cart_store'] = build_cart_backend(
+        app.config['CART_STORE'], app.config.get('CART_TTL_SECONDS', DEFAULT_TTL)
+    )
+    app.after_request(_save_cart)
+
+
+def _backend():
+    return current_app.extensions['cart_store']
+
+
+def _persistence():
+    """The app's CartPersistence, or None unless carts are kept per user"""
+    return current_app.extensions.get('cart_persistence')
+
+
+def _user_id():
+    return current_user.id if current_user.is_authenticated else None
+
+
+def _state():
+    """
+    Per-request cart state.
+    
+    Kept in the WSGI environ rather than on `g`: an app context pushed
+    around several requests (as in the test suite) shares `g` between them.
+    """
+    return request.environ.setdefault('restaurant_app.cart', {})
+
+
+def load_cart():
+    """
+    Get the current user's cart, loading it on first use in this request.
+
+    Requests that never call this don't touch the store. A cart still held
+    in the cookie by an older version of the app is moved to the store.
+
+    With per-user persistence enabled, a logged-in user's cart is stored
+    under their user id, so every device shares it; when the store no longer
+    has it (expired, or another host's SQLite store) it is read back from
+    the carts table.
+
+    Returns:
+        Cart: The cart; call mark_cart_modified() after changing it
+    """
+    state = _state()
+    if 'cart' not in state:
+        legacy = flask_session.pop('cart', None)
+        session_cart_id = flask_session.get('cart_id')
+        cart_id = current_cart_id()
+        if legacy is not None:
+            state['cart'] = Cart.from_dict(legacy)
+            state['modified'] = True
+        else:
+            blob = _backend().get(cart_id) if cart_id else None
+            modified = False
+            if blob is None and cart_id != session_cart_id:
+                blob = _persistence().load(_user_id())
+                if blob is None and session_cart_id:
+                    # Adopt the cart this session had before persistence was enabled
+                    blob = _backend().get(session_cart_id)
+                modified = blob is not None
+            state['cart'] = Cart.from_dict(decode_cart(blob))
+            state['modified'] = modified
+    return state['cart']
+
+
+def current_cart_id():
+    """Store id of the current cart, or None if nothing has been saved yet"""
+    user_id = _user_id() if _persistence() else None
+    if user_id is not None:
+        return f'user-{user_id}'
+    return flask_session.get('cart_id')
+
+
+def replace_cart(cart):
+    """Swap in a new cart object for this request (saved at the end)"""
+    state = _state()
+    state['cart'] = cart
+    state['modified'] = True
+
+
+def mark_cart_modified():
+    """Flag the loaded cart to be written back after the request"""
+    _state()['modified'] = True
+
+
+def clear_cart():
+    """Empty the current cart (keeping its revision counter going)"""
+    load_cart().clear()
+    mark_cart_modified()
+
+
+def _save_cart(response):
+    """after_request hook: write the cart back if it changed"""
+    state = request.environ.get('restaurant_app.cart')
+    if state and state.get('modified'):
+        cart = state['cart']
+        cart_id = current_cart_id()
+        if not cart_id:
+            if not cart:
+                return response
+            cart_id = flask_session['cart_id'] = secrets.token_urlsafe(16)
+        blob = encode_cart(cart.to_dict())
+        try:
+            # Emptied carts are kept (until they expire) so revisions never repeat
+            _backend().set(cart_id, blob)
+        except Exception:
+            current_app.logger.exception('Error saving cart %s', cart_id)
+        
+        user_id = _user_id()
+        if _persistence() and user_id is not None:
+            _persistence().save(user_id, blob)
+    return response
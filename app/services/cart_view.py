@@ -0,0 +1,105 @@
+"""Cart summary shared by the cart page and the cart JSON API"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from database.models import Restaurant
+
+
+class CartViewCache:
+    """
+    Small LRU of built cart views keyed by (cart_id, revision).
+
+    A cart's revision changes on every edit and never repeats, so a cached
+    view can only be stale about restaurant names; `ttl` bounds that.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._views.get(key)
+            if entry is None:
+                return None
+            if self.clock() - entry[0] >= self.ttl:
+                del self._views[key]
+                return None
+            self._views.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, view):
+        with self._lock:
+            self._views[key] = (self.clock(), view)
+            self._views.move_to_end(key)
+            while len(self._views) > self.max_entries:
+                self._views.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+
+# Global cache - views are per worker process
+view_cache = CartViewCache(
+    max_entries=int(os.environ.get('CART_VIEW_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('CART_VIEW_CACHE_TTL_SECONDS', 60))
+)
+
+
+def build_cart_view(cart, session, cart_id=None):
+    """
+    Build the per-restaurant cart listing with names and totals.
+
+    All restaurants are resolved with one IN query, however many are in the
+    cart, and totals come from the cart's running totals. Restaurants that
+    no longer exist are left out. When `cart_id` is given the result is
+    memoized for the cart's current revision.
+
+    Args:
+        cart: Current Cart
+        session: Database session for the restaurant lookup
+        cart_id: Store id of the cart, or None to skip memoizing
+
+    Returns:
+        dict: {'cart_data': [{'restaurant_id', 'restaurant_name', 'items', 'total'}],
+            'grand_total': float, 'item_count': int}
+    """
+    key = (cart_id, cart.revision)
+    if cart_id:
+        view = view_cache.get(key)
+        if view is not None:
+            return view
+
+    # Carts from before restaurant ids were validated may hold junk keys
+    restaurant_ids = [int(rid) for rid in cart.restaurant_ids() if str(rid).isdigit()]
+    names = {}
+    if restaurant_ids:
+        rows = session.query(Restaurant.id, Restaurant.name).filter(Restaurant.id.in_(restaurant_ids)).all()
+        names = {row.id: row.name for row in rows}
+
+    cart_data = []
+    grand_total_cents = 0
+    for restaurant_id in restaurant_ids:
+        if restaurant_id not in names:
+            continue
+        grand_total_cents += cart.restaurant_total_cents(restaurant_id)
+        cart_data.append({
+            'restaurant_id': restaurant_id,
+            'restaurant_name': names[restaurant_id],
+            'items': cart.items(restaurant_id),
+            'total': cart.restaurant_total(restaurant_id)
+        })
+
+    view = {
+        'cart_data': cart_data,
+        'grand_total': grand_total_cents / 100,
+        'item_count': cart.item_count
+    }
+    if cart_id:
+        view_cache.put(key, view)
+    return view
@@ -0,0 +1,297 @@
+"""In-process domain event bus for order and review lifecycle hooks"""
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+
+class DomainEvent:
+    """
+    Base class for domain events.
+
+    `key` decides delivery order: async subscribers see events with the same
+    key in the order they were published.
+    """
+    def __init__(self):
+        self.occurred_at = datetime.utcnow()
+
+    @property
+    def key(self):
+        return None
+
+    def __repr__(self):
+        fields = ', '.join(f'{k}={v!r}' for k, v in vars(self).items() if k != 'occurred_at')
+        return f'{type(self).__name__}({fields})'
+
+
+class OrderCreated(DomainEvent):
+    """An order was placed"""
+    def __init__(self, order_id, user_id, restaurant_id, total_price):
+        super().__init__()
+        self.order_id = order_id
+        self.user_id = user_id
+        self.restaurant_id = restaurant_id
+        self.total_price = total_price
+
+    @property
+    def key(self):
+        return self.order_id
+
+
+class OrderStatusChanged(DomainEvent):
+    """An admin moved an order to a new status"""
+    def __init__(self, order_id, old_status, new_status):
+        super().__init__()
+        self.order_id = order_id
+        self.old_status = old_status
+        self.new_status = new_status
+
+    @property
+    def key(self):
+        return self.order_id
+
+
+class OrderCancelled(DomainEvent):
+    """A customer cancelled their order"""
+    def __init__(self, order_id, old_status):
+        super().__init__()
+        self.order_id = order_id
+        self.old_status = old_status
+
+    @property
+    def key(self):
+        return self.order_id
+
+
+class ReviewSubmitted(DomainEvent):
+    """A review was stored for a restaurant"""
+    def __init__(self, restaurant_id, user_id, rating):
+        super().__init__()
+        self.restaurant_id = restaurant_id
+        self.user_id = user_id
+        self.rating = rating
+
+    @property
+    def key(self):
+        return ('restaurant', self.restaurant_id)
+
+
+class MenuChanged(DomainEvent):
+    """A restaurant's menu (names or prices) changed"""
+    def __init__(self, restaurant_id):
+        super().__init__()
+        self.restaurant_id = restaurant_id
+
+    @property
+    def key(self):
+        return ('restaurant', self.restaurant_id)
+
+
+class _Subscriber:
+    """A registered handler and its timing metrics"""
+    def __init__(self, name, event_type, handler, asynchronous):
+        self.name = name
+        self.event_type = event_type
+        self.handler = handler
+        self.asynchronous = asynchronous
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def deliver(self, event):
+        """Run the handler; errors are counted and logged, never raised"""
+        started = time.monotonic()
+        failed = False
+        try:
+            self.handler(event)
+        except Exception as e:
+            failed = True
+            print(f"Error in event subscriber {self.name} for {type(event).__name__}: {e}")
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self.calls += 1
+            self.errors += failed
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'event': self.event_type.__name__,
+                'mode': 'async' if self.asynchronous else 'sync',
+                'calls': self.calls,
+                'errors': self.errors,
+                'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+                'max_ms': round(self.max_ms, 3),
+            }
+
+
+class EventBus:
+    """
+    Publish domain events to sync and async subscribers.
+
+    Sync subscribers run inside publish(), in registration order. Async
+    subscribers run on background shards: events are routed to a shard by
+    their key and each shard is a single thread, so events for one order
+    are handled in publish order while different orders proceed in parallel.
+    Subscriber errors are isolated and counted; a full shard queue drops the
+    event for async subscribers rather than blocking the request.
+    """
+    def __init__(self, shards=4, max_queue=10000):
+        self.shards = shards
+        self.max_queue = max_queue
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._queues = []
+        self._threads = []
+        self._pid = None
+        self._stopping = threading.Event()
+
+        # Metrics
+        self.published = {}
+        self.dropped = 0
+
+    def subscribe(self, event_type, handler, mode='sync', name=None):
+        """
+        Register a handler for an event type.
+
+        Registering the same name twice replaces the earlier handler, so
+        repeated app setup doesn't deliver events twice.
+
+        Args:
+            event_type: DomainEvent subclass
+            handler: Callable taking the event
+            mode (str): 'sync' to run in the publisher, 'async' for the shards
+            name (str): Subscriber name used in metrics (defaults to the handler name)
+        """
+        if mode not in ('sync', 'async'):
+            raise ValueError(f'Unknown subscriber mode: {mode}')
+        name = name or getattr(handler, '__qualname__', repr(handler))
+        subscriber = _Subscriber(name, event_type, handler, mode == 'async')
+        with self._lock:
+            existing = [s for s in self._subscribers.get(event_type, []) if s.name != name]
+            self._subscribers[event_type] = existing + [subscriber]
+
+    def subscriber(self, event_type, mode='sync', name=None):
+        """Decorator form of subscribe()"""
+        def decorator(handler):
+            self.subscribe(event_type, handler, mode=mode, name=name)
+            return handler
+        return decorator
+
+    def _ensure_started(self):
+        """Start the shard threads (again after a fork, e.g. gunicorn workers)"""
+        if self._threads and self._pid == os.getpid():
+            return
+        with self._lock:
+            if not self._threads or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stopping.clear()
+                self._queues = [queue.Queue(maxsize=self.max_queue) for _ in range(self.shards)]
+                self._threads = [
+                    threading.Thread(target=self._run, args=(q,), name=f'events-{n}', daemon=True)
+                    for n, q in enumerate(self._queues)
+                ]
+                for thread in self._threads:
+                    thread.start()
+
+    def publish(self, event):
+        """
+        Deliver an event to its subscribers.
+
+        Call after the change the event describes has been committed.
+
+        Args:
+            event: DomainEvent instance
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(type(event), []))
+            name = type(event).__name__
+            self.published[name] = self.published.get(name, 0) + 1
+
+        async_subscribers = []
+        for subscriber in subscribers:
+            if subscriber.asynchronous:
+                async_subscribers.append(subscriber)
+            else:
+                subscriber.deliver(event)
+
+        if async_subscribers:
+            if self._stopping.is_set():
+                self._drop()
+                return
+            self._ensure_started()
+            shard = self._queues[hash(event.key) % self.shards]
+            try:
+                shard.put_nowait((event, async_subscribers))
+            except queue.Full:
+                self._drop()
+
+    def _drop(self):
+        """Count an event the async subscribers will never see"""
+        with self._lock:
+            self.dropped += 1
+
+    def _run(self, shard):
+        """Shard loop: deliver queued events one at a time"""
+        while True:
+            try:
+                event, subscribers = shard.get(timeout=0.2)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    break
+                continue
+            for subscriber in subscribers:
+                subscriber.deliver(event)
+            shard.task_done()
+
+    def flush(self):
+        """Block until every queued async delivery has run"""
+        if any(thread.is_alive() for thread in self._threads):
+            for shard in self._queues:
+                shard.join()
+
+    def shutdown(self, timeout=5.0):
+        """
+        Stop accepting async work and drain the shards.
+
+        Args:
+            timeout (float): Max seconds to wait for the shards to finish
+        """
+        self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        """
+        Get bus metrics.
+
+        Returns:
+            dict: Publish counts, queue depth, drops and per-subscriber timings
+        """
+        with self._lock:
+            subscribers = [s for group in self._subscribers.values() for s in group]
+            published = dict(self.published)
+            dropped = self.dropped
+        return {
+            'published': published,
+            'dropped': dropped,
+            'shards': self.shards,
+            'queue_depth': sum(q.qsize() for q in self._queues),
+            'subscribers': [s.stats() for s in subscribers],
+        }
+
+
+# Global bus - shard threads start on the first async delivery
+bus = EventBus(
+    shards=int(os.environ.get('EVENT_BUS_SHARDS', 4)),
+    max_queue=int(os.environ.get('EVENT_BUS_QUEUE_SIZE', 10000))
+)
+atexit.register(bus.shutdown)
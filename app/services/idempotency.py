@@ -0,0 +1,98 @@
+"""Idempotency keys for order placement"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from flask import request
+from sqlalchemy import select, delete
+from database.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 128
+DEFAULT_RETENTION_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_RETENTION_HOURS', 24))
+
+
+def request_key(form_value=None):
+    """
+    Idempotency key sent by the client, if any.
+
+    The Idempotency-Key header (API and mobile clients) wins over the hidden
+    form field rendered on the checkout page.
+
+    Args:
+        form_value: Value of the form's idempotency_key field
+
+    Returns:
+        str or None: The key, or None if the client didn't send a usable one
+    """
+    key = (request.headers.get(HEADER) or form_value or '').strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return None
+    return key
+
+
+def cart_fingerprint(cart, cart_id):
+    """
+    Fallback key for clients that send none.
+
+    Identical for submits of the same cart revision (a double click, or a
+    retry racing the first attempt); any cart change gives a new value.
+
+    This only dedupes submits that arrive while the cart is still at that
+    revision. A placed order clears the cart, so a retry sent after the
+    first attempt committed (e.g. the response was lost) fingerprints the
+    emptied cart and gets the empty-cart error, not the original order.
+    Only a client-sent key covers that case.
+
+    Args:
+        cart: Cart being ordered
+        cart_id: Store id of the cart
+
+    Returns:
+        str: Key derived from the cart id, revision and contents
+    """
+    body = json.dumps([cart_id, cart.revision, cart.to_dict()['restaurants']], sort_keys=True)
+    return 'cart:' + hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def find_order_id(session, user_id, key):
+    """
+    Order already placed with this key.
+
+    Returns:
+        int or None: Order id, or None if the key hasn't been used
+    """
+    return session.execute(
+        select(IdempotencyKey.order_id).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    ).scalar()
+
+
+def claim(session, user_id, key, order_id):
+    """
+    Record the key for a new order in the order's transaction.
+
+    Flushes immediately so a concurrent duplicate fails here, before the
+    rest of the order is written.
+
+    Raises:
+        sqlalchemy.exc.IntegrityError: If the key was already used
+    """
+    session.add(IdempotencyKey(user_id=user_id, key=key, order_id=order_id))
+    session.flush()
+
+
+def purge_expired(session, retention_hours=DEFAULT_RETENTION_HOURS, now=None):
+    """
+    Delete keys older than the retention period.
+
+    Args:
+        session: Database session (committed by the caller)
+        retention_hours: How long keys are honoured
+        now: Current time (for tests)
+
+    Returns:
+        int: Number of keys deleted
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=retention_hours)
+    result = session.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff))
+    return result.rowcount
@@ -0,0 +1,128 @@
+"""Live per-restaurant kitchen queue - active orders and changes since a cursor"""
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import selectinload
+from database.models import Order, OrderStatusEvent, ACTIVE_ORDER_STATUSES
+
+# Events younger than this are sent again on the next poll: an event whose
+# transaction commits late can appear below ids a client has already seen
+SETTLE_SECONDS = 5
+
+# Beyond this many events since the cursor a fresh snapshot is cheaper
+MAX_CHANGES = 500
+
+
+def _active():
+    # Rendered as literals rather than bound parameters, so the condition
+    # matches the partial index ix_orders_kitchen_queue (SQLite only uses a
+    # partial index when the query repeats its WHERE clause)
+    return Order.status.in_(
+        bindparam('active_statuses', list(ACTIVE_ORDER_STATUSES), expanding=True, literal_execute=True)
+    )
+
+
+def is_active(status):
+    """Whether an order in this status belongs in the kitchen queue"""
+    return status in ACTIVE_ORDER_STATUSES
+
+
+def order_view(order):
+    """JSON-serializable kitchen ticket for an order (items must be loaded)"""
+    return {
+        'id': order.id,
+        'status': order.status.value,
+        'version': order.version,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+        'status_changed_at': order.status_changed_at.isoformat() if order.status_changed_at else None,
+        'notes': order.notes,
+        'items': [
+            {'name': item.menu_item_name, 'quantity': item.quantity, 'special_instructions': item.special_instructions}
+            for item in order.items
+        ]
+    }
+
+
+def settled_cursor(session, restaurant_id, now=None):
+    """
+    Id of the restaurant's newest settled status event, or 0.
+
+    Walks the (restaurant_id, id) index backwards from the newest event, so
+    it only passes over the last few seconds of events.
+    """
+    settled_before = (now or datetime.utcnow()) - timedelta(seconds=SETTLE_SECONDS)
+    return session.execute(
+        select(OrderStatusEvent.id)
+        .where(OrderStatusEvent.restaurant_id == restaurant_id, OrderStatusEvent.created_at <= settled_before)
+        .order_by(OrderStatusEvent.id.desc())
+        .limit(1)
+    ).scalar() or 0
+
+
+def snapshot(session, restaurant_id, now=None):
+    """
+    All of a restaurant's active orders, oldest first.
+
+    Args:
+        session: Open SQLAlchemy session
+        restaurant_id: ID of the restaurant
+        now: Current time (defaults to utcnow)
+
+    Returns:
+        dict: {'cursor', 'reset': True, 'orders': [...], 'removed': []}
+    """
+    # Read the cursor first: a change landing in between is sent again on
+    # the next poll, which is harmless, rather than lost
+    cursor = settled_cursor(session, restaurant_id, now)
+    orders = session.query(Order).options(selectinload(Order.items)).filter(
+        Order.restaurant_id == restaurant_id, _active()
+    ).order_by(Order.created_at, Order.id).all()
+    return {'cursor': cursor, 'reset': True, 'orders': [order_view(order) for order in orders], 'removed': []}
+
+
+def changes_since(session, restaurant_id, cursor, now=None):
+    """
+    Orders whose status changed after a cursor from an earlier call.
+
+    Reads the restaurant's status events after the cursor (an index range
+    scan, usually empty), then loads just the orders they mention. Orders
+    that are still active come back in 'orders'; ones that left the queue
+    (delivered or cancelled) are listed in 'removed'. An order can be sent
+    again on a later poll, so clients should treat 'orders' as upserts.
+
+    Args:
+        session: Open SQLAlchemy session
+        restaurant_id: ID of the restaurant
+        cursor: 'cursor' from the previous response
+        now: Current time (defaults to utcnow)
+
+    Returns:
+        dict: {'cursor', 'reset', 'orders', 'removed'}; reset=True means a
+            full snapshot was sent instead and the client should replace its queue
+    """
+    events = session.execute(
+        select(OrderStatusEvent.id, OrderStatusEvent.order_id, OrderStatusEvent.created_at)
+        .where(OrderStatusEvent.restaurant_id == restaurant_id, OrderStatusEvent.id > cursor)
+        .order_by(OrderStatusEvent.id)
+        .limit(MAX_CHANGES + 1)
+    ).all()
+    if len(events) > MAX_CHANGES:
+        return snapshot(session, restaurant_id, now)
+    if not events:
+        return {'cursor': cursor, 'reset': False, 'orders': [], 'removed': []}
+
+    # Don't move the cursor past events that are still settling
+    settled_before = (now or datetime.utcnow()) - timedelta(seconds=SETTLE_SECONDS)
+    unsettled = [event_id for event_id, _, created_at in events if created_at > settled_before]
+    next_cursor = max(min(unsettled) - 1, cursor) if unsettled else events[-1][0]
+
+    order_ids = list(dict.fromkeys(order_id for _, order_id, _ in events))
+    orders = session.query(Order).options(selectinload(Order.items)).filter(
+        Order.id.in_(order_ids)
+    ).order_by(Order.created_at, Order.id).all()
+
+    return {
+        'cursor': next_cursor,
+        'reset': False,
+        'orders': [order_view(order) for order in orders if is_active(order.status)],
+        'removed': [order.id for order in orders if not is_active(order.status)]
+    }
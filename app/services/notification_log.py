@@ -0,0 +1,354 @@
+"""Structured, rotated and indexed notification log"""
+import bisect
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines - single process only
+    fcntl = None
+
+from app.services.notification_sinks import NotificationSink
+
+FSYNC_POLICIES = ('batch', 'interval', 'never')
+
+# Closed segments are compressed as independent gzip members of this many
+# uncompressed bytes, so a read only decompresses the member it falls in
+GZIP_MEMBER_BYTES = 64 * 1024
+
+
+class NotificationLog:
+    """
+    JSON-lines notification log split into segments with an order index.
+
+    Layout of `directory`:
+    - segment-<seq>-<opened epoch>.jsonl: the active segment, appended to
+    - segment-<seq>-<opened epoch>.jsonl.gz: closed, compressed segments
+    - index-<seq>.jsonl: one line per entry with an order_id in segment
+      <seq>, mapping it to its byte offset/length within the uncompressed
+      segment; closing the segment appends the offsets of its gzip members
+
+    A segment is closed once it reaches `max_bytes` or `max_age` seconds,
+    and its index closes with it. With `max_segments` set, the oldest
+    closed segments are deleted together with their index files.
+
+    Queries keep the parsed indexes of the `index_cache_segments` most
+    recently read segments in memory; other segments' index files are read
+    from disk when a query needs them, so memory stays bounded however many
+    segments are kept.
+
+    Appended batches are fsynced per batch, at most once per
+    `fsync_interval` seconds, or never, depending on `fsync_policy`. Writes
+    take an exclusive file lock, so several worker processes can share one
+    directory. Nothing touches the disk until the first append.
+    """
+    def __init__(self, directory, max_bytes=10 * 1024 * 1024, max_age=24 * 3600, max_segments=None,
+                 fsync_policy='interval', fsync_interval=1.0, index_cache_segments=8):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy must be one of {', '.join(FSYNC_POLICIES)}, not {fsync_policy!r}")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_segments = max_segments
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.index_cache_segments = index_cache_segments
+        self._lock_path = os.path.join(directory, '.lock')
+        self._thread_lock = threading.Lock()
+        self._directory_ready = False
+        self._last_fsync = 0.0
+
+        # LRU of parsed index files by file name, extended incrementally on query
+        self._indexes = OrderedDict()
+
+    # Writing
+
+    def append(self, entries):
+        """
+        Append entries to the active segment and index them by order id.
+
+        Args:
+            entries: List of JSON-serializable dicts; those with an
+                'order_id' are added to the index
+        """
+        with self._thread_lock:
+            if not self._directory_ready:
+                os.makedirs(self.directory, exist_ok=True)
+                self._directory_ready = True
+
+            with self._file_lock():
+                segment = self._active_segment()
+                with open(os.path.join(self.directory, segment), 'ab') as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    lines = []
+                    index_lines = []
+                    for entry in entries:
+                        line = (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+                        if entry.get('order_id') is not None:
+                            index_lines.append(json.dumps({
+                                'order_id': entry['order_id'],
+                                'segment': segment,
+                                'offset': offset,
+                                'length': len(line)
+                            }, separators=(',', ':')) + '\n')
+                        lines.append(line)
+                        offset += len(line)
+                    f.write(b''.join(lines))
+                    sync = self._fsync_due()
+                    if sync:
+                        f.flush()
+                        os.fsync(f.fileno())
+
+                if index_lines:
+                    with open(self._index_path(segment), 'a') as index:
+                        index.write(''.join(index_lines))
+                        if sync:
+                            index.flush()
+                            os.fsync(index.fileno())
+
+                if offset >= self.max_bytes:
+                    self._close_segment(segment)
+                    self._prune()
+
+    def _fsync_due(self):
+        """Whether this batch should be fsynced under the fsync policy"""
+        if self.fsync_policy == 'never':
+            return False
+        now = time.monotonic()
+        if self.fsync_policy == 'interval' and now - self._last_fsync < self.fsync_interval:
+            return False
+        self._last_fsync = now
+        return True
+
+    def _file_lock(self):
+        """Exclusive inter-process lock around segment and index writes"""
+        return _FileLock(self._lock_path)
+
+    def _index_path(self, segment):
+        return os.path.join(self.directory, f'index-{_segment_seq(segment):06d}.jsonl')
+
+    def _segments(self):
+        """All segment file names, oldest first"""
+        names = [os.path.basename(p) for p in glob.glob(os.path.join(self.directory, 'segment-*.jsonl*'))]
+        return sorted((name for name in names if not name.endswith('.tmp')), key=_segment_seq)
+
+    def _active_segment(self):
+        """Name of the segment to append to, rotating on age"""
+        segments = self._segments()
+        active = [name for name in segments if name.endswith('.jsonl')]
+        if active:
+            name = active[-1]
+            opened = int(name[:-len('.jsonl')].split('-')[2])
+            if time.time() - opened < self.max_age:
+                return name
+            self._close_segment(name)
+            self._prune()
+            segments = self._segments()
+
+        seq = _segment_seq(segments[-1]) + 1 if segments else 1
+        name = f'segment-{seq:06d}-{int(time.time())}.jsonl'
+        open(os.path.join(self.directory, name), 'ab').close()
+        return name
+
+    def _close_segment(self, name):
+        """
+        Compress a closed segment as a series of gzip members.
+
+        The index keeps uncompressed offsets; the members' (uncompressed,
+        compressed) start offsets are appended to the segment's index file
+        before the compressed file replaces the original, so a reader never
+        sees a compressed segment whose member table is missing.
+        """
+        path = os.path.join(self.directory, name)
+        members = []
+        with open(path, 'rb') as source, open(path + '.gz.tmp', 'wb') as target:
+            position = 0
+            while True:
+                block = source.read(GZIP_MEMBER_BYTES)
+                if not block:
+                    break
+                members.append((position, target.tell()))
+                target.write(gzip.compress(block))
+                position += len(block)
+            if self.fsync_policy != 'never':
+                target.flush()
+                os.fsync(target.fileno())
+
+        with open(self._index_path(name), 'a') as index:
+            index.write(json.dumps({'segment': name, 'members': members}, separators=(',', ':')) + '\n')
+        os.replace(path + '.gz.tmp', path + '.gz')
+        os.remove(path)
+
+    def _prune(self):
+        """Delete the oldest closed segments and their indexes beyond max_segments"""
+        if not self.max_segments:
+            return
+        closed = [name for name in self._segments() if name.endswith('.gz')]
+        for name in closed[:-self.max_segments]:
+            for path in (os.path.join(self.directory, name), self._index_path(name)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    # Querying
+
+    def _segment_index(self, path):
+        """
+        Get a segment's parsed index, reading only lines appended since the last query.
+
+        Args:
+            path: Path of the segment's index file
+
+        Returns:
+            _SegmentIndex or None: None when the segment has been pruned
+        """
+        name = os.path.basename(path)
+        index = self._indexes.pop(name, None) or _SegmentIndex()
+        if index.members is None:
+            try:
+                f = open(path, 'r')
+            except FileNotFoundError:
+                return None  # pruned since the glob
+            with f:
+                f.seek(index.position)
+                while True:
+                    line = f.readline()
+                    if not line.endswith('\n'):
+                        break  # a writer is mid-line; pick it up next time
+                    index.add(json.loads(line))
+                    index.position = f.tell()
+
+        self._indexes[name] = index
+        while len(self._indexes) > self.index_cache_segments:
+            self._indexes.popitem(last=False)
+        return index
+
+    def timeline(self, order_id):
+        """
+        Get every logged notification for an order, oldest first.
+
+        Only the indexed byte ranges are read (for a compressed segment,
+        only the gzip members holding them), so the cost depends on the
+        number of entries for the order rather than the size of the log.
+
+        Args:
+            order_id: Order id
+
+        Returns:
+            list: Entry dicts in the order they were written
+        """
+        paths = sorted(glob.glob(os.path.join(self.directory, 'index-*.jsonl')))
+        located = []
+        with self._thread_lock:
+            live = {os.path.basename(path) for path in paths}
+            for name in [name for name in self._indexes if name not in live]:
+                del self._indexes[name]
+            for path in paths:
+                index = self._segment_index(path)
+                if index is not None and order_id in index.offsets:
+                    located.append((index.segment, list(index.offsets[order_id]), index.members))
+
+        entries = []
+        for segment, ranges, members in located:
+            entries.extend(self._read_ranges(segment, sorted(ranges), members))
+        return entries
+
+    def _read_ranges(self, segment, ranges, members=None):
+        """Read byte ranges from a segment, compressed or not"""
+        path = os.path.join(self.directory, segment)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            try:
+                f = open(path + '.gz', 'rb')
+            except FileNotFoundError:
+                return []  # pruned
+            with f:
+                return _read_compressed(f, ranges, members or [(0, 0)])
+
+        entries = []
+        with f:
+            for offset, length in ranges:
+                f.seek(offset)
+                entries.append(json.loads(f.read(length)))
+        return entries
+
+
+class _SegmentIndex:
+    """One segment's index file, parsed up to `position`"""
+    def __init__(self):
+        self.segment = None
+        self.offsets = {}
+        self.members = None
+        self.position = 0
+
+    def add(self, record):
+        self.segment = record['segment']
+        if 'members' in record:
+            # Closing line - the index is complete from here on
+            self.members = [tuple(member) for member in record['members']]
+        else:
+            self.offsets.setdefault(record['order_id'], []).append((record['offset'], record['length']))
+
+
+def _read_compressed(raw, ranges, members):
+    """
+    Read sorted byte ranges from a multi-member gzip file.
+
+    Each range starts decompressing at the member holding its offset, or
+    carries on from the previous range when that is at most one member
+    behind. A member table of [(0, 0)] falls back to reading from the start.
+    """
+    starts = [start for start, _ in members]
+    entries = []
+    stream = position = None
+    for offset, length in ranges:
+        if stream is None or not position <= offset < position + GZIP_MEMBER_BYTES:
+            start, compressed = members[bisect.bisect_right(starts, offset) - 1]
+            raw.seek(compressed)
+            stream, position = gzip.GzipFile(fileobj=raw, mode='rb'), start
+        stream.read(offset - position)
+        entries.append(json.loads(stream.read(length)))
+        position = offset + length
+    return entries
+
+
+class _FileLock:
+    """Context manager for an exclusive flock (no-op where fcntl is unavailable)"""
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.path, 'a')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+def _segment_seq(name):
+    """Sequence number from a segment file name"""
+    return int(name.split('-')[1])
+
+
+class StructuredLogSink(NotificationSink):
+    """Notification sink writing to a NotificationLog"""
+    name = 'log'
+
+    def __init__(self, log):
+        self.log = log
+
+    def send_batch(self, entries):
+        self.log.append(entries)
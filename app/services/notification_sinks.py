@@ -0,0 +1,84 @@
+"""Notification sinks - destinations the notification dispatcher delivers to"""
+import json
+import smtplib
+import urllib.request
+from email.message import EmailMessage
+
+
+def format_entry(entry):
+    """Render a notification entry as a single log line"""
+    return f"[{entry['timestamp']}] {entry['message']}\n"
+
+
+class NotificationSink:
+    """
+    Base class for notification destinations.
+
+    Subclasses implement send_batch() and raise on failure; the dispatcher
+    handles queueing, batching, retries and backoff.
+    """
+    name = 'sink'
+
+    def send_batch(self, entries):
+        """
+        Deliver a batch of notification entries.
+
+        Args:
+            entries: List of entry dicts with 'timestamp' and 'message'
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources held by the sink"""
+
+
+class WebhookSink(NotificationSink):
+    """POST batches of entries as JSON to an HTTP endpoint"""
+    name = 'webhook'
+
+    def __init__(self, url, timeout=5.0, headers=None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = headers or {}
+
+    def send_batch(self, entries):
+        body = json.dumps({'notifications': entries}).encode('utf-8')
+        request = urllib.request.Request(
+            self.url,
+            data=body,
+            headers={'Content-Type': 'application/json', **self.headers},
+            method='POST'
+        )
+        # urlopen raises HTTPError for non-2xx responses
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class SmtpSink(NotificationSink):
+    """Email each batch of entries as a single digest message"""
+    name = 'smtp'
+
+    def __init__(self, host, port, sender, recipients, username=None, password=None,
+                 use_tls=False, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+    def send_batch(self, entries):
+        message = EmailMessage()
+        message['Subject'] = f'Order notifications ({len(entries)})'
+        message['From'] = self.sender
+        message['To'] = ', '.join(self.recipients)
+        message.set_content(''.join(format_entry(entry) for entry in entries))
+
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
@@ -1,74 +1,321 @@
 """Notification service for order events"""
+import atexit
 import os
+import threading
+import time
 from datetime import datetime
+from app.services.notification_sinks import WebhookSink, SmtpSink
+from app.services.notification_log import NotificationLog, StructuredLogSink
 
 
-def get_log_file():
-    """Get the notification log file path."""
-    log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'logs')
-    os.makedirs(log_dir, exist_ok=True)
-    return os.path.join(log_dir, 'notifications.log')
+def get_log_dir():
+    """Get the notification log directory (segments and index)."""
+    default = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'logs', 'notifications')
+    return os.environ.get('NOTIFICATION_LOG_DIR', default)
 
 
-def log_notification(message):
+class NotificationDispatcher:
     """
-    Log a notification to file.
+    Background delivery of outbox entries to one sink.
+    
+    A pool of worker threads repeatedly runs a drain function (the outbox's
+    deliver_once for this sink), which claims up to `batch_size` of the
+    sink's pending deliveries and sends them as one batch; the outbox
+    records failures and retries them with backoff. Each sink gets its own
+    dispatcher and threads, so a slow sink can't delay the others.
+    """
+    def __init__(self, sink, workers=1, batch_size=200, poll_interval=1.0):
+        self.sink = sink
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+        
+        # Metrics
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+    
+    def start(self, drain):
+        """
+        Start the worker threads (no-op if they are running).
+        
+        Args:
+            drain: Callable taking this dispatcher, delivering one batch and
+                returning (delivered count, failed count)
+        """
+        with self._lock:
+            if any(thread.is_alive() for thread in self._threads):
+                return
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(
+                    target=self._run, args=(drain,), name=f'notifications-{self.sink.name}-{n}', daemon=True
+                )
+                for n in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+    
+    def _run(self, drain):
+        """Worker loop: drain batches back to back, sleeping only when the sink's queue runs dry"""
+        while not self._stopping.is_set():
+            try:
+                delivered, failed = drain(self)
+            except Exception as e:
+                print(f"Error delivering notifications to {self.sink.name}: {e}")
+                delivered = failed = 0
+            if delivered + failed < self.batch_size:
+                self._stopping.wait(self.poll_interval)
+    
+    def send(self, entries):
+        """
+        Deliver entries to the sink now, on the calling thread.
+        
+        The batch is sent once; if that fails each entry is tried on its
+        own, so one bad entry doesn't fail the rest. There is no retry or
+        backoff here - the caller keeps failed entries and retries later.
+        
+        Args:
+            entries (list): Entry dicts with 'timestamp' and 'message'
+        
+        Returns:
+            list: Per entry, None if delivered, otherwise the exception
+        """
+        if not entries:
+            return []
+        started = time.monotonic()
+        try:
+            self.sink.send_batch(entries)
+            errors = [None] * len(entries)
+        except Exception as e:
+            errors = [e]
+            if len(entries) > 1:
+                errors = []
+                for entry in entries:
+                    try:
+                        self.sink.send_batch([entry])
+                        errors.append(None)
+                    except Exception as entry_error:
+                        errors.append(entry_error)
+        
+        failed = sum(error is not None for error in errors)
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self.written += len(entries) - failed
+            self.failed += failed
+            self.batches += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+        return errors
+    
+    def shutdown(self, timeout=5.0):
+        """
+        Stop the workers after their current batch and close the sink.
+        
+        Args:
+            timeout (float): Max seconds to wait for the workers to finish
+        """
+        self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(max(0.0, deadline - time.monotonic()))
+        self.sink.close()
+    
+    def stats(self):
+        """
+        Get dispatcher metrics.
+        
+        Returns:
+            dict: Write/failure counters and flush latency
+        """
+        with self._lock:
+            return {
+                'sink': self.sink.name,
+                'workers': self.workers,
+                'written': self.written,
+                'failed': self.failed,
+                'batches': self.batches,
+                'last_flush_ms': round(self.last_flush_ms, 3),
+                'max_flush_ms': round(self.max_flush_ms, 3),
+                'avg_flush_ms': round(self._total_flush_ms / self.batches, 3) if self.batches else 0.0,
+            }
+
+
+class NotificationHub:
+    """The configured sinks, one dispatcher each"""
+    def __init__(self, dispatchers=None):
+        self.dispatchers = list(dispatchers or [])
+    
+    def add(self, dispatcher):
+        self.dispatchers.append(dispatcher)
+    
+    def sink_names(self):
+        """Names of the configured sinks, in the order they were added"""
+        return [dispatcher.sink.name for dispatcher in self.dispatchers]
+    
+    def start(self, drain):
+        """Start every sink's workers with the same drain function"""
+        for dispatcher in self.dispatchers:
+            dispatcher.start(drain)
+    
+    def shutdown(self, timeout=5.0):
+        """Stop every sink's workers"""
+        for dispatcher in self.dispatchers:
+            dispatcher.shutdown(timeout)
+    
+    def stats(self):
+        """Per-sink dispatcher metrics keyed by sink name"""
+        return {dispatcher.sink.name: dispatcher.stats() for dispatcher in self.dispatchers}
+
+
+def build_hub_from_env():
+    """
+    Build the notification hub from environment configuration.
+    
+    The structured log sink is always enabled; the webhook and SMTP sinks are added
+    when NOTIFICATION_WEBHOOK_URL / NOTIFICATION_SMTP_HOST are set.
+    
+    Returns:
+        NotificationHub: Hub with one dispatcher per configured sink
+    """
+    env = os.environ.get
+    hub = NotificationHub()
+    
+    hub.add(NotificationDispatcher(
+        StructuredLogSink(notification_log),
+        workers=1,  # single writer keeps the log in order
+        batch_size=int(env('NOTIFICATION_BATCH_SIZE', 200))
+    ))
+    
+    if env('NOTIFICATION_WEBHOOK_URL'):
+        hub.add(NotificationDispatcher(
+            WebhookSink(env('NOTIFICATION_WEBHOOK_URL'), timeout=float(env('NOTIFICATION_WEBHOOK_TIMEOUT', 5))),
+            workers=int(env('NOTIFICATION_WEBHOOK_WORKERS', 2)),
+            batch_size=int(env('NOTIFICATION_WEBHOOK_BATCH_SIZE', 50))
+        ))
+    
+    if env('NOTIFICATION_SMTP_HOST'):
+        hub.add(NotificationDispatcher(
+            SmtpSink(
+                env('NOTIFICATION_SMTP_HOST'),
+                int(env('NOTIFICATION_SMTP_PORT', 25)),
+                env('NOTIFICATION_SMTP_FROM', 'orders@localhost'),
+                [r.strip() for r in env('NOTIFICATION_SMTP_TO', '').split(',') if r.strip()],
+                username=env('NOTIFICATION_SMTP_USERNAME'),
+                password=env('NOTIFICATION_SMTP_PASSWORD'),
+                use_tls=env('NOTIFICATION_SMTP_TLS', '').lower() == 'true'
+            ),
+            workers=int(env('NOTIFICATION_SMTP_WORKERS', 1)),
+            batch_size=int(env('NOTIFICATION_SMTP_BATCH_SIZE', 100)),
+            # Collect a few seconds of entries into each digest email
+            poll_interval=float(env('NOTIFICATION_SMTP_FLUSH_INTERVAL', 5))
+        ))
+    
+    return hub
+
+
+# Global structured log - also queried for per-order timelines. The
+# directory is created on the first write, by the log sink's worker
+notification_log = NotificationLog(
+    get_log_dir(),
+    max_bytes=int(os.environ.get('NOTIFICATION_LOG_MAX_BYTES', 10 * 1024 * 1024)),
+    max_age=int(os.environ.get('NOTIFICATION_LOG_MAX_AGE', 24 * 3600)),
+    max_segments=int(os.environ.get('NOTIFICATION_LOG_MAX_SEGMENTS', 0)) or None,
+    fsync_policy=os.environ.get('NOTIFICATION_FSYNC', 'interval'),
+    fsync_interval=float(os.environ.get('NOTIFICATION_FSYNC_INTERVAL', 1.0)),
+    index_cache_segments=int(os.environ.get('NOTIFICATION_LOG_INDEX_CACHE_SEGMENTS', 8))
+)
+
+# Global hub - sink worker threads are started by the outbox worker
+hub = build_hub_from_env()
+atexit.register(hub.shutdown)
+
+
+def notification_entry(message, **fields):
+    """
+    Build a notification entry.
     
     Args:
         message (str): Notification message to log
+        **fields: Structured data stored with the entry, e.g. event and
+            order_id (entries with an order_id are indexed for timelines)
+    
+    Returns:
+        dict: Entry with 'timestamp', 'message' and the fields
     """
-    try:
-        log_file = get_log_file()
-        timestamp = datetime.utcnow().isoformat()
-        log_entry = f"[{timestamp}] {message}\n"
-        
-        with open(log_file, 'a') as f:
-            f.write(log_entry)
-    except Exception as e:
-        print(f"Error logging notification: {e}")
+    return {
+        'timestamp': datetime.utcnow().isoformat(),
+        'message': message,
+        **fields
+    }
 
 
-def notify_order_confirmation(order, user):
+def get_order_timeline(order_id):
     """
-    Send order confirmation notification.
+    Get the logged notifications for one order, oldest first.
+    
+    Args:
+        order_id (int): Order id
+    
+    Returns:
+        list: Entry dicts with timestamp, message, event and event data
+    """
+    return notification_log.timeline(order_id)
+
+
+def order_confirmation_entry(order, user):
+    """
+    Build the order confirmation notification.
     
     Args:
         order: Order object
         user: User object
+    
+    Returns:
+        dict: Notification entry
     """
     message = (
         f"ORDER_CREATED | Order #{order.id} confirmed for {user.email} | "
         f"Total: ${order.total_price:.2f} | Status: {order.status.value}"
     )
-    log_notification(message)
+    return notification_entry(
+        message,
+        event='ORDER_CREATED',
+        order_id=order.id,
+        email=user.email,
+        total=round(order.total_price, 2),
+        status=order.status.value
+    )
 
 
-def notify_status_change(order, old_status, new_status):
+def status_change_entry(order, old_status, new_status):
     """
-    Send order status change notification.
+    Build the order status change notification.
     
     Args:
         order: Order object
         old_status: Previous status
         new_status: New status
+    
+    Returns:
+        dict: Notification entry
     """
     message = (
         f"ORDER_STATUS_UPDATED | Order #{order.id} | "
         f"{old_status.value.upper()} → {new_status.value.upper()}"
     )
-    log_notification(message)
-
-
-def notify_order_delivery(order, user):
-    """
-    Send order delivered notification.
-    
-    Args:
-        order: Order object
-        user: User object
-    """
-    message = (
-        f"ORDER_DELIVERED | Order #{order.id} delivered to {user.email} | "
-        f"Total: ${order.total_price:.2f}"
+    return notification_entry(
+        message,
+        event='ORDER_STATUS_UPDATED',
+        order_id=order.id,
+        old_status=old_status.value,
+        new_status=new_status.value
     )
-    log_notification(message)
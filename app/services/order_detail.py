@@ -0,0 +1,32 @@
+"""Order detail read model shared by the customer and admin order pages"""
+from sqlalchemy.orm import joinedload, selectinload
+from database.models import Order
+
+
+def load_order_detail(session, order_id, user_id=None):
+    """
+    Load an order with everything its detail pages show.
+
+    The restaurant, payment and customer are joined into the order query
+    and the items are fetched with one SELECT ... IN, so rendering the page
+    takes two queries and no lazy loads.
+
+    Args:
+        session: Database session (keep it open while rendering)
+        order_id: ID of the order
+        user_id: If given, only return the order when this user owns it
+
+    Returns:
+        Order or None: Order with restaurant, payment, user and items loaded
+    """
+    query = session.query(Order).options(
+        joinedload(Order.restaurant),
+        joinedload(Order.payment),
+        joinedload(Order.user),
+        selectinload(Order.items)
+    ).filter(Order.id == order_id)
+
+    if user_id is not None:
+        query = query.filter(Order.user_id == user_id)
+
+    return query.first()
@@ -0,0 +1,188 @@
+"""Order status history and per-restaurant stage-duration analytics"""
+import bisect
+import math
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select, func
+from database.models import OrderStatus, OrderStatusEvent, OrderStageRollup
+
+# Upper bounds in seconds of the duration histogram buckets: 1s, growing by
+# 25% per bucket up to a week. A duration above the last bound lands in an
+# extra overflow bucket. Percentiles read from the histogram are within one
+# bucket (25%) of the exact value.
+BUCKET_GROWTH = 1.25
+BUCKET_BOUNDS = []
+_bound = 1.0
+while _bound < 7 * 24 * 3600:
+    BUCKET_BOUNDS.append(round(_bound, 3))
+    _bound *= BUCKET_GROWTH
+
+# Stages an order leaves again, i.e. the ones with a duration
+STAGES = (OrderStatus.PENDING, OrderStatus.CONFIRMED, OrderStatus.PREPARING, OrderStatus.READY)
+
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+
+def bucket_for(seconds):
+    """Index of the histogram bucket holding a duration"""
+    return bisect.bisect_left(BUCKET_BOUNDS, seconds)
+
+
+def hour_of(moment):
+    """Start of the hour a datetime falls in"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert_rollups(session, counts):
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise RuntimeError(f'Stage rollups do not support {dialect}')
+
+    statement = dialect_insert(OrderStageRollup)
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=['restaurant_id', 'stage', 'hour', 'bucket'],
+            set_={'count': OrderStageRollup.count + statement.excluded.count}
+        ),
+        [
+            {'restaurant_id': restaurant_id, 'stage': stage, 'hour': hour, 'bucket': bucket, 'count': count}
+            for (restaurant_id, stage, hour, bucket), count in counts.items()
+        ]
+    )
+
+
+def record_created(session, order):
+    """
+    Add the history row for a newly placed order to the caller's transaction.
+
+    Args:
+        session: Open SQLAlchemy session (not committed here)
+        order: The new Order (flushed, so it has an id)
+    """
+    session.add(OrderStatusEvent(
+        order_id=order.id,
+        restaurant_id=order.restaurant_id,
+        to_status=order.status or OrderStatus.PENDING,
+        created_at=order.status_changed_at or datetime.utcnow()
+    ))
+
+
+def record_transitions(session, results, changed_at):
+    """
+    Append history rows and update the stage rollups for status changes.
+
+    Called by order_state in the transaction that made the changes: one
+    multi-row INSERT for the events and one upsert for the rollups,
+    however many orders changed.
+
+    Args:
+        session: Open SQLAlchemy session (not committed here)
+        results: Successful order_state.TransitionResult objects
+        changed_at: Time the changes were made
+
+    Returns:
+        int: Number of events recorded
+    """
+    events = []
+    counts = {}
+    hour = hour_of(changed_at)
+    for result in results:
+        stage_seconds = None
+        if result.old_status_since is not None:
+            stage_seconds = max((changed_at - result.old_status_since).total_seconds(), 0.0)
+            key = (result.restaurant_id, result.old_status, hour, bucket_for(stage_seconds))
+            counts[key] = counts.get(key, 0) + 1
+        events.append({
+            'order_id': result.order_id,
+            'restaurant_id': result.restaurant_id,
+            'from_status': result.old_status,
+            'to_status': result.new_status,
+            'stage_seconds': stage_seconds,
+            'created_at': changed_at
+        })
+
+    if events:
+        session.execute(insert(OrderStatusEvent), events)
+    if counts:
+        _upsert_rollups(session, counts)
+    return len(events)
+
+
+def _percentile(histogram, total, percentile):
+    """Estimate a percentile from {bucket: count}, interpolating within the bucket"""
+    rank = max(math.ceil(percentile / 100 * total), 1)
+    seen = 0
+    for bucket in sorted(histogram):
+        count = histogram[bucket]
+        if seen + count >= rank:
+            lower = BUCKET_BOUNDS[bucket - 1] if bucket > 0 else 0.0
+            upper = BUCKET_BOUNDS[bucket] if bucket < len(BUCKET_BOUNDS) else BUCKET_BOUNDS[-1]
+            return round(lower + (upper - lower) * (rank - seen) / count, 1)
+        seen += count
+    return None
+
+
+def _summarize(histograms, percentiles):
+    summary = {}
+    for stage in STAGES:
+        histogram = histograms.get(stage)
+        if not histogram:
+            continue
+        total = sum(histogram.values())
+        stats = {'count': total}
+        for percentile in percentiles:
+            stats[f'p{percentile}'] = _percentile(histogram, total, percentile)
+        summary[stage.value] = stats
+    return summary
+
+
+def stage_durations(session, restaurant_id, since, until=None, interval=None, percentiles=DEFAULT_PERCENTILES):
+    """
+    Per-stage duration percentiles for one restaurant, from the rollups.
+
+    Resolution is one hour: a stage counts towards the hour it ended in.
+
+    Args:
+        session: Open SQLAlchemy session
+        restaurant_id: ID of the restaurant
+        since: Start of the window (rounded down to the hour)
+        until: End of the window (defaults to now)
+        interval: Optional timedelta (whole hours) to also split the window
+            into a series of consecutive intervals
+        percentiles: Percentiles to report
+
+    Returns:
+        dict: {'stages': {stage: {'count', 'p50', ...}}, 'series': [...]}
+            with durations in seconds; 'series' only when interval is given,
+            one {'start', 'stages'} entry per interval
+    """
+    since = hour_of(since)
+    until = until or datetime.utcnow()
+    rows = session.execute(
+        select(OrderStageRollup.stage, OrderStageRollup.hour, OrderStageRollup.bucket,
+               func.sum(OrderStageRollup.count))
+        .where(OrderStageRollup.restaurant_id == restaurant_id,
+               OrderStageRollup.hour >= since, OrderStageRollup.hour < until)
+        .group_by(OrderStageRollup.stage, OrderStageRollup.hour, OrderStageRollup.bucket)
+    ).all()
+
+    overall = {}
+    slots = {}
+    for stage, hour, bucket, count in rows:
+        histogram = overall.setdefault(stage, {})
+        histogram[bucket] = histogram.get(bucket, 0) + count
+        if interval:
+            slot = int((hour - since) / interval)
+            histogram = slots.setdefault(slot, {}).setdefault(stage, {})
+            histogram[bucket] = histogram.get(bucket, 0) + count
+
+    result = {'stages': _summarize(overall, percentiles)}
+    if interval:
+        result['series'] = [
+            {'start': (since + interval * slot).isoformat(), 'stages': _summarize(slots.get(slot, {}), percentiles)}
+            for slot in range(max(math.ceil((until - since) / interval), 1))
+        ]
+    return result
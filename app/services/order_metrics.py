@@ -0,0 +1,71 @@
+"""Order and review lifecycle counters fed by domain events"""
+import threading
+from app.services.events import (
+    bus, OrderCreated, OrderStatusChanged, OrderCancelled, ReviewSubmitted
+)
+
+
+class LifecycleCounters:
+    """
+    Running counts of order and review activity.
+
+    Fed by async bus subscribers, so the counting never adds latency to the
+    order and review handlers. Counts are per worker process and start from
+    zero on restart; the database stays the source of truth for totals.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.orders_created = 0
+            self.revenue = 0.0
+            self.transitions = {}
+            self.cancelled_from = {}
+            self.ratings = {}
+
+    def order_created(self, event):
+        with self._lock:
+            self.orders_created += 1
+            self.revenue += float(event.total_price)
+
+    def status_changed(self, event):
+        transition = f'{event.old_status}->{event.new_status}'
+        with self._lock:
+            self.transitions[transition] = self.transitions.get(transition, 0) + 1
+
+    def order_cancelled(self, event):
+        with self._lock:
+            self.cancelled_from[event.old_status] = self.cancelled_from.get(event.old_status, 0) + 1
+
+    def review_submitted(self, event):
+        with self._lock:
+            self.ratings[event.rating] = self.ratings.get(event.rating, 0) + 1
+
+    def snapshot(self):
+        """
+        Get the current counts.
+
+        Returns:
+            dict: Orders created, revenue, status transitions, cancellations
+                by the status they left and reviews by rating
+        """
+        with self._lock:
+            return {
+                'orders_created': self.orders_created,
+                'revenue': round(self.revenue, 2),
+                'transitions': dict(self.transitions),
+                'cancelled_from': dict(self.cancelled_from),
+                'reviews_by_rating': dict(self.ratings),
+            }
+
+
+# Global counters - per worker process
+lifecycle = LifecycleCounters()
+
+bus.subscribe(OrderCreated, lifecycle.order_created, mode='async', name='order_metrics.created')
+bus.subscribe(OrderStatusChanged, lifecycle.status_changed, mode='async', name='order_metrics.status')
+bus.subscribe(OrderCancelled, lifecycle.order_cancelled, mode='async', name='order_metrics.cancelled')
+bus.subscribe(ReviewSubmitted, lifecycle.review_submitted, mode='async', name='order_metrics.review')
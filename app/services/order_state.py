@@ -0,0 +1,207 @@
+"""Order status state machine - each transition is one conditional UPDATE"""
+from datetime import datetime
+from sqlalchemy import select, update, func
+from database.models import Order, OrderStatus
+from app.services import order_history
+
+OK = 'ok'
+NOT_FOUND = 'not_found'
+CONFLICT = 'conflict'
+
+# Target status -> statuses an order may move to it from
+ALLOWED_SOURCES = {
+    OrderStatus.CONFIRMED: frozenset({OrderStatus.PENDING}),
+    OrderStatus.PREPARING: frozenset({OrderStatus.CONFIRMED}),
+    OrderStatus.READY: frozenset({OrderStatus.PREPARING}),
+    OrderStatus.DELIVERED: frozenset({OrderStatus.READY}),
+    OrderStatus.CANCELLED: frozenset({OrderStatus.PENDING, OrderStatus.CONFIRMED, OrderStatus.PREPARING}),
+}
+
+
+def can_transition(old_status, new_status):
+    """Whether the workflow allows moving from old_status to new_status"""
+    return old_status in ALLOWED_SOURCES.get(new_status, ())
+
+
+class TransitionResult:
+    """
+    Outcome of transition().
+
+    Attributes:
+        outcome: OK, NOT_FOUND or CONFLICT
+        order_id: ID of the order
+        old_status: Status the order moved from (OK only)
+        old_status_since: When the order had entered old_status (OK only)
+        restaurant_id: Restaurant of the order (OK only)
+        new_status: Status that was requested
+        current_status: Status the order has now (None if not found)
+        version: Order version now (None if not found)
+    """
+
+    def __init__(self, outcome, order_id, new_status, old_status=None, current_status=None, version=None,
+                 old_status_since=None, restaurant_id=None):
+        self.outcome = outcome
+        self.order_id = order_id
+        self.new_status = new_status
+        self.old_status = old_status
+        self.old_status_since = old_status_since
+        self.restaurant_id = restaurant_id
+        self.current_status = current_status
+        self.version = version
+
+    @property
+    def ok(self):
+        return self.outcome == OK
+
+    @property
+    def stale(self):
+        """A conflict only because the order changed since the caller looked"""
+        return (self.outcome == CONFLICT and self.current_status != self.new_status
+                and can_transition(self.current_status, self.new_status))
+
+    @property
+    def message(self):
+        """Human-readable explanation, for flashes and JSON responses"""
+        if self.outcome == OK:
+            return 'Status updated'
+        if self.outcome == NOT_FOUND:
+            return 'Order not found'
+        if self.stale:
+            return 'Order was changed by someone else; reload and try again'
+        if self.current_status == self.new_status:
+            return 'Status unchanged'
+        return f'Cannot transition from {self.current_status.value} to {self.new_status.value}'
+
+    def __repr__(self):
+        return f'<TransitionResult {self.order_id} {self.outcome}>'
+
+
+# What a successful UPDATE hands back (new values, apart from the previous_* copies)
+_RETURNED = (Order.id, Order.restaurant_id, Order.previous_status, Order.previous_status_since, Order.version)
+
+
+def _sources(new_status, allowed_from):
+    sources = ALLOWED_SOURCES.get(new_status, frozenset())
+    if allowed_from is not None:
+        sources = sources & frozenset(allowed_from)
+    return sources
+
+
+def _update(conditions, new_status, now):
+    return update(Order).where(*conditions).values(
+        status=new_status,
+        # SET sees the row as it was, so these keep the stage being left
+        previous_status=Order.status,
+        previous_status_since=func.coalesce(Order.status_changed_at, Order.created_at),
+        status_changed_at=now,
+        version=Order.version + 1
+    ).execution_options(synchronize_session=False)
+
+
+def _ok(row, new_status):
+    order_id, restaurant_id, old_status, old_status_since, version = row
+    return TransitionResult(OK, order_id, new_status, old_status=old_status, current_status=new_status,
+                            version=version, old_status_since=old_status_since, restaurant_id=restaurant_id)
+
+
+def transition(session, order_id, new_status, allowed_from=None, user_id=None, expected_version=None):
+    """
+    Move an order to a new status if the workflow allows it.
+
+    The check and the write are a single UPDATE ... WHERE status IN (...),
+    so of two concurrent requests for the same order exactly one wins and
+    the other gets a CONFLICT - there is no read-then-write window. The
+    winner bumps the order's version, records the status it left in
+    previous_status and appends to the order's status history. Only a
+    failed transition costs a second query, to tell NOT_FOUND from CONFLICT.
+
+    Nothing is committed; the caller commits (together with any outbox
+    rows) or rolls back.
+
+    Args:
+        session: Open SQLAlchemy session
+        order_id: ID of the order
+        new_status: Target OrderStatus
+        allowed_from: Optional statuses to further restrict the sources to
+            (e.g. customers may only cancel PENDING orders)
+        user_id: If given, only an order owned by this user is changed
+        expected_version: If given, fail with CONFLICT unless the order is
+            still at this version
+
+    Returns:
+        TransitionResult
+    """
+    sources = _sources(new_status, allowed_from)
+    conditions = [Order.id == order_id]
+    if user_id is not None:
+        conditions.append(Order.user_id == user_id)
+
+    if sources:
+        guarded = conditions + [Order.status.in_(sources)]
+        if expected_version is not None:
+            guarded.append(Order.version == expected_version)
+        now = datetime.utcnow()
+        statement = _update(guarded, new_status, now)
+
+        if session.get_bind().dialect.update_returning:
+            row = session.execute(statement.returning(*_RETURNED)).first()
+        else:
+            # No RETURNING (SQLite < 3.35): our UPDATE holds the row, so reading it back is safe
+            row = None
+            if session.execute(statement).rowcount:
+                row = session.execute(select(*_RETURNED).where(Order.id == order_id)).first()
+        if row is not None:
+            result = _ok(row, new_status)
+            order_history.record_transitions(session, [result], now)
+            return result
+
+    row = session.execute(select(Order.status, Order.version).where(*conditions)).first()
+    if row is None:
+        return TransitionResult(NOT_FOUND, order_id, new_status)
+    return TransitionResult(CONFLICT, order_id, new_status, current_status=row[0], version=row[1])
+
+
+def transition_many(session, order_ids, new_status, allowed_from=None):
+    """
+    Move many orders to the same status, each only if the workflow allows it.
+
+    All eligible orders are changed by one UPDATE ... WHERE id IN (...) AND
+    status IN (...) RETURNING, and the ones it skipped are explained by one
+    SELECT, so the cost doesn't grow with round trips per order. Each order
+    still wins or loses atomically, exactly as with transition().
+
+    Nothing is committed; the caller commits or rolls back.
+
+    Args:
+        session: Open SQLAlchemy session
+        order_ids: IDs of the orders (duplicates are ignored)
+        new_status: Target OrderStatus
+        allowed_from: Optional statuses to further restrict the sources to
+
+    Returns:
+        list: TransitionResult per distinct order id, in the order given
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    if not order_ids:
+        return []
+
+    if not session.get_bind().dialect.update_returning:
+        return [transition(session, order_id, new_status, allowed_from) for order_id in order_ids]
+
+    sources = _sources(new_status, allowed_from)
+    results = {}
+    if sources:
+        now = datetime.utcnow()
+        statement = _update([Order.id.in_(order_ids), Order.status.in_(sources)], new_status, now)
+        for row in session.execute(statement.returning(*_RETURNED)):
+            results[row[0]] = _ok(row, new_status)
+        order_history.record_transitions(session, list(results.values()), now)
+
+    missed = [order_id for order_id in order_ids if order_id not in results]
+    if missed:
+        rows = session.execute(select(Order.id, Order.status, Order.version).where(Order.id.in_(missed)))
+        for order_id, status, version in rows:
+            results[order_id] = TransitionResult(CONFLICT, order_id, new_status,
+                                                 current_status=status, version=version)
+
+    return [results.get(order_id) or TransitionResult(NOT_FOUND, order_id, new_status) for order_id in order_ids]
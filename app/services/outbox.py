@@ -0,0 +1,325 @@
+"""Transactional outbox for order events"""
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert
+from sqlalchemy.orm import joinedload
+from database.models import Order, OrderStatus, OutboxEvent, OutboxDelivery
+from app.services import notifications
+
+ORDER_CREATED = 'ORDER_CREATED'
+ORDER_STATUS_CHANGED = 'ORDER_STATUS_CHANGED'
+ORDER_CANCELLED = 'ORDER_CANCELLED'
+
+# Delay before retrying a failed delivery, doubled per attempt up to the cap
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 600
+
+# Failed attempts after which an event or delivery is dead-lettered (dead_at set)
+MAX_ATTEMPTS = 10
+
+
+def record_order_event(session, event_type, order, **details):
+    """
+    Add an outbox row to the caller's transaction.
+
+    The row commits (or rolls back) together with the order change, so the
+    notification can't be lost between commit and send.
+
+    Args:
+        session: Open SQLAlchemy session (not committed here)
+        event_type: One of ORDER_CREATED, ORDER_STATUS_CHANGED, ORDER_CANCELLED
+        order: Order the event is about (must have an id, i.e. be flushed),
+            or just its id
+        **details: JSON-serializable event data, e.g. old_status/new_status
+
+    Returns:
+        OutboxEvent: The pending row
+    """
+    event = OutboxEvent(
+        event_type=event_type,
+        order_id=getattr(order, 'id', order),
+        payload=json.dumps(details)
+    )
+    session.add(event)
+    return event
+
+
+def record_order_events(session, event_type, events):
+    """
+    Add outbox rows for many orders to the caller's transaction at once.
+
+    Written as one multi-row INSERT, for bulk changes.
+
+    Args:
+        session: Open SQLAlchemy session (not committed here)
+        event_type: One of ORDER_CREATED, ORDER_STATUS_CHANGED, ORDER_CANCELLED
+        events: Iterable of (order_id, details) pairs, details being a
+            JSON-serializable dict
+
+    Returns:
+        int: Number of rows added
+    """
+    rows = [
+        {'event_type': event_type, 'order_id': order_id, 'payload': json.dumps(details)}
+        for order_id, details in events
+    ]
+    if rows:
+        session.execute(insert(OutboxEvent), rows)
+    return len(rows)
+
+
+def claim_batch(session, batch_size=100, now=None):
+    """
+    Lock a batch of pending events for delivery.
+
+    On PostgreSQL rows are claimed with FOR UPDATE SKIP LOCKED, so several
+    workers can drain the outbox concurrently without double-claiming.
+
+    Args:
+        session: Open SQLAlchemy session; locks are held until it commits
+        batch_size: Max events to claim
+        now: Current time (defaults to utcnow)
+
+    Returns:
+        list: OutboxEvent rows in creation order
+    """
+    now = now or datetime.utcnow()
+    return session.query(OutboxEvent).filter(
+        OutboxEvent.delivered_at.is_(None),
+        OutboxEvent.dead_at.is_(None),
+        OutboxEvent.available_at <= now
+    ).order_by(OutboxEvent.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+
+def event_entry(event, order):
+    """
+    Build the notification entry for one outbox event.
+
+    Args:
+        event: OutboxEvent row
+        order: The event's Order, with its user loaded
+
+    Returns:
+        dict: Notification entry
+    """
+    details = json.loads(event.payload or '{}')
+
+    if event.event_type == ORDER_CREATED:
+        return notifications.order_confirmation_entry(order, order.user)
+    if event.event_type in (ORDER_STATUS_CHANGED, ORDER_CANCELLED):
+        return notifications.status_change_entry(
+            order,
+            OrderStatus(details['old_status']),
+            OrderStatus(details['new_status'])
+        )
+    raise ValueError(f'Unknown outbox event type: {event.event_type}')
+
+
+def _retry_later(row, error, now):
+    """Record a failed attempt on an event or delivery: back off, or dead-letter after MAX_ATTEMPTS"""
+    row.attempts += 1
+    row.last_error = str(error)
+    if row.attempts >= MAX_ATTEMPTS:
+        row.dead_at = now
+    else:
+        delay = min(RETRY_BASE_SECONDS * 2 ** (row.attempts - 1), RETRY_MAX_SECONDS)
+        row.available_at = now + timedelta(seconds=delay)
+
+
+def drain_once(session_factory, batch_size=100, sinks=None):
+    """
+    Claim one batch of outbox events and hand them to every sink.
+
+    Orders for the whole batch are loaded with a single query. Each event
+    is rendered into a notification entry once and queued for each sink as
+    an OutboxDelivery row, in the same transaction that marks the event
+    delivered, so nothing is sent here and a slow sink can't hold up the
+    hand-off. Events that can't be rendered stay pending with a backoff
+    delay; after MAX_ATTEMPTS they are dead-lettered.
+
+    Args:
+        session_factory: Callable returning a new SQLAlchemy session
+        batch_size: Max events per batch
+        sinks: Sink names to queue deliveries for (defaults to the
+            configured notification sinks)
+
+    Returns:
+        tuple: (handed-off count, failed count)
+    """
+    if sinks is None:
+        sinks = notifications.hub.sink_names()
+
+    session = session_factory()
+    try:
+        now = datetime.utcnow()
+        events = claim_batch(session, batch_size, now)
+        if not events:
+            session.commit()
+            return 0, 0
+
+        order_ids = {event.order_id for event in events}
+        orders = {
+            order.id: order
+            for order in session.query(Order).options(joinedload(Order.user)).filter(Order.id.in_(order_ids))
+        }
+
+        handed_off = failed = 0
+        deliveries = []
+        for event in events:
+            try:
+                order = orders.get(event.order_id)
+                if order is None:
+                    raise LookupError(f'Order {event.order_id} not found')
+                entry = json.dumps(event_entry(event, order))
+            except Exception as e:
+                _retry_later(event, e, now)
+                failed += 1
+                continue
+            deliveries.extend(
+                {'outbox_id': event.id, 'sink': sink, 'entry': entry, 'available_at': now}
+                for sink in sinks
+            )
+            event.delivered_at = now
+            handed_off += 1
+
+        if deliveries:
+            session.execute(insert(OutboxDelivery), deliveries)
+        session.commit()
+        return handed_off, failed
+
+    except Exception:
+        session.rollback()
+        raise
+
+    finally:
+        session.close()
+
+
+def claim_deliveries(session, sink, batch_size=100, now=None):
+    """
+    Lock a batch of one sink's pending deliveries (FOR UPDATE SKIP LOCKED on PostgreSQL).
+
+    Args:
+        session: Open SQLAlchemy session; locks are held until it commits
+        sink: Sink name
+        batch_size: Max deliveries to claim
+        now: Current time (defaults to utcnow)
+
+    Returns:
+        list: OutboxDelivery rows in creation order
+    """
+    now = now or datetime.utcnow()
+    return session.query(OutboxDelivery).filter(
+        OutboxDelivery.sink == sink,
+        OutboxDelivery.delivered_at.is_(None),
+        OutboxDelivery.dead_at.is_(None),
+        OutboxDelivery.available_at <= now
+    ).order_by(OutboxDelivery.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+
+def deliver_once(session_factory, dispatcher, batch_size=None):
+    """
+    Claim and send one batch of a sink's pending deliveries.
+
+    Only this sink's rows are touched: entries it rejected stay pending
+    with a backoff delay (and are dead-lettered after MAX_ATTEMPTS) while
+    other sinks' copies are unaffected.
+
+    Args:
+        session_factory: Callable returning a new SQLAlchemy session
+        dispatcher: NotificationDispatcher for the sink
+        batch_size: Max deliveries per batch (defaults to the dispatcher's)
+
+    Returns:
+        tuple: (delivered count, failed count)
+    """
+    session = session_factory()
+    try:
+        now = datetime.utcnow()
+        rows = claim_deliveries(session, dispatcher.sink.name, batch_size or dispatcher.batch_size, now)
+        if not rows:
+            session.commit()
+            return 0, 0
+
+        delivered = failed = 0
+        errors = dispatcher.send([json.loads(row.entry) for row in rows])
+        for row, error in zip(rows, errors):
+            if error is None:
+                row.delivered_at = now
+                delivered += 1
+            else:
+                _retry_later(row, error, now)
+                failed += 1
+
+        session.commit()
+        return delivered, failed
+
+    except Exception:
+        session.rollback()
+        raise
+
+    finally:
+        session.close()
+
+
+def start_delivery(session_factory, hub=None):
+    """
+    Start every sink's dispatcher threads on its pending deliveries.
+
+    Each sink drains only its own rows, so a blocked sink holds up nothing
+    but its own deliveries. Stop them with hub.shutdown().
+
+    Args:
+        session_factory: Callable returning a new SQLAlchemy session
+        hub: NotificationHub (defaults to the configured one)
+    """
+    (hub or notifications.hub).start(lambda dispatcher: deliver_once(session_factory, dispatcher))
+
+
+def pending_count(session):
+    """Number of events waiting to be handed to the sinks"""
+    return session.query(OutboxEvent).filter(
+        OutboxEvent.delivered_at.is_(None), OutboxEvent.dead_at.is_(None)
+    ).count()
+
+
+def dead_count(session):
+    """Number of dead-lettered events and sink deliveries"""
+    return (
+        session.query(OutboxEvent).filter(OutboxEvent.dead_at.isnot(None)).count()
+        + session.query(OutboxDelivery).filter(OutboxDelivery.dead_at.isnot(None)).count()
+    )
+
+
+def delivery_counts(session):
+    """
+    Pending and dead-lettered deliveries per sink.
+
+    Returns:
+        dict: {sink: {'pending': n, 'dead': n}}
+    """
+    counts = {}
+    rows = session.query(
+        OutboxDelivery.sink, OutboxDelivery.dead_at.isnot(None), func.count()
+    ).filter(OutboxDelivery.delivered_at.is_(None)).group_by(
+        OutboxDelivery.sink, OutboxDelivery.dead_at.isnot(None)
+    )
+    for sink, dead, count in rows:
+        counts.setdefault(sink, {'pending': 0, 'dead': 0})['dead' if dead else 'pending'] += count
+    return counts
+
+
+def requeue_dead(session, now=None):
+    """
+    Make dead-lettered events and deliveries pending again, e.g. after fixing a sink.
+
+    Nothing is committed; the caller commits.
+
+    Returns:
+        int: Number of rows requeued
+    """
+    values = {'dead_at': None, 'attempts': 0, 'available_at': now or datetime.utcnow()}
+    return sum(
+        session.query(model).filter(model.dead_at.isnot(None)).update(values, synchronize_session=False)
+        for model in (OutboxEvent, OutboxDelivery)
+    )
@@ -0,0 +1,229 @@
+"""In-memory menu price index - the server's source of truth for cart prices"""
+import os
+import threading
+import time
+from database.postgres import SessionLocal
+from database.models import Restaurant
+from database.firestore import firestore_db, FirestoreUnavailable
+from app.services.cart import to_cents
+from app.services.events import bus, MenuChanged
+
+# MenuChanged invalidation is per process, so other workers can serve a
+# changed menu's old prices for up to this long
+DEFAULT_TTL = 60
+
+
+class MenuUnavailable(Exception):
+    """The restaurant's menu couldn't be loaded, so prices can't be checked"""
+    pass
+
+
+class UnknownRestaurant(LookupError):
+    """There is no restaurant with this id"""
+    pass
+
+
+def load_menu(restaurant_id):
+    """
+    Load a restaurant's menu from the menu source (Firestore or seed data).
+
+    Args:
+        restaurant_id: Restaurant primary key
+
+    Returns:
+        dict or None: {item_id: (name, price_cents)} (empty for a
+            restaurant without a menu), or None if the restaurant doesn't exist
+
+    Raises:
+        MenuUnavailable: If the database or Firestore read failed, or the
+            restaurant has no slug yet (initialize.py backfills them)
+    """
+    try:
+        restaurant_id = int(restaurant_id)
+    except (TypeError, ValueError):
+        return None
+
+    session = SessionLocal()
+    try:
+        restaurant = session.query(Restaurant).filter_by(id=restaurant_id).first()
+    except Exception as e:
+        raise MenuUnavailable(f'Restaurant {restaurant_id} could not be looked up: {e}') from e
+    finally:
+        session.close()
+
+    if restaurant is None:
+        return None
+    if not restaurant.slug:
+        # Its menu is keyed by a slug it doesn't have yet; an empty menu
+        # here would make checkout drop every line
+        raise MenuUnavailable(f'Restaurant {restaurant_id} has no slug')
+    try:
+        items = firestore_db.read_menu_items(restaurant.slug)
+    except FirestoreUnavailable as e:
+        raise MenuUnavailable(str(e)) from e
+    return {
+        str(item['id']): (item.get('name'), to_cents(item.get('price') or 0))
+        for item in items
+        if item.get('id') is not None
+    }
+
+
+class MenuPriceIndex:
+    """
+    Per-restaurant item_id -> (name, price_cents) maps, loaded on first use.
+
+    Each restaurant's menu is read once per `ttl` seconds (and again after a
+    MenuChanged event), so repricing a cart costs dict lookups rather than a
+    remote call per line. Concurrent misses for one restaurant share a load.
+    Only real menus are cached: a failed load (the loader raised) and an
+    unknown restaurant (the loader returned None) are retried next time.
+    """
+
+    def __init__(self, loader=load_menu, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.loader = loader
+        self.ttl = ttl
+        self.clock = clock
+        self._menus = {}  # restaurant_id (str) -> (loaded_at, {item_id: (name, price_cents)})
+        self._lock = threading.Lock()
+        self._loading = {}  # restaurant_id -> Lock held while loading
+        self.hits = 0
+        self.loads = 0
+        self.failures = 0
+
+    def menu(self, restaurant_id):
+        """
+        Get a restaurant's price map, loading it if missing or stale.
+
+        Returns:
+            dict: {item_id: (name, price_cents)}
+
+        Raises:
+            MenuUnavailable: If the menu can't be loaded
+            UnknownRestaurant: If there is no such restaurant
+        """
+        restaurant_id = str(restaurant_id)
+        entry = self._fresh(restaurant_id)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            load_lock = self._loading.setdefault(restaurant_id, threading.Lock())
+        with load_lock:
+            # Another thread may have loaded it while we waited
+            entry = self._fresh(restaurant_id, count_hit=False)
+            if entry is not None:
+                return entry
+
+            error = prices = None
+            try:
+                prices = self.loader(restaurant_id)
+            except Exception as e:
+                print(f"Error loading prices for restaurant {restaurant_id}: {e}")
+                error = e
+
+            with self._lock:
+                self._loading.pop(restaurant_id, None)
+                if error is not None:
+                    self.failures += 1
+                elif prices is not None:
+                    self.loads += 1
+                    self._menus[restaurant_id] = (self.clock(), prices)
+
+        if error is not None:
+            raise MenuUnavailable(f'Menu for restaurant {restaurant_id} is unavailable') from error
+        if prices is None:
+            raise UnknownRestaurant(f'Unknown restaurant: {restaurant_id}')
+        return prices
+
+    def _fresh(self, restaurant_id, count_hit=True):
+        with self._lock:
+            entry = self._menus.get(restaurant_id)
+            if entry is None or self.clock() - entry[0] >= self.ttl:
+                return None
+            if count_hit:
+                self.hits += 1
+            return entry[1]
+
+    def lookup(self, restaurant_id, item_id):
+        """
+        Canonical name and price for one item.
+
+        Returns:
+            tuple or None: (name, price_cents), or None if the item isn't on the menu
+
+        Raises:
+            MenuUnavailable: If the menu can't be loaded
+            UnknownRestaurant: If there is no such restaurant
+        """
+        return self.menu(restaurant_id).get(str(item_id))
+
+    def invalidate(self, restaurant_id=None):
+        """Drop one restaurant's prices, or all of them"""
+        with self._lock:
+            if restaurant_id is None:
+                self._menus.clear()
+            else:
+                self._menus.pop(str(restaurant_id), None)
+
+    def stats(self):
+        """
+        Get index metrics.
+
+        Returns:
+            dict: Cached restaurants and items, hit/load/failure counts
+        """
+        with self._lock:
+            return {
+                'restaurants': len(self._menus),
+                'items': sum(len(prices) for _, prices in self._menus.values()),
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'loads': self.loads,
+                'failures': self.failures,
+            }
+
+
+def reprice_cart(cart, restaurant_id, index=None):
+    """
+    Bring one restaurant's cart lines in line with the menu.
+
+    Lines whose price or name changed are updated; lines no longer on the
+    menu (or of a restaurant that no longer exists) are removed. If the menu
+    can't be loaded the cart is left untouched.
+
+    Args:
+        cart: Cart to update in place
+        restaurant_id: Restaurant whose lines to check
+        index: MenuPriceIndex (defaults to the global one)
+
+    Returns:
+        tuple: (names of repriced items, names of removed items)
+
+    Raises:
+        MenuUnavailable: If the menu can't be loaded
+    """
+    try:
+        prices = (index or price_index).menu(restaurant_id)
+    except UnknownRestaurant:
+        prices = {}
+    repriced, removed = [], []
+    for item in cart.items(restaurant_id):
+        canonical = prices.get(str(item['item_id']))
+        if canonical is None:
+            cart.remove(restaurant_id, item['item_id'])
+            removed.append(item['name'])
+        elif cart.set_price(restaurant_id, item['item_id'], *canonical):
+            repriced.append(canonical[0])
+    return repriced, removed
+
+
+# Global index, invalidated whenever a MenuChanged event is published in
+# this process (other processes wait for the TTL)
+price_index = MenuPriceIndex(ttl=float(os.environ.get('MENU_PRICE_TTL_SECONDS', DEFAULT_TTL)))
+
+
+def _on_menu_changed(event):
+    price_index.invalidate(event.restaurant_id)
+
+
+bus.subscribe(MenuChanged, _on_menu_changed, name='price_index.invalidate')
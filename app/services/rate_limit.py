@@ -0,0 +1,262 @@
+"""Sliding-window rate limiting for login, registration and cart endpoints"""
+import os
+import random
+import threading
+import time
+from functools import wraps
+from flask import current_app, request, jsonify, render_template
+from flask_login import current_user
+from sqlalchemy import select, delete
+from database.models import RateLimitCounter
+
+
+class Policy:
+    """
+    A limit of `limit` requests per `window` seconds for one key scope.
+
+    Scopes: 'ip' (client address), 'email' (the submitted email, lowercased)
+    and 'user' (the logged-in user id). A request without a value for the
+    scope - e.g. no email field - isn't counted against that policy.
+    """
+    def __init__(self, scope, limit, window):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+    def key_for(self, name):
+        """Counter key for the current request, or None if the scope doesn't apply"""
+        if self.scope == 'ip':
+            value = request.remote_addr
+        elif self.scope == 'email':
+            data = request.get_json(silent=True) if request.is_json else request.form
+            value = ((data or {}).get('email') or '').strip().lower() or None
+        elif self.scope == 'user':
+            value = current_user.get_id() if current_user.is_authenticated else None
+        else:
+            raise ValueError(f'Unknown rate limit scope: {self.scope}')
+        return f'{name}:{self.scope}:{value}' if value else None
+
+
+# Per-route policies; every policy for a route must pass
+POLICIES = {
+    'login': [Policy('ip', 30, 60), Policy('email', 10, 15 * 60)],
+    'register': [Policy('ip', 10, 60 * 60)],
+    'cart': [Policy('user', 120, 60), Policy('ip', 300, 60)],
+}
+
+
+def sliding_window(previous, current, elapsed, limit, window):
+    """
+    Sliding-window estimate from two fixed-window counts.
+
+    The previous window's count is weighted by how much of it still overlaps
+    the sliding window ending now.
+
+    Args:
+        previous: Count in the previous fixed window
+        current: Count in the current fixed window (including this hit)
+        elapsed: Seconds since the current window started
+        limit: Allowed requests per window
+        window: Window length in seconds
+
+    Returns:
+        tuple: (allowed, retry_after seconds - 0 when allowed)
+    """
+    weight = 1 - elapsed / window
+    estimate = previous * weight + current
+    if estimate <= limit:
+        return True, 0
+    if current > limit or previous == 0:
+        # Only the next window resets the count
+        return False, max(1, int(window - elapsed + 0.999))
+    # Time until the previous window's weighted share decays enough
+    wait = (estimate - limit) * window / previous
+    return False, max(1, int(min(wait, window - elapsed) + 0.999))
+
+
+class MemoryBackend:
+    """Per-process counters - limits apply per worker"""
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def increment(self, key, window_start, window):
+        """
+        Count a hit in the window starting at `window_start`.
+
+        Returns:
+            tuple: (previous window count, current window count)
+        """
+        with self._lock:
+            self._hits += 1
+            if self._hits % 10000 == 0:
+                self._prune(window_start)
+
+            current = self._counters.get((key, window, window_start), 0) + 1
+            self._counters[(key, window, window_start)] = current
+            return self._counters.get((key, window, window_start - window), 0), current
+
+    def _prune(self, now):
+        """Drop windows too old to affect any estimate"""
+        for counter_key in [k for k in self._counters if k[2] + 2 * k[1] <= now]:
+            del self._counters[counter_key]
+
+
+class DatabaseBackend:
+    """
+    Counters in the rate_limit_counters table, shared by every worker.
+
+    Each hit is one upsert plus one read of both windows. Now and then a
+    hit also deletes windows older than `retention` seconds, which must
+    exceed twice the longest policy window.
+    """
+    def __init__(self, session_factory, cleanup_probability=0.001, retention=24 * 3600):
+        self.session_factory = session_factory
+        self.cleanup_probability = cleanup_probability
+        self.retention = retention
+
+    def _upsert(self, session, key, window_start):
+        dialect = session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise RuntimeError(f'Rate limit database backend does not support {dialect}')
+
+        statement = insert(RateLimitCounter).values(key=key, window_start=window_start, count=1)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=['key', 'window_start'],
+            set_={'count': RateLimitCounter.count + 1}
+        ))
+
+    def increment(self, key, window_start, window):
+        """
+        Count a hit in the window starting at `window_start`.
+
+        Returns:
+            tuple: (previous window count, current window count)
+        """
+        session = self.session_factory()
+        try:
+            self._upsert(session, key, window_start)
+            counts = dict(session.execute(
+                select(RateLimitCounter.window_start, RateLimitCounter.count).where(
+                    RateLimitCounter.key == key,
+                    RateLimitCounter.window_start.in_([window_start - window, window_start])
+                )
+            ).all())
+            if random.random() < self.cleanup_probability:
+                session.execute(delete(RateLimitCounter).where(
+                    RateLimitCounter.window_start < window_start - self.retention
+                ))
+            session.commit()
+            return counts.get(window_start - window, 0), counts.get(window_start, 0)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+
+class RateLimiter:
+    """Apply sliding-window policies on top of a counter backend"""
+    def __init__(self, backend, clock=time.time):
+        self.backend = backend
+        self._clock = clock
+        self.allowed = 0
+        self.limited = 0
+
+    def hit(self, key, limit, window):
+        """
+        Count a request against a key and check its limit.
+
+        Args:
+            key: Counter key
+            limit: Allowed requests per window
+            window: Window length in seconds
+
+        Returns:
+            tuple: (allowed, retry_after seconds)
+        """
+        now = self._clock()
+        window_start = int(now // window * window)
+        previous, current = self.backend.increment(key, window_start, window)
+        allowed, retry_after = sliding_window(previous, current, now - window_start, limit, window)
+        if allowed:
+            self.allowed += 1
+        else:
+            self.limited += 1
+        return allowed, retry_after
+
+    def check(self, name, policies):
+        """
+        Check every policy for the current request.
+
+        A backend failure lets the request through rather than locking
+        everyone out.
+
+        Returns:
+            int: 0 if allowed, else the longest Retry-After of the failing policies
+        """
+        retry_after = 0
+        for policy in policies:
+            key = policy.key_for(name)
+            if key is None:
+                continue
+            try:
+                allowed, wait = self.hit(key, policy.limit, policy.window)
+            except Exception as e:
+                print(f"Error checking rate limit {key}: {e}")
+                continue
+            if not allowed:
+                retry_after = max(retry_after, wait)
+        return retry_after
+
+
+def build_limiter_from_env():
+    """
+    Build the limiter for RATELIMIT_BACKEND ('memory' or 'database').
+
+    Returns:
+        RateLimiter: Limiter with the configured backend
+    """
+    if os.environ.get('RATELIMIT_BACKEND', 'memory') == 'database':
+        from database.postgres import SessionLocal
+        return RateLimiter(DatabaseBackend(SessionLocal))
+    return RateLimiter(MemoryBackend())
+
+
+# Global limiter
+limiter = build_limiter_from_env()
+
+
+def rate_limited(name, methods=('POST',)):
+    """
+    Decorator applying the POLICIES for `name` to a route.
+
+    Over-limit requests get 429 with a Retry-After header - JSON for JSON
+    requests, otherwise the 429 page. Disabled when RATELIMIT_ENABLED is
+    False (e.g. in tests).
+
+    Args:
+        name: Key into POLICIES
+        methods: HTTP methods that are counted (form GETs are not)
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method in methods and current_app.config.get('RATELIMIT_ENABLED', True):
+                retry_after = limiter.check(name, POLICIES[name])
+                if retry_after:
+                    headers = {'Retry-After': str(retry_after)}
+                    if request.is_json:
+                        return jsonify({
+                            'success': False,
+                            'message': f'Too many requests. Try again in {retry_after} seconds.'
+                        }), 429, headers
+                    return render_template('errors/429.html', retry_after=retry_after), 429, headers
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
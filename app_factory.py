@@ -3,6 +3,7 @@ import os
 from flask import Flask, Blueprint, render_template
 from flask_login import LoginManager, login_required
 from flask_wtf.csrf import CSRFProtect
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import config
 from database.postgres import SessionLocal, init_db
 from database.models import User
@@ -22,6 +23,11 @@ def create_app(config_name=None):
     app = Flask(__name__, template_folder=template_folder, static_folder=static_folder)
     app.config.from_object(config[config_name])
     
+    # Take the client address (request.remote_addr, used by IP rate limits)
+    # from the X-Forwarded-For entries our own proxies added, not the peer
+    if app.config.get('TRUSTED_PROXY_HOPS'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_HOPS'])
+    
     # Initialize Flask-WTF for CSRF protection
     csrf = CSRFProtect()
     csrf.init_app(app)
@@ -33,6 +39,11 @@ def create_app(config_name=None):
     login_manager.login_message = 'Please log in to access this page.'
     login_manager.login_message_category = 'info'
     
+    # Server-side cart store (the cookie only holds a cart id)
+    from app.services import cart_store, cart_persistence
+    cart_store.init_app(app)
+    cart_persistence.init_app(app)
+    
     @login_manager.user_loader
     def load_user(user_id):
         """Load user by ID for Flask-Login"""
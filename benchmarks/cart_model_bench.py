@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark the cart operations: list-of-items carts vs the indexed Cart.
+
+The list version reproduces the previous cart routes: a linear scan to find
+the item, then the restaurant total and the cart-wide item count and total
+recomputed after every change.
+
+Usage:
+    python benchmarks/cart_model_bench.py [--items N] [--iterations N]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.cart import Cart
+
+
+def legacy_cart(items):
+    return {'1': {
+        'items': [{'item_id': f'item_{n}', 'name': f'Item {n}', 'price': 9.99, 'quantity': 1}
+                  for n in range(items)],
+        'total': round(9.99 * items, 2)
+    }}
+
+
+def legacy_summary(cart):
+    return (sum(len(rc.get('items', [])) for rc in cart.values()),
+            sum(rc.get('total', 0) for rc in cart.values()))
+
+
+def legacy_update(cart, item_id, quantity):
+    items = cart['1']['items']
+    for item in items:
+        if item['item_id'] == item_id:
+            item['quantity'] = quantity
+            break
+    cart['1']['total'] = round(sum(i['quantity'] * i['price'] for i in items), 2)
+    return legacy_summary(cart)
+
+
+def legacy_add(cart, item_id):
+    items = cart['1']['items']
+    existing = next((i for i in items if i['item_id'] == item_id), None)
+    if existing:
+        existing['quantity'] += 1
+    else:
+        items.append({'item_id': item_id, 'name': 'New', 'price': 4.50, 'quantity': 1})
+    cart['1']['total'] = round(sum(i['quantity'] * i['price'] for i in items), 2)
+    return legacy_summary(cart)
+
+
+def legacy_remove(cart, item_id):
+    items = cart['1']['items']
+    items[:] = [i for i in items if i['item_id'] != item_id]
+    cart['1']['total'] = round(sum(i['quantity'] * i['price'] for i in items), 2)
+    return legacy_summary(cart)
+
+
+def indexed_update(cart, item_id, quantity):
+    cart.set_quantity('1', item_id, quantity)
+    return cart.item_count, cart.total
+
+
+def indexed_add(cart, item_id):
+    cart.add('1', item_id, 'New', 4.50)
+    return cart.item_count, cart.total
+
+
+def indexed_remove(cart, item_id):
+    cart.remove('1', item_id)
+    return cart.item_count, cart.total
+
+
+def per_op_us(fn, iterations):
+    started = time.perf_counter()
+    for n in range(iterations):
+        fn(n)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    last = f'item_{args.items - 1}'
+    legacy = legacy_cart(args.items)
+    indexed = Cart.from_dict(legacy_cart(args.items))
+
+    # add+remove pairs keep the cart at its original size
+    cases = [
+        ('update last item', lambda c, n: legacy_update(c, last, n % 5 + 1),
+                             lambda c, n: indexed_update(c, last, n % 5 + 1)),
+        ('add + remove', lambda c, n: (legacy_add(c, 'extra'), legacy_remove(c, 'extra')),
+                         lambda c, n: (indexed_add(c, 'extra'), indexed_remove(c, 'extra'))),
+        ('load + store', None, lambda c, n: Cart.from_dict(c.to_dict())),
+    ]
+
+    print(f"{args.items}-item cart, microseconds per operation")
+    print(f"{'operation':<18} {'list':>10} {'indexed':>10}")
+    for label, legacy_op, indexed_op in cases:
+        legacy_us = per_op_us(lambda n: legacy_op(legacy, n), args.iterations) if legacy_op else None
+        indexed_us = per_op_us(lambda n: indexed_op(indexed, n), args.iterations)
+        legacy_text = f'{legacy_us:>10.2f}' if legacy_us is not None else f"{'-':>10}"
+        print(f"{label:<18} {legacy_text} {indexed_us:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
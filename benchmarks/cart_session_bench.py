@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Compare per-request cost of a cookie-held cart with the server-side cart store.
+
+For carts of increasing size, reports the session cookie size the browser
+uploads on every request and the CPU time per request for:
+- a request that doesn't touch the cart (the session is still decoded)
+- a request that changes the cart (cart read, modified and written back)
+
+Usage:
+    python benchmarks/cart_session_bench.py [--iterations N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_factory import create_app
+from app.services.cart_store import encode_cart, decode_cart, SQLiteCartBackend
+
+SIZES = (1, 10, 50, 100)
+
+
+def make_cart(items):
+    return {'1': {
+        'items': [{'item_id': f'item_{n}', 'name': f'Menu Item Number {n}', 'price': 9.99, 'quantity': 1}
+                  for n in range(items)],
+        'total': round(9.99 * items, 2)
+    }}
+
+
+def cpu_us(fn, iterations):
+    """Average CPU microseconds per call"""
+    started = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - started) / iterations * 1e6
+
+
+def bench_cookie(serializer, cart, iterations):
+    cookie = serializer.dumps({'_user_id': '1', '_fresh': True, 'cart': cart})
+
+    def mutate():
+        session = serializer.loads(cookie)
+        session['cart']['1']['items'][0]['quantity'] += 1
+        serializer.dumps(session)
+
+    return len(cookie), cpu_us(lambda: serializer.loads(cookie), iterations), cpu_us(mutate, iterations)
+
+
+def bench_store(serializer, backend, cart, iterations):
+    cookie = serializer.dumps({'_user_id': '1', '_fresh': True, 'cart_id': 'x' * 22})
+    backend.set('x' * 22, encode_cart(cart))
+
+    def mutate():
+        session = serializer.loads(cookie)
+        stored = decode_cart(backend.get(session['cart_id']))
+        stored['1']['items'][0]['quantity'] += 1
+        backend.set(session['cart_id'], encode_cart(stored))
+
+    return len(cookie), cpu_us(lambda: serializer.loads(cookie), iterations), cpu_us(mutate, iterations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    serializer = app.session_interface.get_signing_serializer(app)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteCartBackend(os.path.join(tmp, 'carts.db'))
+
+        print(f"{'items':>5}  {'store':<7} {'cookie bytes':>12} {'no-cart CPU us':>15} {'cart-write CPU us':>18}")
+        for size in SIZES:
+            cart = make_cart(size)
+            for label, result in (
+                ('cookie', bench_cookie(serializer, cart, args.iterations)),
+                ('sqlite', bench_store(serializer, backend, cart, args.iterations)),
+            ):
+                cookie_bytes, idle_us, write_us = result
+                print(f"{size:>5}  {label:<7} {cookie_bytes:>12} {idle_us:>15.1f} {write_us:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
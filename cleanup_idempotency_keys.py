@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+Delete expired order idempotency keys.
+
+Keys are honoured for IDEMPOTENCY_KEY_RETENTION_HOURS (default 24) after
+the order they created; run this periodically (e.g. hourly from cron).
+
+Usage:
+    python cleanup_idempotency_keys.py [--retention-hours N]
+
+Example:
+    python cleanup_idempotency_keys.py --retention-hours 48
+"""
+import argparse
+import sys
+from database.postgres import SessionLocal
+from app.services.idempotency import purge_expired, DEFAULT_RETENTION_HOURS
+
+
+def cleanup(retention_hours=DEFAULT_RETENTION_HOURS):
+    """
+    Delete keys older than the retention period.
+    
+    Args:
+        retention_hours: Age in hours after which keys are deleted
+    
+    Returns:
+        int: Number of keys deleted
+    """
+    session = SessionLocal()
+    try:
+        deleted = purge_expired(session, retention_hours)
+        session.commit()
+        return deleted
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Delete expired order idempotency keys')
+    parser.add_argument('--retention-hours', type=int, default=DEFAULT_RETENTION_HOURS)
+    args = parser.parse_args()
+    
+    try:
+        deleted = cleanup(args.retention_hours)
+        print(f"✅ Deleted {deleted} idempotency keys older than {args.retention_hours}h")
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,110 @@
+"""Circuit breaker for calls to remote data stores"""
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker.
+
+    Closed: calls pass through; consecutive failures are counted.
+    Open: after `failure_threshold` consecutive failures calls are rejected
+    immediately until `reset_timeout` seconds have passed.
+    Half-open: one trial call is let through; success closes the breaker,
+    failure opens it again.
+    """
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+        # Metrics
+        self.total_successes = 0
+        self.total_failures = 0
+        self.short_circuited = 0
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        """Current state, moving OPEN to HALF_OPEN once the reset timeout elapses"""
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self):
+        """
+        Check whether a call may proceed.
+
+        Returns:
+            bool: False if the call should be short-circuited
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        """Record a successful call"""
+        with self._lock:
+            self.total_successes += 1
+            self._consecutive_failures = 0
+            self._state = CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """Record a failed or timed-out call"""
+        with self._lock:
+            self.total_failures += 1
+            self._consecutive_failures += 1
+            state = self._current_state()
+            if state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if state != OPEN:
+                    self.times_opened += 1
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._trial_in_flight = False
+
+    def snapshot(self):
+        """
+        Get breaker metrics.
+
+        Returns:
+            dict: State and counters suitable for JSON output
+        """
+        with self._lock:
+            state = self._current_state()
+            open_for = None
+            if state == OPEN:
+                open_for = round(self._clock() - self._opened_at, 3)
+            return {
+                'name': self.name,
+                'state': state,
+                'consecutive_failures': self._consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'open_for_seconds': open_for,
+                'total_successes': self.total_successes,
+                'total_failures': self.total_failures,
+                'short_circuited': self.short_circuited,
+                'times_opened': self.times_opened,
+            }
@@ -1,122 +1,503 @@
 """Firestore database connection and initialization"""
 import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from database.circuit_breaker import CircuitBreaker
+
+# Menu storage layouts:
+# - 'collection': one document per item in `menu_items`, filtered by restaurant_id
+# - 'document': one document per restaurant in `menus/{slug}` holding an `items` array
+MENU_LAYOUT_COLLECTION = 'collection'
+MENU_LAYOUT_DOCUMENT = 'document'
+
+# Firestore accepts at most 30 values in an 'in' filter; batch lookups are
+# split into chunks of this size and the chunks are fetched in parallel
+IN_QUERY_LIMIT = 30
+BATCH_WORKERS = 4
+
+
+class FirestoreUnavailable(Exception):
+    """A strict read failed, or was skipped because the circuit breaker is open"""
+    pass
+
+
+def _firestore():
+    """The firebase_admin.firestore module, imported only once a client is in use"""
+    from firebase_admin import firestore
+    return firestore
+
 
 class FirestoreDB:
-    """Firestore database wrapper - simplified for student implementation"""
-    def __init__(self, credentials_path=None):
-        """Initialize Firestore connection"""
+    """Firestore database wrapper - simplified for student implementation
+    
+    The Firebase client is created on first use rather than at construction,
+    so importing the database package doesn't pay for firebase_admin and
+    credential loading on routes that never touch Firestore.
+    """
+    def __init__(self, credentials_path=None, menu_layout=None):
+        """Configure Firestore connection (connects lazily on first use)"""
         # For student level - we'll implement basic structure
         # Firebase connection requires credentials which is optional during development
-        self.initialized = False
+        self.credentials_path = credentials_path
+        if menu_layout is None:
+            menu_layout = os.environ.get('FIRESTORE_MENU_LAYOUT', MENU_LAYOUT_COLLECTION)
+        self.menu_layout = menu_layout
+        self._db = None
+        self._initialized = False
+        self._connect_attempted = False
+        self._connect_lock = threading.Lock()
+        
+        # Per-RPC deadline and circuit breaker so a slow Firestore can't pin workers
+        self.deadline = float(os.environ.get('FIRESTORE_DEADLINE_SECONDS', 3.0))
+        self.breaker = CircuitBreaker(
+            'firestore',
+            failure_threshold=int(os.environ.get('FIRESTORE_BREAKER_FAILURES', 5)),
+            reset_timeout=float(os.environ.get('FIRESTORE_BREAKER_RESET_SECONDS', 30))
+        )
+        # Last successful result per read, served while the breaker is open
+        self._last_known = {}
+    
+    def _ensure_connected(self):
+        """
+        Connect to Firestore exactly once, even with concurrent first callers.
+        
+        Returns:
+            bool: True if a live Firestore client is available
+        """
+        if not self._connect_attempted:
+            with self._connect_lock:
+                if not self._connect_attempted:
+                    self._connect()
+                    self._connect_attempted = True
+        return self._initialized
+    
+    def _connect(self):
+        """Import firebase_admin and build the client if credentials exist"""
         try:
             import firebase_admin
             from firebase_admin import credentials, firestore
             
             if not firebase_admin._apps:  # Check if already initialized
+                credentials_path = self.credentials_path
                 if credentials_path is None:
                     credentials_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
                 
                 if credentials_path and os.path.exists(credentials_path):
                     creds = credentials.Certificate(credentials_path)
                     firebase_admin.initialize_app(creds)
-                    self.db = firestore.client()
-                    self.initialized = True
+            
+            if firebase_admin._apps:
+                self._db = firestore.client()
+                self._initialized = True
         except Exception as e:
             print(f"Note: Firestore not fully initialized (development mode): {e}")
-            self.db = None
+            self._db = None
+    
+    @property
+    def initialized(self):
+        """Whether a live Firestore client is available (connects on first access)"""
+        return self._ensure_connected()
+    
+    @initialized.setter
+    def initialized(self, value):
+        self._initialized = value
+        self._connect_attempted = True
+    
+    @property
+    def db(self):
+        """Firestore client, or None in development/mock mode"""
+        self._ensure_connected()
+        return self._db
+    
+    @db.setter
+    def db(self, client):
+        self._db = client
+    
+    def _guarded(self, description, operation, fallback, cache_key=None):
+        """
+        Run a Firestore operation behind the circuit breaker.
+        
+        While the breaker is open the call is skipped entirely, so a slow or
+        failing Firestore can't pin workers. Reads fall back to the last
+        successful result for `cache_key`, then to `fallback()`.
+        
+        Args:
+            description: Label used in error messages
+            operation: Callable performing the Firestore RPC
+            fallback: Callable returning the degraded result
+            cache_key: Key for remembering the last good result (reads only)
+        
+        Returns:
+            The operation result, last-known data, or the fallback result
+        """
+        if not self.breaker.allow_request():
+            return self._last_known_or(cache_key, fallback)
+        
+        try:
+            result = operation()
+        except Exception as e:
+            self.breaker.record_failure()
+            print(f"Error {description}: {e}")
+            return self._last_known_or(cache_key, fallback)
+        
+        self.breaker.record_success()
+        if cache_key is not None:
+            self._last_known[cache_key] = result
+        return result
+    
+    def _last_known_or(self, cache_key, fallback):
+        """Serve the last good result for a read, else the fallback"""
+        if cache_key is not None and cache_key in self._last_known:
+            return self._last_known[cache_key]
+        return fallback()
+    
+    def status(self):
+        """
+        Get Firestore connection and circuit breaker metrics.
+        
+        Returns:
+            dict: Breaker snapshot plus deadline and cache information
+        """
+        return {
+            'initialized': self._initialized,
+            'deadline_seconds': self.deadline,
+            'last_known_entries': len(self._last_known),
+            'breaker': self.breaker.snapshot(),
+        }
+    
+    def _stream_docs(self, query):
+        """Stream a query within the per-call deadline, adding doc ids"""
+        results = []
+        for doc in query.stream(timeout=self.deadline):
+            data = doc.to_dict()
+            data['id'] = doc.id
+            results.append(data)
+        return results
     
     def get_restaurants(self):
         """Get all restaurants"""
         if not self.initialized:
             return self._get_mock_restaurants()
         
-        try:
-            docs = self.db.collection('restaurants').stream()
-            restaurants = []
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                restaurants.append(data)
-            return restaurants
-        except Exception as e:
-            print(f"Error fetching restaurants: {e}")
-            return self._get_mock_restaurants()
+        return self._guarded(
+            'fetching restaurants',
+            lambda: self._stream_docs(self.db.collection('restaurants')),
+            self._get_mock_restaurants,
+            cache_key='restaurants'
+        )
     
     def get_menu_items(self, restaurant_id):
-        """Get menu items for a restaurant"""
+        """
+        Get menu items for a restaurant.
+        
+        Args:
+            restaurant_id: Restaurant slug (Firestore key)
+        
+        Returns:
+            list: Menu item dicts, each with an 'id'
+        """
         if not self.initialized:
             return self._get_mock_menu_items(restaurant_id)
         
-        try:
-            docs = self.db.collection('menu_items')\
-                .where('restaurant_id', '==', restaurant_id)\
-                .stream()
-            items = []
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                items.append(data)
-            return items
-        except Exception as e:
-            print(f"Error fetching menu items: {e}")
+        return self._guarded(
+            'fetching menu items',
+            self._menu_operation(restaurant_id),
+            lambda: self._get_mock_menu_items(restaurant_id),
+            cache_key=('menu', restaurant_id)
+        )
+    
+    def read_menu_items(self, restaurant_id):
+        """
+        Get menu items for a restaurant, without degrading.
+        
+        Unlike get_menu_items(), a failed or short-circuited read raises
+        instead of serving last-known or mock data, so callers that cache
+        the result (the price index) can tell an empty menu from an outage.
+        
+        Args:
+            restaurant_id: Restaurant slug (Firestore key)
+        
+        Returns:
+            list: Menu item dicts, each with an 'id'
+        
+        Raises:
+            FirestoreUnavailable: If the menu couldn't be read
+        """
+        if not self.initialized:
             return self._get_mock_menu_items(restaurant_id)
+        
+        def unavailable():
+            raise FirestoreUnavailable(f'Menu for {restaurant_id} could not be read')
+        
+        return self._guarded('fetching menu items', self._menu_operation(restaurant_id), unavailable)
+    
+    def _menu_operation(self, restaurant_id):
+        """The Firestore read for one restaurant's menu, in the configured layout"""
+        if self.menu_layout == MENU_LAYOUT_DOCUMENT:
+            return lambda: self._get_menu_document(restaurant_id)
+        return lambda: self._stream_docs(
+            self.db.collection('menu_items').where('restaurant_id', '==', restaurant_id)
+        )
+    
+    def _fetch_chunked(self, description, restaurant_ids, fetch, cache_prefix, fallback_one):
+        """
+        Look up many restaurants in IN_QUERY_LIMIT-sized chunks, in parallel.
+        
+        Each chunk is one guarded Firestore call. Successful results are
+        remembered per restaurant; failed or short-circuited chunks serve the
+        last-known value per restaurant, then `fallback_one`.
+        
+        Args:
+            description: Label used in error messages
+            restaurant_ids: Restaurant slugs to look up
+            fetch: Callable taking a chunk of slugs, returning {slug: value}
+            cache_prefix: Prefix for last-known cache keys
+            fallback_one: Callable returning the degraded value for one slug
+        
+        Returns:
+            dict: Mapping of every requested slug to its value
+        """
+        ids = list(dict.fromkeys(restaurant_ids))
+        chunks = [ids[i:i + IN_QUERY_LIMIT] for i in range(0, len(ids), IN_QUERY_LIMIT)]
+        
+        def read_chunk(chunk):
+            def operation():
+                found = fetch(chunk)
+                values = {rid: found.get(rid, fallback_one(rid)) for rid in chunk}
+                for rid, value in values.items():
+                    self._last_known[(cache_prefix, rid)] = value
+                return values
+            
+            def fallback():
+                return {
+                    rid: self._last_known_or((cache_prefix, rid), lambda: fallback_one(rid))
+                    for rid in chunk
+                }
+            
+            return self._guarded(description, operation, fallback)
+        
+        results = {}
+        if len(chunks) <= 1:
+            for chunk in chunks:
+                results.update(read_chunk(chunk))
+            return results
+        
+        with ThreadPoolExecutor(max_workers=min(len(chunks), BATCH_WORKERS)) as executor:
+            for values in executor.map(read_chunk, chunks):
+                results.update(values)
+        return results
+    
+    def get_menu_items_many(self, restaurant_ids):
+        """
+        Get menu items for several restaurants in as few round trips as possible.
+        
+        Document layout uses chunked multi-document gets; collection layout
+        uses chunked 'in' queries on restaurant_id.
+        
+        Args:
+            restaurant_ids: Restaurant slugs (Firestore keys)
+        
+        Returns:
+            dict: {slug: list of menu item dicts}
+        """
+        if not self.initialized:
+            return {rid: self._get_mock_menu_items(rid) for rid in restaurant_ids}
+        
+        def fetch(chunk):
+            menus = {}
+            if self.menu_layout == MENU_LAYOUT_DOCUMENT:
+                refs = [self.db.collection('menus').document(rid) for rid in chunk]
+                for doc in self.db.get_all(refs, timeout=self.deadline):
+                    if doc.exists:
+                        menus[doc.id] = (doc.to_dict() or {}).get('items', [])
+            else:
+                query = self.db.collection('menu_items').where('restaurant_id', 'in', chunk)
+                for item in self._stream_docs(query):
+                    menus.setdefault(item.get('restaurant_id'), []).append(item)
+            return menus
+        
+        return self._fetch_chunked('fetching menus', restaurant_ids, fetch, 'menu', lambda rid: [])
+    
+    def get_rating_summaries(self, restaurant_ids):
+        """
+        Get average rating and review count for several restaurants.
+        
+        Reads the rolled-up counters add_review() keeps in
+        `rating_summaries/{slug}` with chunked multi-document gets, so a
+        list page of 50 restaurants reads 50 small documents in two parallel
+        round trips, however many reviews they have.
+        
+        Args:
+            restaurant_ids: Restaurant slugs (Firestore keys)
+        
+        Returns:
+            dict: {slug: {'average_rating': float, 'review_count': int}}
+        """
+        def empty_summary(rid):
+            return {'average_rating': 0.0, 'review_count': 0}
+        
+        if not self.initialized:
+            return {rid: empty_summary(rid) for rid in restaurant_ids}
+        
+        def fetch(chunk):
+            summaries = {}
+            refs = [self.db.collection('rating_summaries').document(rid) for rid in chunk]
+            for doc in self.db.get_all(refs, timeout=self.deadline):
+                data = doc.to_dict() if doc.exists else None
+                if data and data.get('review_count'):
+                    summaries[doc.id] = {
+                        'average_rating': round(data.get('rating_sum', 0) / data['review_count'], 1),
+                        'review_count': data['review_count']
+                    }
+            return summaries
+        
+        return self._fetch_chunked('fetching rating summaries', restaurant_ids, fetch, 'rating', empty_summary)
+    
+    def rebuild_rating_summary(self, restaurant_id):
+        """
+        Recompute a restaurant's rating counters from its reviews.
+        
+        Uses a server-side count()/sum() aggregation query, so no review
+        documents are downloaded. For backfilling restaurants reviewed
+        before the counters existed, or repairing drifted counters.
+        
+        Args:
+            restaurant_id: Restaurant slug (Firestore key)
+        
+        Returns:
+            bool: True on success
+        """
+        if not self.initialized:
+            return True  # Mock success for development
+        
+        def write():
+            query = self.db.collection('reviews').where('restaurant_id', '==', restaurant_id)
+            aggregation = query.count(alias='review_count').sum('rating', alias='rating_sum')
+            totals = {result.alias: result.value for row in aggregation.get(timeout=self.deadline) for result in row}
+            self.db.collection('rating_summaries').document(restaurant_id).set({
+                'review_count': int(totals.get('review_count') or 0),
+                'rating_sum': totals.get('rating_sum') or 0
+            }, timeout=self.deadline)
+            return True
+        
+        return self._guarded('rebuilding rating summary', write, lambda: False)
+    
+    def _get_menu_document(self, restaurant_id):
+        """Read a whole menu with a single document get (document layout)"""
+        doc = self.db.collection('menus').document(restaurant_id).get(timeout=self.deadline)
+        if not doc.exists:
+            return []
+        return (doc.to_dict() or {}).get('items', [])
+    
+    def _menu_item_fields(self, restaurant_id, item_data):
+        """Fields stored for a menu item in either layout"""
+        return {
+            'restaurant_id': restaurant_id,
+            'name': item_data.get('name'),
+            'category': item_data.get('category'),
+            'price': item_data.get('price'),
+            'description': item_data.get('description'),
+        }
+    
+    def set_menu(self, restaurant_id, items):
+        """
+        Write a restaurant's full menu.
+        
+        In document layout the menu is stored as one `menus/{slug}` document;
+        in collection layout each item is added to `menu_items` in one batch.
+        
+        Args:
+            restaurant_id: Restaurant slug (Firestore key)
+            items: List of menu item dicts
+        
+        Returns:
+            bool: True on success
+        """
+        if not self.initialized:
+            return True  # Mock success for development
+        
+        def write():
+            firestore = _firestore()
+            if self.menu_layout == MENU_LAYOUT_DOCUMENT:
+                menu_items = []
+                for item in items:
+                    fields = self._menu_item_fields(restaurant_id, item)
+                    fields['id'] = item.get('id') or uuid.uuid4().hex
+                    menu_items.append(fields)
+                self.db.collection('menus').document(restaurant_id).set({
+                    'items': menu_items,
+                    'updated_at': firestore.SERVER_TIMESTAMP
+                }, timeout=self.deadline)
+            else:
+                batch = self.db.batch()
+                for item in items:
+                    fields = self._menu_item_fields(restaurant_id, item)
+                    fields['created_at'] = firestore.SERVER_TIMESTAMP
+                    batch.set(self.db.collection('menu_items').document(), fields)
+                batch.commit(timeout=self.deadline)
+            return True
+        
+        return self._guarded('writing menu', write, lambda: False)
     
     def add_menu_item(self, restaurant_id, item_data):
         """Add a menu item to Firestore"""
         if not self.initialized:
             return True  # Mock success for development
         
-        try:
-            self.db.collection('menu_items').add({
-                'restaurant_id': restaurant_id,
-                'name': item_data.get('name'),
-                'category': item_data.get('category'),
-                'price': item_data.get('price'),
-                'description': item_data.get('description'),
-                'created_at': __import__('firebase_admin').firestore.SERVER_TIMESTAMP
-            })
+        def write():
+            firestore = _firestore()
+            fields = self._menu_item_fields(restaurant_id, item_data)
+            if self.menu_layout == MENU_LAYOUT_DOCUMENT:
+                fields['id'] = uuid.uuid4().hex
+                self.db.collection('menus').document(restaurant_id).set(
+                    {'items': firestore.ArrayUnion([fields])}, merge=True, timeout=self.deadline
+                )
+            else:
+                fields['created_at'] = firestore.SERVER_TIMESTAMP
+                self.db.collection('menu_items').add(fields, timeout=self.deadline)
             return True
-        except Exception as e:
-            print(f"Error adding menu item: {e}")
-            return False
+        
+        return self._guarded('adding menu item', write, lambda: False)
     
     def add_review(self, restaurant_id, user_id, review_data):
         """Add review to restaurant"""
         if not self.initialized:
             return True  # Mock success
         
-        try:
-            self.db.collection('reviews').add({
+        def write():
+            firestore = _firestore()
+            rating = review_data.get('rating') or 0
+            # The review and the restaurant's rating counters commit together
+            batch = self.db.batch()
+            batch.set(self.db.collection('reviews').document(), {
                 'restaurant_id': restaurant_id,
                 'user_id': user_id,
                 'rating': review_data.get('rating'),
                 'comment': review_data.get('comment'),
-                'created_at': __import__('firebase_admin').firestore.SERVER_TIMESTAMP
+                'created_at': firestore.SERVER_TIMESTAMP
             })
+            batch.set(self.db.collection('rating_summaries').document(restaurant_id), {
+                'review_count': firestore.Increment(1),
+                'rating_sum': firestore.Increment(rating)
+            }, merge=True)
+            batch.commit(timeout=self.deadline)
             return True
-        except Exception as e:
-            print(f"Error adding review: {e}")
-            return False
+        
+        return self._guarded('adding review', write, lambda: False)
     
     def get_reviews(self, restaurant_id):
         """Get reviews for restaurant"""
         if not self.initialized:
             return []
         
-        try:
-            docs = self.db.collection('reviews')\
+        def read():
+            query = self.db.collection('reviews')\
                 .where('restaurant_id', '==', restaurant_id)\
-                .order_by('created_at', direction=__import__('firebase_admin').firestore.Query.DESCENDING)\
-                .stream()
-            reviews = []
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                reviews.append(data)
-            return reviews
-        except Exception as e:
-            print(f"Error fetching reviews: {e}")
-            return []
+                .order_by('created_at', direction=_firestore().Query.DESCENDING)
+            return self._stream_docs(query)
+        
+        return self._guarded('fetching reviews', read, list, cache_key=('reviews', restaurant_id))
     
     def _get_mock_restaurants(self):
         """Mock data for development"""
@@ -186,10 +567,10 @@ class FirestoreDB:
             print("✓ Firestore data (mock mode - using in-memory data)")
             return
         
-        try:
+        def seed():
             # Check if data exists
-            if self.db.collection('restaurants').document('pizza_palace').get().exists:
-                return
+            if self.db.collection('restaurants').document('pizza_palace').get(timeout=self.deadline).exists:
+                return False
             
             # Create restaurants
             restaurants = {
@@ -204,14 +585,13 @@ class FirestoreDB:
             batch = self.db.batch()
             for doc_id, data in restaurants.items():
                 batch.set(self.db.collection('restaurants').document(doc_id), data)
-            batch.commit()
-            
-            print("✓ Firestore data seeded")
+            batch.commit(timeout=self.deadline)
+            return True
         
-        except Exception as e:
-            print(f"✗ Error seeding Firestore: {e}")
+        if self._guarded('seeding Firestore', seed, lambda: False):
+            print("✓ Firestore data seeded")
 
-# Global Firestore instance
+# Global Firestore instance - cheap to build, connects on first use
 firestore_db = FirestoreDB()
 
 def init_firestore():
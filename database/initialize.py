@@ -18,6 +18,11 @@ def init_postgresql():
         db = _get_db()
         print("  ✓ Creating tables...")
         db.create_tables()
+        for change in db.upgrade_schema():
+            print(f"  ✓ Added {change} to an existing table")
+        backfilled = db.backfill_restaurant_slugs()
+        if backfilled:
+            print(f"  ✓ Assigned slugs to {backfilled} existing restaurants")
         
         # Get session
         session = db.get_session()
@@ -70,10 +75,14 @@ def init_firestore():
         # Add menus to Firestore
         print("  ✓ Adding menus...")
         for restaurant_id, menu_items in all_menus.items():
-            for item in menu_items:
-                success = firestore_db.add_menu_item(restaurant_id, item)
-                if not success:
-                    print(f"    ⚠ Warning: Could not add {item['name']} to {restaurant_id}")
+            success = firestore_db.set_menu(restaurant_id, menu_items)
+            if not success:
+                print(f"    ⚠ Warning: Could not add menu for {restaurant_id}")
+        
+        # Rating counters for restaurants reviewed before they existed
+        for restaurant_id in all_menus:
+            if not firestore_db.rebuild_rating_summary(restaurant_id):
+                print(f"    ⚠ Warning: Could not rebuild rating summary for {restaurant_id}")
         
         print(f"  ✓ Firestore initialized with {sum(len(items) for items in all_menus.values())} menu items")
         print(f"    ({len(all_menus)} restaurants with menus)")
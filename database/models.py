@@ -1,6 +1,6 @@
 """SQLAlchemy models for PostgreSQL"""
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Text, Boolean, ForeignKey, Enum
+from sqlalchemy import select, and_, or_, create_engine, Column, Integer, String, DateTime, Float, Text, Boolean, ForeignKey, Enum, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from flask_login import UserMixin
@@ -16,6 +16,9 @@ class OrderStatus(enum.Enum):
     DELIVERED = 'delivered'
     CANCELLED = 'cancelled'
 
+# Orders the kitchen still has to deal with
+ACTIVE_ORDER_STATUSES = (OrderStatus.PENDING, OrderStatus.CONFIRMED, OrderStatus.PREPARING, OrderStatus.READY)
+
 class PaymentStatus(enum.Enum):
     PENDING = 'pending'
     COMPLETED = 'completed'
@@ -47,11 +50,71 @@ class User(Base, UserMixin):
     def __repr__(self):
         return f'<User {self.username}>'
 
+def slugify(name):
+    """
+    Build the stable Firestore key for a restaurant name.
+    
+    Args:
+        name: Restaurant display name
+        
+    Returns:
+        str: Lowercase key with spaces replaced by underscores
+    """
+    return '_'.join((name or '').lower().split())
+
+
+def unique_slug(connection, name, city=None, reserved=()):
+    """
+    Pick a slug for a restaurant that no other restaurant has.
+    
+    Restaurants with the same name (e.g. a chain) get the city appended,
+    then a counter: 'pizza_palace', 'pizza_palace_boston', 'pizza_palace_2'.
+    
+    Args:
+        connection: Connection or session to look up existing slugs with
+        name: Restaurant display name
+        city: Restaurant city, if known
+        reserved: Slugs already handed out but not yet in the table
+        
+    Returns:
+        str: Unused slug
+    """
+    base = slugify(name)
+    taken = set(reserved)
+    taken.update(connection.execute(
+        select(Restaurant.slug).where(or_(Restaurant.slug == base, Restaurant.slug.like(base + '\\_%', escape='\\')))
+    ).scalars())
+    
+    candidates = [base]
+    if city:
+        candidates.append(f'{base}_{slugify(city)}')
+    for candidate in candidates:
+        if candidate not in taken:
+            return candidate
+    
+    counter = 2
+    while f'{base}_{counter}' in taken:
+        counter += 1
+    return f'{base}_{counter}'
+
+
+def _default_slug(context):
+    """Derive a unique slug from the name when a restaurant is first inserted"""
+    params = context.get_current_parameters()
+    # Rows inserted together in one statement can't see each other yet
+    reserved = context.__dict__.setdefault('_restaurant_slugs', set())
+    slug = unique_slug(context.connection, params.get('name'), params.get('city'), reserved)
+    reserved.add(slug)
+    return slug
+
+
 class Restaurant(Base):
     __tablename__ = 'restaurants'
     
     id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)
+    # Firestore document key - set once on insert so renames don't orphan menus/reviews
+    slug = Column(String(255), unique=True, index=True, default=_default_slug)
     description = Column(Text)
     phone = Column(String(20))
     city = Column(String(100))
@@ -72,6 +135,10 @@ class Order(Base):
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     restaurant_id = Column(Integer, ForeignKey('restaurants.id'), nullable=False)
     status = Column(Enum(OrderStatus), default=OrderStatus.PENDING)
+    previous_status = Column(Enum(OrderStatus))
+    status_changed_at = Column(DateTime, default=datetime.utcnow)
+    previous_status_since = Column(DateTime)  # when the order entered previous_status
+    version = Column(Integer, nullable=False, default=1, server_default='1')  # bumped on every status change
     total_price = Column(Float, nullable=False)
     notes = Column(Text)
     delivery_address = Column(Text)
@@ -84,6 +151,15 @@ class Order(Base):
     items = relationship('OrderItem', back_populates='order', cascade='all, delete-orphan')
     payment = relationship('Payment', back_populates='order', uselist=False)
     
+    __table_args__ = (
+        # Kitchen queue: a restaurant's open orders in arrival order. Only
+        # active orders are indexed, so it stays small however many orders
+        # have been delivered.
+        Index('ix_orders_kitchen_queue', 'restaurant_id', 'created_at', 'id',
+              postgresql_where=status.in_(ACTIVE_ORDER_STATUSES),
+              sqlite_where=status.in_(ACTIVE_ORDER_STATUSES)),
+    )
+    
     def __repr__(self):
         return f'<Order {self.id}>'
 
@@ -122,3 +198,177 @@ class Payment(Base):
     
     def __repr__(self):
         return f'<Payment {self.id}>'
+
+class OutboxEvent(Base):
+    """Order event written in the same transaction as the change it describes.
+    
+    A worker (outbox_worker.py) renders pending rows into notification
+    entries, hands each one to every sink as an OutboxDelivery and then
+    marks the row delivered. Rows that can't be rendered are parked with
+    dead_at set after outbox.MAX_ATTEMPTS instead of retried forever.
+    """
+    __tablename__ = 'outbox'
+    
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String(50), nullable=False)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False)
+    payload = Column(Text, nullable=False, default='{}')  # JSON
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    delivered_at = Column(DateTime)
+    dead_at = Column(DateTime)  # gave up after outbox.MAX_ATTEMPTS
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Workers only ever scan undelivered, live rows
+        Index('ix_outbox_pending', 'available_at', 'id',
+              postgresql_where=and_(delivered_at.is_(None), dead_at.is_(None)),
+              sqlite_where=and_(delivered_at.is_(None), dead_at.is_(None))),
+    )
+    
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.event_type}>'
+
+class OutboxDelivery(Base):
+    """One outbox event's notification entry, queued for one sink.
+    
+    Each sink drains its own rows, so a slow or failing sink only delays
+    and retries its own deliveries; sinks that accepted an entry never see
+    it again. Rows that keep failing are parked with dead_at set.
+    """
+    __tablename__ = 'outbox_deliveries'
+    
+    id = Column(Integer, primary_key=True)
+    outbox_id = Column(Integer, ForeignKey('outbox.id'), nullable=False)
+    sink = Column(String(50), nullable=False)
+    entry = Column(Text, nullable=False)  # JSON notification entry
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    delivered_at = Column(DateTime)
+    dead_at = Column(DateTime)  # gave up after outbox.MAX_ATTEMPTS
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ux_outbox_deliveries_event_sink', 'outbox_id', 'sink', unique=True),
+        # Each sink's workers only ever scan its undelivered, live rows
+        Index('ix_outbox_deliveries_pending', 'sink', 'available_at', 'id',
+              postgresql_where=and_(delivered_at.is_(None), dead_at.is_(None)),
+              sqlite_where=and_(delivered_at.is_(None), dead_at.is_(None))),
+    )
+    
+    def __repr__(self):
+        return f'<OutboxDelivery {self.outbox_id} -> {self.sink}>'
+
+class OrderStatusEvent(Base):
+    """One status change of an order - append-only.
+    
+    Written in the same transaction as the change by app.services.order_state.
+    `from_status` is empty for the row recording the order's creation, and
+    `stage_seconds` is how long the order spent in `from_status`.
+    """
+    __tablename__ = 'order_status_events'
+    
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False, index=True)
+    restaurant_id = Column(Integer, ForeignKey('restaurants.id'), nullable=False)
+    from_status = Column(Enum(OrderStatus))
+    to_status = Column(Enum(OrderStatus), nullable=False)
+    stage_seconds = Column(Float)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Per-restaurant history in event order
+        Index('ix_order_status_events_restaurant', 'restaurant_id', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<OrderStatusEvent {self.order_id}: {self.from_status} -> {self.to_status}>'
+
+class OrderStageRollup(Base):
+    """Histogram of stage durations per restaurant, stage and hour.
+    
+    One row per histogram bucket that has any orders in it; `count` is
+    incremented as orders leave the stage, so percentiles over any window
+    are read from a few hundred rows instead of the event history.
+    """
+    __tablename__ = 'order_stage_rollups'
+    
+    restaurant_id = Column(Integer, ForeignKey('restaurants.id'), primary_key=True)
+    stage = Column(Enum(OrderStatus), primary_key=True)
+    hour = Column(DateTime, primary_key=True)  # start of the hour the stage ended in
+    bucket = Column(Integer, primary_key=True)  # see app.services.order_history.BUCKET_BOUNDS
+    count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<OrderStageRollup {self.restaurant_id} {self.stage} {self.hour} [{self.bucket}]: {self.count}>'
+
+class IdempotencyKey(Base):
+    """Client-supplied (or cart-derived) key for an order placement.
+    
+    The unique (user_id, key) index makes a repeated submit fail to insert,
+    so it can be answered with the original order instead of a new one.
+    Rows are purged after a retention period by cleanup_idempotency_keys.py.
+    """
+    __tablename__ = 'idempotency_keys'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    key = Column(String(128), nullable=False)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        Index('ux_idempotency_keys_user_key', 'user_id', 'key', unique=True),
+    )
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.user_id}:{self.key} -> order {self.order_id}>'
+
+class RateLimitCounter(Base):
+    """Request count for one rate-limit key in one fixed window.
+    
+    Shared by all workers when RATELIMIT_BACKEND=database; the limiter
+    weights the previous window to get a sliding-window estimate.
+    """
+    __tablename__ = 'rate_limit_counters'
+    
+    key = Column(String(255), primary_key=True)
+    window_start = Column(Integer, primary_key=True)  # epoch seconds
+    count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<RateLimitCounter {self.key} @{self.window_start}: {self.count}>'
+
+class UserCart(Base):
+    """A logged-in user's cart, kept across sessions and devices.
+    
+    Only used when CART_PERSIST_ENABLED is set. `data` holds the same blob
+    the cart store uses; writes are coalesced, so it can trail the store by
+    a few seconds.
+    """
+    __tablename__ = 'carts'
+    
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UserCart user={self.user_id}>'
+
+class SessionCart(Base):
+    """A browser session's cart, keyed by the cart id in the session cookie.
+    
+    Only used with CART_STORE=database://, which keeps carts in the
+    application database so every worker and instance shares them.
+    """
+    __tablename__ = 'cart_sessions'
+    
+    id = Column(String(64), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<SessionCart {self.id}>'
+
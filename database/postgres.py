@@ -1,8 +1,27 @@
 """PostgreSQL database connection and initialization"""
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.orm import sessionmaker, Session
-from database.models import Base, User, Restaurant, Order, OrderItem, Payment
+from database.models import Base, User, Restaurant, Order, OrderItem, Payment, OutboxEvent, unique_slug
+
+# Columns added to existing tables since they were first released, with the
+# DDL that follows the type in ALTER TABLE ... ADD COLUMN. create_all() only
+# creates missing tables, so upgrade_schema() adds these.
+ADDED_COLUMNS = [
+    (Restaurant.__table__.c.slug, ''),
+    # Order status transitions; a NULL status_changed_at reads as created_at
+    (Order.__table__.c.version, 'NOT NULL DEFAULT 1'),
+    (Order.__table__.c.previous_status, ''),
+    (Order.__table__.c.status_changed_at, ''),
+    (Order.__table__.c.previous_status_since, ''),
+    (OutboxEvent.__table__.c.dead_at, ''),
+]
+
+# Indexes on those tables that create_all() won't build there either
+ADDED_INDEXES = [
+    index for index in (*Restaurant.__table__.indexes, *Order.__table__.indexes)
+    if index.name in ('ix_restaurants_slug', 'ix_orders_kitchen_queue')
+]
 
 class PostgresDB:
     def __init__(self, database_url=None):
@@ -21,6 +40,59 @@ class PostgresDB:
         """Drop all tables (for testing)"""
         Base.metadata.drop_all(self.engine)
     
+    def upgrade_schema(self):
+        """
+        Add the columns and indexes in ADDED_COLUMNS / ADDED_INDEXES to
+        tables created by an older release.
+        
+        Each step checks the live schema first, so running it again does
+        nothing. Run after create_tables() and before any backfill.
+        
+        Returns:
+            list: Names of the columns and indexes added
+        """
+        added = []
+        with self.engine.begin() as connection:
+            inspector = inspect(connection)
+            tables = set(inspector.get_table_names())
+            for column, ddl in ADDED_COLUMNS:
+                table = column.table.name
+                existing = {c['name'] for c in inspector.get_columns(table)} if table in tables else None
+                if existing is None or column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column.name} {column_type} {ddl}'.rstrip())
+                added.append(f'{table}.{column.name}')
+            
+            for index in ADDED_INDEXES:
+                table = index.table.name
+                if table in tables and index.name not in {i['name'] for i in inspector.get_indexes(table)}:
+                    index.create(connection)
+                    added.append(index.name)
+        return added
+    
+    def backfill_restaurant_slugs(self):
+        """
+        Assign slugs to restaurants created before the slug column existed.
+        
+        Returns:
+            int: Number of restaurants updated
+        """
+        session = self.get_session()
+        try:
+            restaurants = session.query(Restaurant).filter(Restaurant.slug.is_(None)).order_by(Restaurant.id).all()
+            assigned = set()
+            for restaurant in restaurants:
+                restaurant.slug = unique_slug(session, restaurant.name, restaurant.city, assigned)
+                assigned.add(restaurant.slug)
+            session.commit()
+            return len(restaurants)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    
     def get_session(self) -> Session:
         """Get a database session"""
         return self.SessionLocal()
@@ -1,4 +1,5 @@
 """Comprehensive seed data for restaurants and menus"""
+from database.models import slugify
 
 RESTAURANTS = [
     {
@@ -45,7 +46,7 @@ RESTAURANTS = [
     }
 ]
 
-# Menus mapped by restaurant name (lowercase with underscores for Firestore)
+# Menus mapped by restaurant slug (the Firestore key, see models.slugify)
 MENUS = {
     'pizza_palace': [
         {'name': 'Margherita Pizza', 'category': 'Pizza', 'price': 12.99, 'description': 'Fresh mozzarella, basil, tomato'},
@@ -107,10 +108,9 @@ def get_restaurants():
     """Get all restaurants"""
     return RESTAURANTS
 
-def get_menu_for_restaurant(restaurant_name):
-    """Get menu items for a restaurant"""
-    firestore_id = restaurant_name.lower().replace(' ', '_')
-    return MENUS.get(firestore_id, [])
+def get_menu_for_restaurant(slug):
+    """Get menu items for a restaurant by slug (a display name is also accepted)"""
+    return MENUS.get(slugify(slug), [])
 
 def get_all_menus():
     """Get all menus"""
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+"""
+Bulk-import user accounts from CSV or JSON Lines.
+
+Each record needs email, username and password; first_name, last_name,
+phone, address, city and postal_code are optional. An is_admin column is
+ignored (and counted) unless --allow-admin is given. Passwords
+are hashed across a process pool at the current hashing policy cost while
+the previous chunk is inserted, uniqueness is checked with one query per
+chunk, and rows are inserted in chunks. Records that are invalid or clash
+with an existing (or earlier) email/username are skipped and counted.
+
+Usage:
+    python import_users.py <file.csv|file.jsonl> [--workers N] [--chunk-size N] [--dry-run] [--allow-admin]
+
+Example:
+    python import_users.py partner_users.csv --workers 8
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from sqlalchemy import insert, select, or_
+from sqlalchemy.exc import IntegrityError
+from database.postgres import SessionLocal
+from database.models import User
+from app.auth.hashing_policy import policy
+
+OPTIONAL_FIELDS = ('first_name', 'last_name', 'phone', 'address', 'city', 'postal_code')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+USERNAME_PATTERN = re.compile(r'^[a-zA-Z0-9_]{3,20}$')  # same rules as RegistrationForm
+
+
+def read_records(path, fmt=None):
+    """
+    Stream records from a CSV or JSON Lines file.
+
+    Args:
+        path: Input file
+        fmt: 'csv' or 'jsonl' (default: from the file extension)
+
+    Yields:
+        dict: One record per row/line
+    """
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def validate(record):
+    """
+    Check a record against the registration rules.
+
+    Returns:
+        str or None: Reason the record is invalid, or None if it's fine
+    """
+    if not EMAIL_PATTERN.match(record.get('email') or ''):
+        return 'invalid email'
+    if not USERNAME_PATTERN.match(record.get('username') or ''):
+        return 'invalid username'
+    if len(record.get('password') or '') < 8:
+        return 'password too short'
+    return None
+
+
+def hash_one(job):
+    """Hash one password (runs in a pool process)"""
+    password, rounds = job
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _existing(session, records):
+    """Emails and usernames from `records` already in the database (one query)"""
+    emails = [r['email'] for r in records]
+    usernames = [r['username'] for r in records]
+    rows = session.execute(
+        select(User.email, User.username).where(or_(User.email.in_(emails), User.username.in_(usernames)))
+    ).all()
+    return {row.email for row in rows}, {row.username for row in rows}
+
+
+def _wants_admin(record):
+    return str(record.get('is_admin', '')).lower() in ('1', 'true', 'yes')
+
+
+def _to_row(record, password_hash, allow_admin=False):
+    row = {
+        'email': record['email'],
+        'username': record['username'],
+        'password_hash': password_hash,
+        'is_admin': allow_admin and _wants_admin(record),
+    }
+    for field in OPTIONAL_FIELDS:
+        if record.get(field):
+            row[field] = record[field]
+    return row
+
+
+def _insert(session_factory, rows, stats):
+    """
+    Insert a chunk; on a race with another writer re-check and retry once.
+
+    If the retry conflicts too (the other writer is still going), the rows
+    are inserted one at a time and the ones that still conflict are
+    reported and counted as existing instead of aborting the import.
+    """
+    session = session_factory()
+    try:
+        try:
+            session.execute(insert(User), rows)
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            emails, usernames = _existing(session, rows)
+            kept = [r for r in rows if r['email'] not in emails and r['username'] not in usernames]
+            stats['already exists'] += len(rows) - len(kept)
+            rows = kept
+            if rows:
+                try:
+                    session.execute(insert(User), rows)
+                    session.commit()
+                except IntegrityError:
+                    session.rollback()
+                    rows = _insert_each(session, rows, stats)
+        stats['created'] += len(rows)
+    finally:
+        session.close()
+
+
+def _insert_each(session, rows, stats):
+    """Insert rows one by one, skipping and reporting those that conflict"""
+    created = []
+    for row in rows:
+        try:
+            session.execute(insert(User), [row])
+            session.commit()
+            created.append(row)
+        except IntegrityError:
+            session.rollback()
+            stats['already exists'] += 1
+            print(f"  ⚠️  Skipped {row['email']}: created by another writer during the import", flush=True)
+    return created
+
+
+def import_users(records, session_factory=SessionLocal, workers=None, chunk_size=1000,
+                 rounds=None, dry_run=False, allow_admin=False, progress=None):
+    """
+    Import user records.
+
+    Args:
+        records: Iterable of record dicts
+        session_factory: Callable returning a new SQLAlchemy session
+        workers: Hashing processes (0 hashes in this process)
+        chunk_size: Records per uniqueness query and insert
+        rounds: bcrypt cost (defaults to the hashing policy)
+        dry_run: Validate and check uniqueness without hashing or inserting
+        allow_admin: Honour the records' is_admin flag; otherwise every
+            user is created as a regular user
+        progress: Optional callable(stats) called after each chunk
+
+    Returns:
+        Counter: 'read', 'created' and one count per skip reason
+    """
+    rounds = rounds or policy.rounds
+    stats = Counter()
+    seen_emails, seen_usernames = set(), set()
+    started = time.monotonic()
+
+    executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count()) if workers != 0 and not dry_run else None
+    pending = None  # (records, hash iterator) hashed while the next chunk is checked
+    try:
+        for chunk in _chunks(records, chunk_size):
+            stats['read'] += len(chunk)
+            valid = []
+            for record in chunk:
+                record = {k: (v.strip() if isinstance(v, str) and k != 'password' else v) for k, v in record.items()}
+                reason = validate(record)
+                if reason is None and (record['email'] in seen_emails or record['username'] in seen_usernames):
+                    reason = 'duplicate in file'
+                if reason:
+                    stats[reason] += 1
+                    continue
+                seen_emails.add(record['email'])
+                seen_usernames.add(record['username'])
+                if not allow_admin and _wants_admin(record):
+                    stats['is_admin ignored (use --allow-admin)'] += 1
+                valid.append(record)
+
+            if valid:
+                session = session_factory()
+                try:
+                    emails, usernames = _existing(session, valid)
+                finally:
+                    session.close()
+                fresh = [r for r in valid if r['email'] not in emails and r['username'] not in usernames]
+                stats['already exists'] += len(valid) - len(fresh)
+                valid = fresh
+
+            if dry_run:
+                stats['would create'] += len(valid)
+            else:
+                jobs = [(r['password'], rounds) for r in valid]
+                # Submit this chunk's hashing, then insert the previous chunk meanwhile
+                hashes = executor.map(hash_one, jobs, chunksize=16) if executor else map(hash_one, jobs)
+                if pending:
+                    _insert(session_factory, [_to_row(r, h, allow_admin) for r, h in zip(*pending)], stats)
+                pending = (valid, hashes) if valid else None
+
+            stats['elapsed'] = time.monotonic() - started
+            if progress:
+                progress(stats)
+
+        if pending:
+            _insert(session_factory, [_to_row(r, h, allow_admin) for r, h in zip(*pending)], stats)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    stats['elapsed'] = time.monotonic() - started
+    return stats
+
+
+def print_progress(stats):
+    rate = stats['read'] / stats['elapsed'] if stats['elapsed'] else 0
+    print(f"  {stats['read']:>8} read | {stats['created']:>8} created | {rate:>8.0f} records/s", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('path', help='CSV or JSON Lines file')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='input format (default: from extension)')
+    parser.add_argument('--workers', type=int, default=None, help='hashing processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='records per query/insert')
+    parser.add_argument('--dry-run', action='store_true', help='validate only, insert nothing')
+    parser.add_argument('--allow-admin', action='store_true', help="honour the is_admin column (default: ignore it)")
+    args = parser.parse_args()
+
+    print(f"Importing users from {args.path} (bcrypt cost {policy.rounds})")
+    try:
+        stats = import_users(
+            read_records(args.path, args.format),
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            dry_run=args.dry_run,
+            allow_admin=args.allow_admin,
+            progress=print_progress
+        )
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        sys.exit(1)
+
+    elapsed = stats.pop('elapsed')
+    created = stats.pop('created', 0)
+    print(f"\n✅ Created {created} users from {stats.pop('read', 0)} records in {elapsed:.1f}s "
+          f"({created / elapsed if elapsed else 0:.0f} users/s)")
+    for reason, count in sorted(stats.items()):
+        print(f"   {reason}: {count}")
+
+
+if __name__ == '__main__':
+    main()
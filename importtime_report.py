@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Summarize Python import cost for the app's startup modules.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter for
+each module and prints the total import time plus the most expensive
+top-level packages. Use it to compare worker cold-start cost before and
+after a change (e.g. lazy Firestore initialization).
+
+Usage:
+    python importtime_report.py [module ...] [--top N]
+
+Example:
+    python importtime_report.py database app_factory --top 15
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+DEFAULT_MODULES = ['database', 'app_factory']
+
+
+def measure_imports(module):
+    """
+    Import a module in a fresh interpreter and collect -X importtime data.
+
+    Args:
+        module: Dotted module name to import
+
+    Returns:
+        list: (package, self_us, cumulative_us, depth) tuples in import order
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def summarize(module, top=10):
+    """Print total import time and the packages it is spent in"""
+    rows = measure_imports(module)
+    total_us = sum(self_us for _, self_us, _, _ in rows)
+
+    # Self times add up to the total, so grouping them by root package
+    # attributes startup cost without double counting nested imports
+    by_package = {}
+    for name, self_us, _, _ in rows:
+        root = name.split('.')[0]
+        by_package[root] = by_package.get(root, 0) + self_us
+
+    print(f"\n{module}: {total_us / 1000:.1f} ms total ({len(rows)} modules imported)")
+    print(f"  {'self ms':>10}  package")
+    for name, self_us in sorted(by_package.items(), key=lambda p: p[1], reverse=True)[:top]:
+        print(f"  {self_us / 1000:>10.1f}  {name}")
+
+    firebase_us = sum(by_package.get(root, 0) for root in ('firebase_admin', 'google', 'grpc'))
+    print(f"  firebase/google client libraries: {firebase_us / 1000:.1f} ms")
+    return total_us
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    top = 10
+    if '--top' in args:
+        index = args.index('--top')
+        top = int(args[index + 1])
+        del args[index:index + 2]
+
+    for module in args or DEFAULT_MODULES:
+        try:
+            summarize(module, top)
+        except RuntimeError as e:
+            print(f"\n{module}: import failed ({e})")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Worker that delivers order events from the outbox table.
+
+Claims pending rows in batches (FOR UPDATE SKIP LOCKED on PostgreSQL, so
+several workers can run side by side) and queues each one for every
+notification sink. Each sink's deliveries are sent by its own threads, so
+a slow sink only delays, and a failing sink only retries, its own. Events and deliveries that fail
+outbox.MAX_ATTEMPTS times are dead-lettered; --requeue-dead makes them
+pending again.
+
+Usage:
+    python outbox_worker.py [--once] [--batch-size N] [--interval SECONDS] [--requeue-dead]
+
+Example:
+    python outbox_worker.py --batch-size 200
+"""
+import argparse
+import sys
+import time
+from database.postgres import SessionLocal
+from app.services.outbox import drain_once, start_delivery, dead_count, requeue_dead
+from app.services.notifications import hub
+
+
+def requeue():
+    """Make dead-lettered events pending again"""
+    session = SessionLocal()
+    try:
+        count = requeue_dead(session)
+        session.commit()
+        print(f"✓ Requeued {count} dead-lettered events")
+    finally:
+        session.close()
+
+
+def run(batch_size=100, interval=1.0, once=False):
+    """
+    Hand outbox events to the sinks until interrupted.
+    
+    Full batches are followed immediately by the next claim; the worker
+    only sleeps for `interval` when the outbox is empty. Sink threads
+    deliver in the background meanwhile.
+    
+    Args:
+        batch_size: Max events claimed per transaction
+        interval: Seconds to sleep when nothing is pending
+        once: Hand off everything currently pending, then exit (after
+            giving the sinks `interval` seconds to deliver it)
+    """
+    total_handed_off = total_failed = 0
+    start_delivery(SessionLocal)
+    try:
+        while True:
+            handed_off, failed = drain_once(SessionLocal, batch_size)
+            total_handed_off += handed_off
+            total_failed += failed
+            if handed_off or failed:
+                print(f"✓ Queued {handed_off} events for delivery ({failed} failed)")
+            
+            if handed_off + failed < batch_size:
+                time.sleep(interval)
+                if once:
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hub.shutdown()
+    
+    print(f"Outbox worker stopped: {total_handed_off} events queued, {total_failed} failed")
+    for name, stats in hub.stats().items():
+        print(f"  {name}: {stats['written']} delivered, {stats['failed']} failed")
+    
+    session = SessionLocal()
+    try:
+        dead = dead_count(session)
+    finally:
+        session.close()
+    if dead:
+        print(f"⚠ {dead} dead-lettered events or deliveries (rerun with --requeue-dead once the sink is fixed)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deliver pending order events from the outbox')
+    parser.add_argument('--once', action='store_true', help='exit when the outbox is empty')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--interval', type=float, default=1.0, help='poll interval when idle (seconds)')
+    parser.add_argument('--requeue-dead', action='store_true', help='retry dead-lettered events before draining')
+    args = parser.parse_args()
+    
+    try:
+        if args.requeue_dead:
+            requeue()
+        run(args.batch_size, args.interval, args.once)
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        sys.exit(1)
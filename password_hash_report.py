@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Report the bcrypt cost distribution across user password hashes.
+
+Hashes with a cost other than the current policy are upgraded the next
+time their user logs in.
+
+Usage:
+    python password_hash_report.py
+    python password_hash_report.py --calibrate [--target-ms 250]
+
+Example:
+    python password_hash_report.py --calibrate --target-ms 300
+"""
+import argparse
+from collections import Counter
+from database.postgres import SessionLocal
+from database.models import User
+from app.auth.hashing_policy import policy, rounds_of, DEFAULT_TARGET_MS
+
+
+def cost_distribution(session):
+    """
+    Count users per bcrypt cost.
+
+    Args:
+        session: Open SQLAlchemy session
+
+    Returns:
+        Counter: Cost (None for non-bcrypt hashes) to number of users
+    """
+    counts = Counter()
+    for (password_hash,) in session.query(User.password_hash).yield_per(1000):
+        counts[rounds_of(password_hash)] += 1
+    return counts
+
+
+def print_report(counts, current_rounds):
+    """Print the distribution with the share still awaiting rehash"""
+    total = sum(counts.values())
+    print(f"Policy cost: {current_rounds} ({policy.source})")
+    print(f"Users: {total}")
+    if not total:
+        return
+
+    print(f"\n{'cost':>6}  {'users':>8}  {'share':>7}")
+    for rounds in sorted(counts, key=lambda r: (r is None, r)):
+        label = 'other' if rounds is None else str(rounds)
+        marker = '  <- policy' if rounds == current_rounds else ''
+        print(f"{label:>6}  {counts[rounds]:>8}  {counts[rounds] / total:>7.1%}{marker}")
+
+    stale = sum(n for rounds, n in counts.items() if rounds is not None and rounds < current_rounds)
+    print(f"\nAwaiting rehash on next login: {stale} ({stale / total:.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--calibrate', action='store_true',
+                        help='benchmark this host and record a new policy cost first')
+    parser.add_argument('--target-ms', type=int, default=DEFAULT_TARGET_MS,
+                        help='target hash latency for --calibrate')
+    args = parser.parse_args()
+
+    if args.calibrate:
+        rounds = policy.calibrate(args.target_ms)
+        print(f"✅ Calibrated cost {rounds} ({policy.measured_ms:.0f} ms per hash, "
+              f"target {args.target_ms} ms), recorded in {policy.path}\n")
+
+    session = SessionLocal()
+    try:
+        print_report(cost_distribution(session), policy.rounds)
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -14,7 +14,7 @@ from app_factory import create_app
 from database.postgres import PostgresDB
 from database.models import User, Restaurant
 from app.auth.utils import hash_password
-from flask_login import login_user
+from flask_login import login_user, logout_user
 
 
 # Global database instance for all tests
@@ -114,6 +114,64 @@ def auth_user(client, app, init_db):
         raise
 
 
+def _log_in_as(app, init_db, email, username, is_admin):
+    """Create (or reset) a user with the given admin flag and log it in"""
+    session = init_db.get_session()
+    try:
+        user = session.query(User).filter_by(email=email).first()
+        if user is None:
+            user = User(email=email, username=username, password_hash=hash_password('testpass123'))
+            session.add(user)
+        user.is_admin = is_admin
+        session.commit()
+        user = session.query(User).filter_by(email=email).first()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    
+    # The session-wide app context shares `g`, so this login is what
+    # current_user resolves to in the client's requests
+    with app.test_request_context():
+        login_user(user)
+    return user
+
+
+@pytest.fixture
+def admin_user(client, app, init_db):
+    """Create and log in an admin user (logged out again afterwards)"""
+    yield _log_in_as(app, init_db, 'staff@example.com', 'staff', is_admin=True)
+    with app.test_request_context():
+        logout_user()
+
+
+@pytest.fixture
+def regular_user(client, app, init_db):
+    """Create and log in a user that is never an admin (logged out again afterwards)"""
+    yield _log_in_as(app, init_db, 'regular@example.com', 'regular', is_admin=False)
+    with app.test_request_context():
+        logout_user()
+
+
+# Menu served by the menu_prices fixture: item_id -> (name, price in cents)
+TEST_MENU = {
+    'pizza_1': ('Margherita Pizza', 1299),
+    'pizza_2': ('Pepperoni Pizza', 1499),
+    'pizza_3': ('Garlic Bread', 500),
+}
+
+
+@pytest.fixture
+def menu_prices(monkeypatch):
+    """Serve TEST_MENU for every restaurant instead of loading menus from the app database"""
+    from app.services.price_index import price_index
+    monkeypatch.setattr(price_index, 'loader', lambda restaurant_id: dict(TEST_MENU))
+    price_index.invalidate()
+    yield TEST_MENU
+    price_index.invalidate()
+
+
 @pytest.fixture
 def sample_restaurants(init_db):
     """Create sample restaurant data"""
@@ -3,6 +3,8 @@ import pytest
 import sys
 import os
 import importlib
+import threading
+import time
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -12,7 +14,8 @@ from app_factory import create_app
 
 from database.postgres import SessionLocal, init_db
 from database.models import User
-from app.auth.utils import hash_password, verify_password
+from app.auth.utils import hash_password, verify_password, PasswordWorkPool, PasswordWorkBusy
+from app.auth.hashing_policy import HashingPolicy, calibrate, parse_rounds, rounds_of, policy, MIN_ROUNDS
 
 
 @pytest.fixture
@@ -93,6 +96,174 @@ class TestPasswordUtilities:
         assert hash1 != hash2
 
 
+class TestPasswordWorkPool:
+    """Test admission control around bcrypt work"""
+    
+    def test_rejects_when_wait_queue_full(self):
+        """With every slot busy and no queue room, callers are turned away at once"""
+        pool = PasswordWorkPool(max_concurrency=1, max_waiting=0)
+        release = threading.Event()
+        holder = threading.Thread(target=pool.run, args=(release.wait, 5))
+        holder.start()
+        time.sleep(0.05)
+        
+        started = time.monotonic()
+        with pytest.raises(PasswordWorkBusy) as error:
+            pool.run(lambda: None)
+        assert time.monotonic() - started < 0.1
+        assert error.value.retry_after >= 1
+        
+        release.set()
+        holder.join()
+        assert pool.stats()['rejected'] == 1
+    
+    def test_queue_timeout(self):
+        """Queued callers give up after queue_timeout"""
+        pool = PasswordWorkPool(max_concurrency=1, max_waiting=1, queue_timeout=0.05)
+        release = threading.Event()
+        holder = threading.Thread(target=pool.run, args=(release.wait, 5))
+        holder.start()
+        time.sleep(0.05)
+        
+        with pytest.raises(PasswordWorkBusy):
+            pool.run(lambda: None)
+        
+        release.set()
+        holder.join()
+        assert pool.run(lambda: 'ok') == 'ok'
+        stats = pool.stats()
+        assert stats['timed_out'] == 1
+        assert stats['completed'] == 2
+        assert stats['in_flight'] == 0
+    
+    def test_slots_are_shared_between_processes(self, tmp_path):
+        """Pools using the same slot directory (one per worker process) share one limit"""
+        first = PasswordWorkPool(max_concurrency=1, max_waiting=0, slot_dir=str(tmp_path))
+        second = PasswordWorkPool(max_concurrency=1, max_waiting=1, queue_timeout=1.0, slot_dir=str(tmp_path))
+        release = threading.Event()
+        holder = threading.Thread(target=first.run, args=(release.wait, 5))
+        holder.start()
+        time.sleep(0.05)
+        
+        with pytest.raises(PasswordWorkBusy):
+            PasswordWorkPool(max_concurrency=1, max_waiting=0, slot_dir=str(tmp_path)).run(lambda: None)
+        
+        # A queued caller in the other pool gets the slot once it is released
+        threading.Timer(0.05, release.set).start()
+        assert second.run(lambda: 'ok') == 'ok'
+        holder.join()
+        assert second.stats()['max_wait_ms'] >= 40
+    
+    def test_register_returns_503_when_saturated(self, client, test_user, monkeypatch):
+        """Registration answers fast with Retry-After instead of queueing"""
+        def saturated(fn, *args):
+            raise PasswordWorkBusy(3)
+        monkeypatch.setattr('app.auth.utils.password_pool.run', saturated)
+        
+        response = client.post('/auth/register', data=test_user)
+        
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '3'
+
+
+def fake_measure(base_ms):
+    """Measurement that doubles per round from base_ms at cost 10"""
+    return lambda rounds: base_ms * 2 ** (rounds - 10) / 1000
+
+
+class TestHashingPolicy:
+    """Test bcrypt cost calibration and transparent rehash"""
+    
+    def test_rounds_of(self):
+        """Cost is read from the hash prefix"""
+        assert rounds_of('$2b$12$abcdefghijklmnopqrstuv') == 12
+        assert rounds_of('not-a-hash') is None
+        assert rounds_of(None) is None
+    
+    def test_calibrate_picks_highest_cost_under_target(self):
+        """20ms at cost 10 doubles to 160ms at 13, 320ms at 14"""
+        rounds, measured_ms = calibrate(250, measure=fake_measure(20))
+        assert rounds == 13
+        assert measured_ms == pytest.approx(160)
+    
+    def test_calibrate_never_goes_below_minimum(self):
+        """A slow host still gets the minimum cost"""
+        rounds, _ = calibrate(50, measure=fake_measure(400))
+        assert rounds == 10
+    
+    def test_calibration_is_recorded_for_other_workers(self, tmp_path):
+        """A calibrated cost is loaded by policies created later"""
+        path = str(tmp_path / 'policy.json')
+        HashingPolicy(path=path).calibrate(250, measure=fake_measure(20))
+        
+        other = HashingPolicy(path=path)
+        assert other.load() is True
+        assert other.rounds == 13
+        assert other.source == 'recorded'
+    
+    def test_concurrent_workers_calibrate_once(self, tmp_path):
+        """Workers starting together wait for the first calibration and load its result"""
+        path = str(tmp_path / 'policy.json')
+        calls = []
+        
+        def measure(rounds):
+            calls.append(rounds)
+            time.sleep(0.01)
+            return 0.020 * 2 ** (rounds - 10)
+        
+        policies = [HashingPolicy(path=path) for _ in range(4)]
+        threads = [threading.Thread(target=p.calibrate_once, args=(250, measure)) for p in policies]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert [p.rounds for p in policies] == [13] * 4
+        assert sorted(p.source for p in policies) == ['calibrated', 'recorded', 'recorded', 'recorded']
+        assert len(calls) == 2  # one estimate and one confirmation, by one worker
+        assert [name for name in os.listdir(tmp_path) if name.endswith('.tmp')] == []
+    
+    def test_configured_rounds_are_validated(self, monkeypatch):
+        """PASSWORD_HASH_ROUNDS must be an integer bcrypt accepts, and is raised to the minimum"""
+        assert parse_rounds('12') == 12
+        assert parse_rounds('4') == MIN_ROUNDS
+        assert parse_rounds(-1) == MIN_ROUNDS
+        for value in ('abc', '32', ''):
+            with pytest.raises(ValueError, match='PASSWORD_HASH_ROUNDS'):
+                parse_rounds(value)
+        
+        monkeypatch.setenv('PASSWORD_HASH_ROUNDS', 'twelve')
+        with pytest.raises(ValueError):
+            HashingPolicy.from_env()
+    
+    def test_only_weaker_hashes_need_rehash(self):
+        """Hashes at or above the policy cost are left alone"""
+        policy = HashingPolicy(rounds=12)
+        assert policy.needs_rehash('$2b$10$abcdefghijklmnopqrstuv')
+        assert not policy.needs_rehash('$2b$12$abcdefghijklmnopqrstuv')
+        assert not policy.needs_rehash('$2b$13$abcdefghijklmnopqrstuv')
+    
+    def test_login_rehashes_to_policy_cost(self, client, test_user, monkeypatch):
+        """A successful login upgrades a hash made at an older cost"""
+        test_user = {**test_user, 'email': 'rehash@example.com', 'username': 'rehashuser'}
+        monkeypatch.setattr(policy, 'rounds', 4)
+        client.post('/auth/register', data=test_user)
+        
+        monkeypatch.setattr(policy, 'rounds', 5)
+        client.post('/auth/login', data={
+            'email': test_user['email'],
+            'password': test_user['password']
+        })
+        
+        session = SessionLocal()
+        try:
+            user = session.query(User).filter_by(email=test_user['email']).first()
+            assert rounds_of(user.password_hash) == 5
+            assert verify_password(test_user['password'], user.password_hash)
+        finally:
+            session.close()
+
+
 class TestRegistration:
     """Test user registration"""
     
@@ -2,7 +2,15 @@
 import pytest
 import json
 
+from sqlalchemy import event
 
+from app.services.cart import Cart
+from app.services.cart_view import build_cart_view, view_cache
+from database.postgres import PostgresDB
+from database.models import Restaurant
+
+
+@pytest.mark.usefixtures('menu_prices')
 class TestShoppingCart:
     """Test shopping cart operations"""
     
@@ -191,3 +199,203 @@ class TestShoppingCart:
         data = response.get_json()
         # Total should be 25.98 (12.99 * 2)
         assert abs(data['cart_total'] - 25.98) < 0.01
+
+
+@pytest.mark.usefixtures('menu_prices')
+class TestCartBatch:
+    """Test the batch mutation endpoint"""
+    
+    def add_op(self, item_id, quantity=1):
+        return {'op': 'add', 'restaurant_id': 1, 'item_id': item_id, 'quantity': quantity}
+    
+    def test_batch_applies_all_ops_and_returns_cart(self, client, auth_user):
+        """Without a revision the whole cart comes back"""
+        response = client.post('/cart/batch', json={'ops': [
+            self.add_op('pizza_1', 2),
+            self.add_op('pizza_2'),
+            {'op': 'update', 'restaurant_id': 1, 'item_id': 'pizza_2', 'quantity': 3},
+        ]})
+        data = response.get_json()
+        
+        assert response.status_code == 200
+        assert data['item_count'] == 2
+        assert data['cart_total'] == 70.95
+        assert [i['quantity'] for i in data['cart']['1']['items']] == [2, 3]
+    
+    def test_invalid_op_rejects_whole_batch(self, client, auth_user):
+        """Nothing is applied when any operation is invalid"""
+        response = client.post('/cart/batch', json={'ops': [
+            self.add_op('pizza_1'),
+            self.add_op('pizza_2', quantity=0),
+        ]})
+        assert response.status_code == 400
+        
+        data = client.post('/cart/batch', json={'ops': []}).get_json()
+        assert data['item_count'] == 0
+        assert data['cart'] == {}
+    
+    def test_delta_since_client_revision(self, client, auth_user):
+        """A client with a recent revision gets only the changed lines"""
+        first = client.post('/cart/batch', json={'ops': [self.add_op('pizza_1'), self.add_op('pizza_2')]}).get_json()
+        
+        response = client.post('/cart/batch', json={
+            'since': first['revision'],
+            'ops': [
+                {'op': 'remove', 'restaurant_id': 1, 'item_id': 'pizza_1'},
+                self.add_op('pizza_3'),
+            ]
+        })
+        data = response.get_json()
+        
+        assert 'cart' not in data
+        assert data['delta']['lines'] == [
+            {'restaurant_id': '1', 'item_id': 'pizza_1', 'removed': True},
+            {'restaurant_id': '1', 'item_id': 'pizza_3', 'name': 'Garlic Bread', 'price': 5.0, 'quantity': 1},
+        ]
+        assert data['delta']['restaurant_totals'] == {'1': 19.99}
+    
+    def test_stale_revision_gets_full_cart(self, client, auth_user):
+        """Revisions the change log no longer covers fall back to the whole cart"""
+        client.post('/cart/batch', json={'ops': [self.add_op('pizza_1')]})
+        client.post('/cart/clear')
+        
+        data = client.post('/cart/batch', json={'since': 0, 'ops': []}).get_json()
+        assert data['cart'] == {}
+
+
+class TestCartView:
+    """Test the shared cart view builder"""
+    
+    @pytest.fixture
+    def db(self):
+        db = PostgresDB('sqlite:///:memory:')
+        db.create_tables()
+        session = db.get_session()
+        session.add_all([Restaurant(name=f'Restaurant {n}', city='Springfield') for n in range(12)])
+        session.commit()
+        session.close()
+        view_cache.clear()
+        yield db
+        view_cache.clear()
+    
+    def count_queries(self, db):
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        return statements
+    
+    def make_cart(self, restaurants):
+        cart = Cart()
+        for n in range(1, restaurants + 1):
+            cart.add(n, f'item_{n}', f'Item {n}', 10.00, n)
+        return cart
+    
+    def test_one_query_regardless_of_restaurants(self, db):
+        """Restaurants are resolved with a single IN query"""
+        statements = self.count_queries(db)
+        session = db.get_session()
+        
+        for restaurants in (1, 5, 10):
+            statements.clear()
+            view = build_cart_view(self.make_cart(restaurants), session)
+            assert len(statements) == 1
+            assert len(view['cart_data']) == restaurants
+        session.close()
+        
+        assert view['cart_data'][2]['restaurant_name'] == 'Restaurant 2'
+        assert view['grand_total'] == sum(10.00 * n for n in range(1, 11))
+        assert view['item_count'] == 10
+    
+    def test_memoized_per_revision(self, db):
+        """The same cart revision is built once; a change rebuilds it"""
+        statements = self.count_queries(db)
+        session = db.get_session()
+        cart = self.make_cart(3)
+        
+        first = build_cart_view(cart, session, 'cart-a')
+        assert build_cart_view(cart, session, 'cart-a') is first
+        assert len(statements) == 1
+        
+        cart.remove(2, 'item_2')
+        assert len(build_cart_view(cart, session, 'cart-a')['cart_data']) == 2
+        assert len(statements) == 2
+        session.close()
+    
+    def test_missing_restaurants_left_out(self, db):
+        session = db.get_session()
+        cart = self.make_cart(1)
+        cart.add(999, 'ghost', 'Ghost Item', 5.00)
+        
+        view = build_cart_view(cart, session)
+        assert [r['restaurant_id'] for r in view['cart_data']] == [1]
+        assert view['grand_total'] == 10.00
+        session.close()
+
+
+class TestCartModel:
+    """Test the indexed cart and its running totals"""
+    
+    def test_totals_follow_every_change(self):
+        """Subtotals, grand total and line count stay in step"""
+        cart = Cart()
+        cart.add(1, 'pizza_1', 'Margherita Pizza', 12.99, 2)
+        cart.add(1, 'pizza_2', 'Pepperoni Pizza', 14.99)
+        cart.add('2', 'sushi_1', 'California Roll', 8.50)
+        cart.add(1, 'pizza_1', 'Margherita Pizza', 12.99)
+        
+        assert cart.item_count == 3
+        assert cart.restaurant_total(1) == 53.96
+        assert cart.total_cents == 6246
+        
+        cart.set_quantity(1, 'pizza_2', 3)
+        cart.remove('2', 'sushi_1')
+        assert cart.item_count == 2
+        assert '2' not in cart
+        assert cart.total == 83.94
+        
+        cart.set_quantity(1, 'pizza_1', 0)
+        cart.remove(1, 'pizza_2')
+        assert not cart
+        assert cart.total_cents == 0
+        assert len(cart) == 0
+    
+    def test_unknown_items_are_ignored(self):
+        cart = Cart()
+        cart.add(1, 'pizza_1', 'Margherita Pizza', 12.99)
+        
+        assert cart.remove(1, 'missing') is False
+        assert cart.set_quantity(3, 'pizza_1', 2) is False
+        assert cart.total_cents == 1299
+    
+    def test_round_trip_and_legacy_migration(self):
+        """Stored carts reload with the same totals; old list carts migrate"""
+        legacy = {'1': {'items': [
+            {'item_id': 'pizza_1', 'name': 'Margherita Pizza', 'price': 12.99, 'quantity': 2},
+            {'item_id': 'pizza_2', 'name': 'Pepperoni Pizza', 'price': 14.99, 'quantity': 1}
+        ], 'total': 40.97}}
+        cart = Cart.from_dict(legacy)
+        assert cart.items(1) == legacy['1']['items']
+        assert cart.restaurant_total(1) == 40.97
+        
+        stored = cart.to_dict()
+        assert stored['version'] == 2
+        reloaded = Cart.from_dict(json.loads(json.dumps(stored)))
+        assert reloaded.items(1) == cart.items(1)
+        assert reloaded.total_cents == 4097
+        assert reloaded.item_count == 2
+    
+    def test_change_log(self):
+        """changes_since lists each changed line once, or None once out of range"""
+        cart = Cart()
+        cart.add(1, 'pizza_1', 'Margherita Pizza', 12.99)
+        start = cart.revision
+        cart.set_quantity(1, 'pizza_1', 2)
+        cart.add(1, 'pizza_2', 'Pepperoni Pizza', 14.99)
+        cart.remove(1, 'pizza_1')
+        
+        assert cart.changes_since(start) == [('1', 'pizza_1'), ('1', 'pizza_2')]
+        assert cart.changes_since(cart.revision) == []
+        assert cart.changes_since(cart.revision + 1) is None
+        
+        for n in range(60):
+            cart.set_quantity(1, 'pizza_2', n + 1)
+        assert cart.changes_since(start) is None
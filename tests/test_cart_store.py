@@ -0,0 +1,255 @@
+"""Tests for the server-side cart store"""
+import socketserver
+import threading
+import pytest
+
+from database.postgres import PostgresDB
+from app.services.cart_store import (
+    encode_cart, decode_cart, MemoryCartBackend, SQLiteCartBackend, RedisCartBackend,
+    DatabaseCartBackend, build_cart_backend
+)
+from app.services.cart_persistence import CartPersistence
+
+
+def sample_cart(items=3):
+    return {'1': {
+        'items': [{'item_id': f'item_{n}', 'name': f'Item {n}', 'price': 9.99, 'quantity': 1}
+                  for n in range(items)],
+        'total': round(9.99 * items, 2)
+    }}
+
+
+class StubRedisHandler(socketserver.StreamRequestHandler):
+    """Enough of a RESP server for GET/SET/DEL"""
+    data = {}
+
+    def read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        while True:
+            args = self.read_command()
+            if args is None:
+                break
+            command = args[0].upper()
+            if command == b'SET':
+                StubRedisHandler.data[args[1]] = args[2]
+                self.wfile.write(b'+OK\r\n')
+            elif command == b'GET':
+                value = StubRedisHandler.data.get(args[1])
+                if value is None:
+                    self.wfile.write(b'$-1\r\n')
+                else:
+                    self.wfile.write(b'$%d\r\n%s\r\n' % (len(value), value))
+            elif command == b'DEL':
+                removed = StubRedisHandler.data.pop(args[1], None) is not None
+                self.wfile.write(b':%d\r\n' % removed)
+            else:
+                self.wfile.write(b'-ERR unknown command\r\n')
+
+
+class TestSerialization:
+    """Test the compact blob format"""
+
+    def test_round_trip(self):
+        assert decode_cart(encode_cart(sample_cart())) == sample_cart()
+
+    def test_blob_smaller_than_json(self):
+        """Repetitive cart JSON compresses well"""
+        import json
+        cart = sample_cart(50)
+        assert len(encode_cart(cart)) < len(json.dumps(cart)) / 3
+
+    def test_unknown_format_reads_as_empty(self):
+        assert decode_cart(b'\x09garbage') == {}
+        assert decode_cart(None) == {}
+
+
+class TestBackends:
+    """Test each storage backend"""
+
+    def test_sqlite_backend_shared_between_instances(self, tmp_path):
+        """Workers on one host see each other's carts"""
+        path = str(tmp_path / 'carts.db')
+        SQLiteCartBackend(path).set('abc', b'blob')
+
+        other = SQLiteCartBackend(path)
+        assert other.get('abc') == b'blob'
+        other.delete('abc')
+        assert other.get('abc') is None
+
+    def test_expired_carts_are_not_returned(self, tmp_path):
+        backend = SQLiteCartBackend(str(tmp_path / 'carts.db'), ttl=-1)
+        backend.set('abc', b'blob')
+        assert backend.get('abc') is None
+
+        memory = MemoryCartBackend(ttl=-1)
+        memory.set('abc', b'blob')
+        assert memory.get('abc') is None
+
+    def test_sqlite_backend_opens_lazily(self, tmp_path):
+        """Building the backend (at app start) creates no files"""
+        path = tmp_path / 'instance' / 'carts.db'
+        backend = build_cart_backend(f'sqlite:///{path}')
+        assert not path.parent.exists()
+        backend.set('abc', b'blob')
+        assert backend.get('abc') == b'blob'
+
+    def test_database_backend(self, carts_db):
+        """database:// keeps carts in the app database, shared by every instance"""
+        backend = DatabaseCartBackend(carts_db.get_session)
+        backend.set('abc', b'blob')
+        backend.set('abc', b'newer')
+        assert DatabaseCartBackend(carts_db.get_session).get('abc') == b'newer'
+        backend.delete('abc')
+        assert backend.get('abc') is None
+
+        expired = DatabaseCartBackend(carts_db.get_session, ttl=-1, purge_every=1)
+        expired.set('old', b'blob')
+        assert expired.get('old') is None
+        assert isinstance(build_cart_backend('database://'), DatabaseCartBackend)
+
+    def test_store_must_be_configured(self):
+        """Production has no default store to fall back on"""
+        for url in (None, ''):
+            with pytest.raises(ValueError, match='CART_STORE'):
+                build_cart_backend(url)
+
+    def test_redis_backend_over_resp(self):
+        """The built-in RESP client stores binary blobs"""
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), StubRedisHandler)
+        server.daemon_threads = True  # the backend keeps its connection open
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        StubRedisHandler.data = {}
+        try:
+            backend = build_cart_backend(f'redis://127.0.0.1:{server.server_address[1]}/0')
+            assert isinstance(backend, RedisCartBackend)
+            blob = encode_cart(sample_cart())
+
+            backend.set('abc', blob)
+            assert StubRedisHandler.data[b'cart:abc'] == blob
+            assert backend.get('abc') == blob
+            backend.delete('abc')
+            assert backend.get('abc') is None
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+@pytest.mark.usefixtures('menu_prices')
+class TestCartRoutes:
+    """Test that the cookie only carries a cart id"""
+
+    def test_cart_kept_out_of_cookie(self, client, auth_user):
+        client.post('/cart/add', json={
+            'restaurant_id': 1, 'item_id': 'pizza_1', 'name': 'Margherita Pizza',
+            'price': 12.99, 'quantity': 1
+        })
+
+        with client.session_transaction() as sess:
+            assert 'cart' not in sess
+            assert sess['cart_id']
+
+        response = client.post('/cart/update', json={'restaurant_id': 1, 'item_id': 'pizza_1', 'quantity': 3})
+        assert response.get_json()['item_count'] == 1
+
+    def test_legacy_cookie_cart_is_migrated(self, client, auth_user):
+        """A cart left in the cookie by the old code moves to the store"""
+        with client.session_transaction() as sess:
+            sess['cart'] = sample_cart(2)
+
+        response = client.post('/cart/update', json={'restaurant_id': 1, 'item_id': 'item_0', 'quantity': 2})
+        assert response.get_json()['item_count'] == 2
+
+        with client.session_transaction() as sess:
+            assert 'cart' not in sess
+            assert sess['cart_id']
+
+    def test_store_failure_is_logged_not_raised(self, app, client, auth_user, monkeypatch, caplog):
+        """A store outage still answers the request and logs the traceback"""
+        def unavailable(cart_id, blob):
+            raise ConnectionError('store down')
+        monkeypatch.setattr(app.extensions['cart_store'], 'set', unavailable)
+
+        response = client.post('/cart/add', json={'restaurant_id': 1, 'item_id': 'pizza_1', 'quantity': 1})
+
+        assert response.status_code == 200
+        record = next(r for r in caplog.records if r.getMessage().startswith('Error saving cart'))
+        assert record.exc_info[0] is ConnectionError
+
+
+@pytest.fixture
+def carts_db():
+    """Fresh in-memory database holding the carts table"""
+    db = PostgresDB('sqlite:///:memory:')
+    db.create_tables()
+    yield db
+    db.drop_tables()
+
+
+class TestCartPersistence:
+    """Test durable per-user carts and write coalescing"""
+
+    def test_saves_coalesce_into_one_write(self, carts_db):
+        """A burst of saves is one upsert holding each user's latest cart"""
+        persistence = CartPersistence(carts_db.get_session, window=60)
+        for n in range(10):
+            persistence.save(1, b'cart-1-v%d' % n)
+        persistence.save(2, b'cart-2')
+        assert persistence.load(1) == b'cart-1-v9'  # pending saves are visible
+
+        assert persistence.flush() == 2
+        persistence.save(2, b'cart-2-v2')
+        persistence.flush()
+
+        assert persistence.load(1) == b'cart-1-v9'
+        assert persistence.load(2) == b'cart-2-v2'
+        stats = persistence.stats()
+        assert (stats['saves'], stats['writes'], stats['rows_written']) == (12, 2, 3)
+        persistence.shutdown()
+
+    def test_database_failures_are_retried(self, carts_db):
+        """A failed write keeps the carts pending without raising"""
+        broken = PostgresDB('sqlite:///:memory:')  # no tables
+        persistence = CartPersistence(broken.get_session, window=60)
+        persistence.save(1, b'cart')
+
+        assert persistence.flush() == 0
+        assert persistence.stats()['failures'] == 1
+        assert persistence.load(1) == b'cart'
+
+        persistence.session_factory = carts_db.get_session
+        assert persistence.flush() == 1
+        persistence.session_factory = broken.get_session
+        assert persistence.load(3) is None  # read errors come back as no cart
+        persistence.shutdown()
+
+    def test_cart_follows_user_across_devices(self, app, auth_user, carts_db, menu_prices):
+        """A second client sees the cart, even after the store lost it"""
+        persistence = CartPersistence(carts_db.get_session, window=60)
+        app.extensions['cart_persistence'] = persistence
+        store = app.extensions['cart_store']
+        try:
+            phone = app.test_client()
+            phone.post('/cart/batch', json={'ops': [{
+                'op': 'add', 'restaurant_id': 1, 'item_id': 'pizza_1', 'name': 'Margherita Pizza', 'price': 12.99
+            }]})
+            persistence.flush()
+
+            app.extensions['cart_store'] = MemoryCartBackend()  # store expired
+            laptop = app.test_client()
+            data = laptop.post('/cart/batch', json={'ops': []}).get_json()
+            assert data['item_count'] == 1
+            assert data['cart']['1']['items'][0]['item_id'] == 'pizza_1'
+        finally:
+            app.extensions.pop('cart_persistence')
+            app.extensions['cart_store'] = store
+            persistence.shutdown()
+
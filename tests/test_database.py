@@ -8,7 +8,7 @@ from datetime import datetime
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.postgres import PostgresDB
-from database.models import User, Restaurant, Order, OrderItem, Payment, OrderStatus
+from database.models import User, Restaurant, Order, OrderItem, Payment, OrderStatus, slugify
 
 class TestPostgresDatabaseConnection:
     """Test PostgreSQL connection with in-memory SQLite"""
@@ -165,6 +165,164 @@ class TestPostgresDatabaseConnection:
         
         session.close()
 
+    
+    def test_restaurant_slug_defaults_from_name(self):
+        """Test slug is derived from the name on insert"""
+        session = self.db.get_session()
+        
+        restaurant = Restaurant(name='The Curry House')
+        session.add(restaurant)
+        session.commit()
+        
+        assert restaurant.slug == 'the_curry_house'
+        session.close()
+    
+    def test_restaurant_slug_survives_rename(self):
+        """Test renaming a restaurant keeps its Firestore key"""
+        session = self.db.get_session()
+        
+        restaurant = Restaurant(name='Pizza Palace')
+        session.add(restaurant)
+        session.commit()
+        
+        restaurant.name = 'Pizza Palace Deluxe'
+        session.commit()
+        
+        retrieved = session.query(Restaurant).filter_by(slug='pizza_palace').first()
+        assert retrieved is not None
+        assert retrieved.name == 'Pizza Palace Deluxe'
+        session.close()
+    
+    def test_backfill_restaurant_slugs(self):
+        """Test restaurants without a slug get one assigned"""
+        session = self.db.get_session()
+        session.add(Restaurant(name='Burger Haven'))
+        session.commit()
+        # Simulate a row created before the slug column existed
+        session.query(Restaurant).update({Restaurant.slug: None})
+        session.commit()
+        session.close()
+        
+        assert self.db.backfill_restaurant_slugs() == 1
+        
+        session = self.db.get_session()
+        assert session.query(Restaurant).first().slug == 'burger_haven'
+        session.close()
+    
+    def test_restaurants_with_the_same_name_get_distinct_slugs(self):
+        """Test a chain's branches don't collide on the unique slug"""
+        session = self.db.get_session()
+        session.add(Restaurant(name='Pizza Palace', city='New York'))
+        session.commit()
+        session.add_all([
+            Restaurant(name='Pizza Palace', city='Boston'),
+            Restaurant(name='Pizza Palace', city='Boston'),
+            Restaurant(name='Pizza Palace')
+        ])
+        session.commit()
+        
+        slugs = [r.slug for r in session.query(Restaurant).order_by(Restaurant.id)]
+        assert slugs == ['pizza_palace', 'pizza_palace_boston', 'pizza_palace_2', 'pizza_palace_3']
+        session.close()
+    
+    def test_backfill_avoids_duplicate_slugs(self):
+        """Test backfilled restaurants sharing a name get distinct slugs"""
+        session = self.db.get_session()
+        session.add_all([Restaurant(name='Burger Haven', city='Austin'), Restaurant(name='Burger Haven', city='Dallas')])
+        session.commit()
+        session.query(Restaurant).update({Restaurant.slug: None})
+        session.commit()
+        session.close()
+        
+        assert self.db.backfill_restaurant_slugs() == 2
+        
+        session = self.db.get_session()
+        assert [r.slug for r in session.query(Restaurant).order_by(Restaurant.id)] == [
+            'burger_haven', 'burger_haven_dallas'
+        ]
+        session.close()
+    
+    def test_slugify(self):
+        """Test slug format matches existing Firestore keys"""
+        assert slugify('Pizza Palace') == 'pizza_palace'
+        assert slugify('  Dragon   Wok ') == 'dragon_wok'
+
+
+
+class TestSchemaUpgrade:
+    """Test upgrading tables created by an older release"""
+    
+    OLD_TABLES = [
+        """CREATE TABLE restaurants (
+            id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, description TEXT, phone VARCHAR(20),
+            city VARCHAR(100), address TEXT, created_at DATETIME, updated_at DATETIME
+        )""",
+        "INSERT INTO restaurants (id, name, city) VALUES (1, 'Burger Haven', 'Dallas')",
+        """CREATE TABLE orders (
+            id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, restaurant_id INTEGER NOT NULL,
+            status VARCHAR(9), total_price FLOAT NOT NULL, notes TEXT, delivery_address TEXT,
+            created_at DATETIME, updated_at DATETIME
+        )""",
+        "INSERT INTO orders (id, user_id, restaurant_id, status, total_price, created_at) "
+        "VALUES (1, 1, 1, 'PENDING', 9.5, '2026-01-01 12:00:00')",
+    ]
+    
+    @pytest.fixture
+    def old_db(self, tmp_path):
+        db = PostgresDB(f"sqlite:///{tmp_path / 'old.db'}")
+        with db.engine.begin() as connection:
+            for statement in self.OLD_TABLES:
+                connection.exec_driver_sql(statement)
+        db.create_tables()
+        yield db
+        db.engine.dispose()
+    
+    def test_restaurant_slug_is_added_and_backfilled(self, old_db):
+        """Test the slug column and its unique index are added, then filled in"""
+        assert 'restaurants.slug' in old_db.upgrade_schema()
+        assert old_db.upgrade_schema() == []
+        assert old_db.backfill_restaurant_slugs() == 1
+        
+        session = old_db.get_session()
+        assert session.query(Restaurant).one().slug == 'burger_haven'
+        session.add(Restaurant(name='Pizza Palace'))
+        session.commit()
+        assert session.query(Restaurant).filter_by(slug='pizza_palace').count() == 1
+        session.close()
+
+    
+    def test_order_transition_columns_are_added(self, old_db):
+        """Test existing orders get a version and can be transitioned"""
+        from app.services.order_state import transition
+        
+        assert old_db.upgrade_schema()[:5] == [
+            'restaurants.slug', 'orders.version', 'orders.previous_status',
+            'orders.status_changed_at', 'orders.previous_status_since'
+        ]
+        session = old_db.get_session()
+        assert session.query(Order).one().version == 1
+        result = transition(session, 1, OrderStatus.CONFIRMED, expected_version=1)
+        session.commit()
+        assert (result.ok, result.version) == (True, 2)
+        order = session.query(Order).one()
+        assert (order.previous_status, order.previous_status_since) == (
+            OrderStatus.PENDING, datetime(2026, 1, 1, 12)
+        )
+        session.close()
+    
+    def test_kitchen_queue_index_is_built(self, old_db):
+        """Test the kitchen queue's partial index is created on an existing orders table"""
+        from sqlalchemy import select
+        from app.services import kitchen_queue
+        
+        assert 'ix_orders_kitchen_queue' in old_db.upgrade_schema()
+        statement = select(Order.id).where(Order.restaurant_id == 1, kitchen_queue._active()).order_by(
+            Order.created_at, Order.id
+        )
+        compiled = statement.compile(old_db.engine, compile_kwargs={'literal_binds': True})
+        with old_db.engine.connect() as connection:
+            plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+        assert 'ix_orders_kitchen_queue' in str(plan)
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
@@ -0,0 +1,154 @@
+"""Tests for the domain event bus"""
+import threading
+import time
+
+from app.services.events import (
+    EventBus, OrderCreated, OrderStatusChanged, OrderCancelled, ReviewSubmitted
+)
+from app.services.order_metrics import LifecycleCounters
+
+
+class TestEventBus:
+    """Test sync/async delivery, ordering and metrics"""
+
+    def test_sync_subscribers_run_in_publish(self):
+        """Sync handlers have run by the time publish returns"""
+        bus = EventBus()
+        seen = []
+        bus.subscribe(OrderCreated, seen.append)
+
+        event = OrderCreated(1, 2, 3, 25.0)
+        bus.publish(event)
+        bus.publish(ReviewSubmitted(3, 2, 5))
+
+        assert seen == [event]
+        assert bus.stats()['published'] == {'OrderCreated': 1, 'ReviewSubmitted': 1}
+
+    def test_failing_subscriber_is_isolated(self):
+        """One handler raising doesn't stop the others or the publisher"""
+        bus = EventBus()
+        seen = []
+
+        def broken(event):
+            raise RuntimeError('boom')
+
+        bus.subscribe(OrderCancelled, broken, name='broken')
+        bus.subscribe(OrderCancelled, seen.append, name='recorder')
+        bus.publish(OrderCancelled(1, 'pending'))
+
+        assert len(seen) == 1
+        stats = {s['name']: s for s in bus.stats()['subscribers']}
+        assert stats['broken']['errors'] == 1
+        assert stats['recorder']['calls'] == 1
+
+    def test_async_subscribers_do_not_block_publisher(self):
+        """Slow async handlers run off the request thread"""
+        bus = EventBus(shards=2)
+        release = threading.Event()
+        seen = []
+
+        def slow(event):
+            release.wait(5)
+            seen.append(event.order_id)
+
+        bus.subscribe(OrderCreated, slow, mode='async')
+        started = time.monotonic()
+        bus.publish(OrderCreated(1, 1, 1, 10.0))
+        assert time.monotonic() - started < 0.1
+        assert seen == []
+
+        release.set()
+        bus.flush()
+        bus.shutdown()
+        assert seen == [1]
+
+    def test_async_delivery_is_ordered_per_order(self):
+        """Events for one order arrive in publish order across shards"""
+        bus = EventBus(shards=4)
+        seen = {}
+        lock = threading.Lock()
+
+        def record(event):
+            with lock:
+                seen.setdefault(event.order_id, []).append(event.new_status)
+
+        bus.subscribe(OrderStatusChanged, record, mode='async')
+        statuses = ['confirmed', 'preparing', 'ready', 'delivered']
+        for status in statuses:
+            for order_id in range(20):
+                bus.publish(OrderStatusChanged(order_id, 'x', status))
+        bus.flush()
+        bus.shutdown()
+
+        assert seen == {order_id: statuses for order_id in range(20)}
+
+    def test_resubscribing_replaces_handler(self):
+        """Registering a name twice (e.g. app created twice) delivers once"""
+        bus = EventBus()
+        seen = []
+        bus.subscribe(OrderCreated, seen.append, name='recorder')
+        bus.subscribe(OrderCreated, seen.append, name='recorder')
+
+        bus.publish(OrderCreated(1, 1, 1, 10.0))
+
+        assert len(seen) == 1
+
+    def test_full_queue_drops_async_delivery(self):
+        """A saturated shard drops instead of blocking and counts it"""
+        bus = EventBus(shards=1, max_queue=1)
+        release = threading.Event()
+        bus.subscribe(OrderCreated, lambda event: release.wait(5), mode='async')
+
+        for n in range(5):
+            bus.publish(OrderCreated(n, 1, 1, 10.0))
+        release.set()
+        bus.shutdown()
+
+        assert bus.stats()['dropped'] >= 3
+
+    def test_publish_after_shutdown_counts_drop(self):
+        """Async deliveries refused during shutdown show up as drops"""
+        bus = EventBus(shards=1)
+        bus.subscribe(OrderCreated, lambda event: None, mode='async')
+        bus.shutdown()
+
+        bus.publish(OrderCreated(1, 1, 1, 10.0))
+
+        assert bus.stats()['dropped'] == 1
+
+
+class TestLifecycleCounters:
+    """Test the order and review counters fed by the bus"""
+
+    def test_every_lifecycle_event_has_a_subscriber(self):
+        """The global bus routes all four lifecycle events to the counters"""
+        from app.services.events import bus
+
+        subscribed = {s['event'] for s in bus.stats()['subscribers']}
+
+        assert {'OrderCreated', 'OrderStatusChanged', 'OrderCancelled', 'ReviewSubmitted'} <= subscribed
+
+    def test_counts_lifecycle_events(self):
+        """Async subscribers tally orders, transitions, cancellations and ratings"""
+        bus = EventBus(shards=2)
+        counters = LifecycleCounters()
+        bus.subscribe(OrderCreated, counters.order_created, mode='async')
+        bus.subscribe(OrderStatusChanged, counters.status_changed, mode='async')
+        bus.subscribe(OrderCancelled, counters.order_cancelled, mode='async')
+        bus.subscribe(ReviewSubmitted, counters.review_submitted, mode='async')
+
+        bus.publish(OrderCreated(1, 1, 1, 12.5))
+        bus.publish(OrderCreated(2, 1, 1, 7.25))
+        bus.publish(OrderStatusChanged(1, 'pending', 'confirmed'))
+        bus.publish(OrderCancelled(2, 'pending'))
+        bus.publish(ReviewSubmitted(1, 1, 5))
+        bus.flush()
+        bus.shutdown()
+
+        assert counters.snapshot() == {
+            'orders_created': 2,
+            'revenue': 19.75,
+            'transitions': {'pending->confirmed': 1},
+            'cancelled_from': {'pending': 1},
+            'reviews_by_rating': {5: 1},
+        }
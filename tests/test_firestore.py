@@ -0,0 +1,377 @@
+"""Tests for the Firestore wrapper using an in-memory fake client"""
+import pytest
+import sys
+import os
+import threading
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.firestore import (
+    FirestoreDB, FirestoreUnavailable, MENU_LAYOUT_DOCUMENT, MENU_LAYOUT_COLLECTION, IN_QUERY_LIMIT
+)
+from database.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+class FakeSnapshot:
+    """Minimal stand-in for a Firestore DocumentSnapshot"""
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, client, collection, doc_id):
+        self.client = client
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self, **kwargs):
+        self.client.calls.append(('get', self.collection, self.id))
+        self.client.simulate_outage(kwargs.get('timeout'))
+        return FakeSnapshot(self.id, self.client.data[self.collection].get(self.id))
+
+    def set(self, data, merge=False, **kwargs):
+        self.client.data[self.collection][self.id] = dict(data)
+
+
+class FakeQuery:
+    def __init__(self, client, collection, filters=()):
+        self.client = client
+        self.collection = collection
+        self.filters = list(filters)
+
+    def where(self, field, op, value):
+        return FakeQuery(self.client, self.collection, self.filters + [(field, op, value)])
+
+    def order_by(self, *args, **kwargs):
+        return self
+
+    def select(self, field_paths):
+        return self
+
+    def count(self, alias):
+        return FakeAggregation(self, [('count', None, alias)])
+
+    def stream(self, **kwargs):
+        self.client.calls.append(('stream', self.collection, tuple(self.filters)))
+        self.client.simulate_outage(kwargs.get('timeout'))
+        for doc_id, data in self.client.data[self.collection].items():
+            if all(self._matches(data, f) for f in self.filters):
+                yield FakeSnapshot(doc_id, data)
+
+    @staticmethod
+    def _matches(data, condition):
+        field, op, value = condition
+        if op == '==':
+            return data.get(field) == value
+        if op == 'in':
+            return data.get(field) in value
+        raise NotImplementedError(op)
+
+
+class FakeAggregation:
+    """count()/sum() aggregation over a FakeQuery"""
+    def __init__(self, query, aggregates):
+        self.query = query
+        self.aggregates = aggregates
+
+    def sum(self, field, alias):
+        return FakeAggregation(self.query, self.aggregates + [('sum', field, alias)])
+
+    def get(self, **kwargs):
+        self.query.client.calls.append(('aggregate', self.query.collection, tuple(self.query.filters)))
+        docs = [data for data in self.query.client.data[self.query.collection].values()
+                if all(FakeQuery._matches(data, f) for f in self.query.filters)]
+        results = []
+        for kind, field, alias in self.aggregates:
+            value = len(docs) if kind == 'count' else sum(doc.get(field) or 0 for doc in docs)
+            results.append(type('AggregationResult', (), {'alias': alias, 'value': value})())
+        return [results]
+
+
+class FakeCollection(FakeQuery):
+    def document(self, doc_id=None):
+        return FakeDocument(self.client, self.collection, doc_id or f'doc{len(self.client.data[self.collection])}')
+
+
+class FakeFirestoreClient:
+    """In-memory Firestore client recording the calls made against it"""
+    def __init__(self):
+        self.data = {}
+        self.calls = []
+        self.outage = False
+
+    def simulate_outage(self, timeout):
+        """During an outage, hang until the caller's deadline then fail"""
+        if self.outage:
+            time.sleep(timeout)
+            raise TimeoutError('Deadline Exceeded')
+
+    def collection(self, name):
+        self.data.setdefault(name, {})
+        return FakeCollection(self, name)
+
+    def get_all(self, references, **kwargs):
+        self.calls.append(('get_all', tuple(ref.id for ref in references)))
+        self.simulate_outage(kwargs.get('timeout'))
+        for ref in references:
+            yield FakeSnapshot(ref.id, self.data[ref.collection].get(ref.id))
+
+
+def make_db(layout, client=None):
+    """Build a FirestoreDB wired to a fake client"""
+    firestore_db = FirestoreDB(menu_layout=layout)
+    firestore_db.db = client or FakeFirestoreClient()
+    firestore_db.initialized = True
+    return firestore_db
+
+
+class TestMenuLayouts:
+    """Test menu reads in both storage layouts"""
+
+    def test_document_layout_reads_single_document(self):
+        """Document layout fetches a menu with one document get"""
+        client = FakeFirestoreClient()
+        client.collection('menus').document('pizza_palace').set({
+            'items': [{'id': 'a1', 'name': 'Margherita Pizza', 'price': 12.99}]
+        })
+        firestore_db = make_db(MENU_LAYOUT_DOCUMENT, client)
+
+        items = firestore_db.get_menu_items('pizza_palace')
+
+        assert [i['name'] for i in items] == ['Margherita Pizza']
+        assert client.calls == [('get', 'menus', 'pizza_palace')]
+
+    def test_document_layout_missing_menu(self):
+        """Unknown slug returns an empty menu"""
+        firestore_db = make_db(MENU_LAYOUT_DOCUMENT)
+        assert firestore_db.get_menu_items('nowhere') == []
+
+    def test_collection_layout_filters_by_slug(self):
+        """Collection layout filters menu_items by restaurant slug"""
+        client = FakeFirestoreClient()
+        client.collection('menu_items').document('x').set({'restaurant_id': 'burger_haven', 'name': 'Fries'})
+        client.collection('menu_items').document('y').set({'restaurant_id': 'pizza_palace', 'name': 'Pizza'})
+        firestore_db = make_db(MENU_LAYOUT_COLLECTION, client)
+
+        items = firestore_db.get_menu_items('burger_haven')
+
+        assert items == [{'restaurant_id': 'burger_haven', 'name': 'Fries', 'id': 'x'}]
+
+
+class TestLazyInitialization:
+    """Test Firestore connects on first use rather than at construction"""
+
+    def test_construction_does_not_connect(self, monkeypatch):
+        """Building the wrapper doesn't touch firebase_admin"""
+        calls = []
+        monkeypatch.setattr(FirestoreDB, '_connect', lambda self: calls.append(1))
+
+        firestore_db = FirestoreDB()
+
+        assert calls == []
+        firestore_db.get_restaurants()
+        assert calls == [1]
+
+    def test_concurrent_first_use_connects_once(self, monkeypatch):
+        """Many threads hitting a cold wrapper trigger a single connect"""
+        calls = []
+
+        def slow_connect(self):
+            calls.append(1)
+            time.sleep(0.05)
+
+        monkeypatch.setattr(FirestoreDB, '_connect', slow_connect)
+        firestore_db = FirestoreDB()
+
+        threads = [threading.Thread(target=firestore_db.get_menu_items, args=('pizza_palace',)) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls == [1]
+        assert firestore_db.initialized is False
+
+
+class TestCircuitBreaker:
+    """Test breaker state transitions"""
+
+    def test_opens_after_threshold_and_recovers(self):
+        """Breaker opens on repeated failures and closes after a good trial call"""
+        now = [0.0]
+        breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=10, clock=lambda: now[0])
+
+        for _ in range(3):
+            assert breaker.allow_request()
+            breaker.record_failure()
+
+        assert breaker.state == OPEN
+        assert breaker.allow_request() is False
+
+        now[0] = 10.0
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow_request() is True
+        assert breaker.allow_request() is False  # only one trial call
+        breaker.record_success()
+
+        assert breaker.state == CLOSED
+        snapshot = breaker.snapshot()
+        assert snapshot['times_opened'] == 1
+        assert snapshot['short_circuited'] == 2
+
+    def test_failed_trial_reopens(self):
+        """A failing half-open trial reopens the breaker"""
+        now = [0.0]
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=5, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 5.0
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert breaker.snapshot()['times_opened'] == 2
+
+
+class TestFirestoreOutage:
+    """Fault injection: Firestore hangs until the deadline on every call"""
+
+    def make_outage_db(self):
+        client = FakeFirestoreClient()
+        client.collection('menu_items').document('x').set({'restaurant_id': 'pizza_palace', 'name': 'Pizza'})
+        firestore_db = make_db(MENU_LAYOUT_COLLECTION, client)
+        firestore_db.deadline = 0.05
+        firestore_db.breaker = CircuitBreaker('firestore', failure_threshold=3, reset_timeout=60)
+        return firestore_db, client
+
+    def test_worker_time_bounded_during_outage(self):
+        """Only `threshold` calls wait for the deadline; the rest fail fast"""
+        firestore_db, client = self.make_outage_db()
+        client.outage = True
+
+        started = time.monotonic()
+        for _ in range(50):
+            firestore_db.get_menu_items('pizza_palace')
+        elapsed = time.monotonic() - started
+
+        assert len(client.calls) == 3
+        assert elapsed < 3 * firestore_db.deadline + 0.5
+        assert firestore_db.status()['breaker']['state'] == OPEN
+        assert firestore_db.status()['breaker']['short_circuited'] == 47
+
+    def test_serves_last_known_data_while_open(self):
+        """Reads fall back to the last successful result during an outage"""
+        firestore_db, client = self.make_outage_db()
+        healthy = firestore_db.get_menu_items('pizza_palace')
+        client.outage = True
+
+        for _ in range(10):
+            assert firestore_db.get_menu_items('pizza_palace') == healthy
+
+    def test_strict_read_raises_instead_of_degrading(self):
+        """read_menu_items() never passes stale or mock data off as the menu"""
+        firestore_db, client = self.make_outage_db()
+        assert [item['name'] for item in firestore_db.read_menu_items('pizza_palace')] == ['Pizza']
+        assert firestore_db.read_menu_items('nowhere') == []
+        client.outage = True
+
+        for _ in range(5):  # failing, then short-circuited by the open breaker
+            with pytest.raises(FirestoreUnavailable):
+                firestore_db.read_menu_items('pizza_palace')
+
+    def test_concurrent_workers_bounded_during_outage(self):
+        """Concurrent workers stop waiting on Firestore once the breaker opens"""
+        firestore_db, client = self.make_outage_db()
+        client.outage = True
+
+        def worker():
+            for _ in range(10):
+                firestore_db.get_menu_items('pizza_palace')
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        # Workers already in flight when the breaker trips finish their wait,
+        # but nobody waits on Firestore more than twice
+        threshold = firestore_db.breaker.failure_threshold
+        assert threshold <= len(client.calls) <= len(threads) + threshold
+        assert elapsed < 2 * firestore_db.deadline + 0.5
+
+
+class TestBatchLookups:
+    """Test multi-restaurant menu and rating lookups"""
+
+    def make_review_client(self, restaurant_count):
+        client = FakeFirestoreClient()
+        reviews = client.collection('reviews')
+        for n in range(restaurant_count):
+            for rating in (3, 4, 5):
+                reviews.document(f'r{n}_{rating}').set({'restaurant_id': f'rest_{n}', 'rating': rating})
+        return client
+
+    def test_rating_summaries_for_fifty_restaurants(self):
+        """50 restaurants are summarized from their counters in two chunked gets"""
+        client = FakeFirestoreClient()
+        for n in range(50):
+            client.collection('rating_summaries').document(f'rest_{n}').set({'review_count': 3, 'rating_sum': 12})
+        firestore_db = make_db(MENU_LAYOUT_COLLECTION, client)
+        ids = [f'rest_{n}' for n in range(50)] + ['no_reviews']
+
+        summaries = firestore_db.get_rating_summaries(ids)
+
+        assert [call[0] for call in client.calls] == ['get_all', 'get_all']
+        assert all(len(call[1]) <= IN_QUERY_LIMIT for call in client.calls)
+        assert summaries['rest_7'] == {'average_rating': 4.0, 'review_count': 3}
+        assert summaries['no_reviews'] == {'average_rating': 0.0, 'review_count': 0}
+
+    def test_rebuild_rating_summary_aggregates_server_side(self):
+        """Backfilling counters runs one aggregation query, without streaming reviews"""
+        client = self.make_review_client(2)
+        firestore_db = make_db(MENU_LAYOUT_COLLECTION, client)
+
+        assert firestore_db.rebuild_rating_summary('rest_1')
+
+        assert [call[0] for call in client.calls] == ['aggregate']
+        assert client.data['rating_summaries']['rest_1'] == {'review_count': 3, 'rating_sum': 12}
+        assert firestore_db.get_rating_summaries(['rest_1'])['rest_1']['average_rating'] == 4.0
+
+    def test_menus_many_document_layout(self):
+        """Document layout uses one multi-document get per chunk"""
+        client = FakeFirestoreClient()
+        client.collection('menus').document('pizza_palace').set({'items': [{'id': '1', 'name': 'Pizza'}]})
+        firestore_db = make_db(MENU_LAYOUT_DOCUMENT, client)
+
+        menus = firestore_db.get_menu_items_many(['pizza_palace', 'burger_haven'])
+
+        assert client.calls == [('get_all', ('pizza_palace', 'burger_haven'))]
+        assert menus == {'pizza_palace': [{'id': '1', 'name': 'Pizza'}], 'burger_haven': []}
+
+    def test_menus_many_collection_layout_groups_items(self):
+        """Collection layout groups an 'in' query's items by restaurant"""
+        client = FakeFirestoreClient()
+        client.collection('menu_items').document('a').set({'restaurant_id': 'pizza_palace', 'name': 'Pizza'})
+        client.collection('menu_items').document('b').set({'restaurant_id': 'dragon_wok', 'name': 'Rice'})
+        firestore_db = make_db(MENU_LAYOUT_COLLECTION, client)
+
+        menus = firestore_db.get_menu_items_many(['pizza_palace', 'dragon_wok'])
+
+        assert len(client.calls) == 1
+        assert [i['name'] for i in menus['dragon_wok']] == ['Rice']
+
+    def test_mock_mode_returns_every_id(self):
+        """Without Firestore, batch lookups still cover every restaurant"""
+        firestore_db = FirestoreDB()
+        firestore_db.initialized = False
+
+        assert firestore_db.get_rating_summaries(['a', 'b'])['b']['review_count'] == 0
+        assert len(firestore_db.get_menu_items_many(['pizza_palace'])['pizza_palace']) == 2
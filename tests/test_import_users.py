@@ -0,0 +1,111 @@
+"""Tests for the bulk user import script"""
+import json
+import pytest
+import bcrypt
+
+from database.postgres import PostgresDB
+from database.models import User
+from import_users import import_users, read_records
+
+
+@pytest.fixture
+def db():
+    """Fresh in-memory database per test"""
+    db = PostgresDB('sqlite:///:memory:')
+    db.create_tables()
+    yield db
+    db.drop_tables()
+
+
+def record(n, **overrides):
+    return {'email': f'user{n}@example.com', 'username': f'user_{n}', 'password': f'password{n}', **overrides}
+
+
+class TestImportUsers:
+    """Test validation, de-duplication and chunked inserts"""
+
+    def test_imports_across_chunks_with_process_pool(self, db):
+        """Every valid record is created with a verifiable hash"""
+        stats = import_users([record(n) for n in range(25)], db.get_session,
+                             workers=2, chunk_size=10, rounds=4)
+
+        assert stats['read'] == 25
+        assert stats['created'] == 25
+        session = db.get_session()
+        user = session.query(User).filter_by(username='user_7').first()
+        assert bcrypt.checkpw(b'password7', user.password_hash.encode())
+        assert user.is_admin is False
+        session.close()
+
+    def test_is_admin_needs_allow_admin(self, db):
+        """An is_admin column only creates admins when explicitly allowed"""
+        stats = import_users([record(1, is_admin='true'), record(2)], db.get_session, workers=0, rounds=4)
+        assert stats['is_admin ignored (use --allow-admin)'] == 1
+        import_users([record(3, is_admin='true')], db.get_session, workers=0, rounds=4, allow_admin=True)
+
+        session = db.get_session()
+        admins = {user.username: user.is_admin for user in session.query(User)}
+        assert admins == {'user_1': False, 'user_2': False, 'user_3': True}
+        session.close()
+
+    def test_skips_invalid_and_duplicate_records(self, db):
+        """Bad rows, repeats within the file and existing accounts are counted, not inserted"""
+        session = db.get_session()
+        session.add(User(email='user1@example.com', username='taken', password_hash='x'))
+        session.commit()
+        session.close()
+
+        records = [
+            record(0),
+            record(1),                           # email already registered
+            record(2, email='not-an-email'),
+            record(3, password='short'),
+            record(4, username='bad name!'),
+            record(0, username='user_0b'),       # same email as the first record
+        ]
+        stats = import_users(records, db.get_session, workers=0, chunk_size=4, rounds=4)
+
+        assert stats['created'] == 1
+        assert stats['already exists'] == 1
+        assert stats['duplicate in file'] == 1
+        assert stats['invalid email'] == 1
+        assert stats['password too short'] == 1
+        assert stats['invalid username'] == 1
+
+    def test_conflict_on_retry_is_reported(self, db, monkeypatch, capsys):
+        """A row that still conflicts after the re-check is skipped and named, not fatal"""
+        import import_users as module
+        session = db.get_session()
+        session.add(User(email='user1@example.com', username='racer', password_hash='x'))
+        session.commit()
+        session.close()
+        # Another writer keeps inserting after each check, so neither check sees the row
+        monkeypatch.setattr(module, '_existing', lambda session, records: (set(), set()))
+
+        stats = import_users([record(n) for n in range(3)], db.get_session, workers=0, rounds=4)
+
+        assert stats['created'] == 2
+        assert stats['already exists'] == 1
+        assert 'user1@example.com' in capsys.readouterr().out
+        session = db.get_session()
+        assert sorted(user.username for user in session.query(User)) == ['racer', 'user_0', 'user_2']
+        session.close()
+
+    def test_dry_run_inserts_nothing(self, db):
+        """Dry runs report what would be created"""
+        stats = import_users([record(n) for n in range(3)], db.get_session, dry_run=True)
+
+        assert stats['would create'] == 3
+        session = db.get_session()
+        assert session.query(User).count() == 0
+        session.close()
+
+    def test_reads_csv_and_jsonl(self, tmp_path):
+        """Both input formats yield the same records"""
+        csv_file = tmp_path / 'users.csv'
+        csv_file.write_text('email,username,password\nuser1@example.com,user_1,password1\n')
+        jsonl_file = tmp_path / 'users.jsonl'
+        jsonl_file.write_text(json.dumps(record(1)) + '\n\n')
+
+        assert list(read_records(str(csv_file))) == [record(1)]
+        assert list(read_records(str(jsonl_file))) == [record(1)]
@@ -0,0 +1,170 @@
+"""Tests for the per-restaurant kitchen queue"""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event, select
+
+from database.postgres import PostgresDB
+from database.models import Restaurant, Order, OrderItem, OrderStatus
+from app.services import kitchen_queue
+from app.services.kitchen_queue import snapshot, changes_since
+from app.services.order_history import record_created
+from app.services.order_state import transition, transition_many
+
+
+@pytest.fixture
+def kitchen_db():
+    db = PostgresDB('sqlite:///:memory:')
+    db.create_tables()
+    session = db.get_session()
+    session.add(Restaurant(id=1, name='Pizza Palace', city='New York'))
+    session.add(Restaurant(id=2, name='Sushi Bar', city='New York'))
+    session.commit()
+    session.close()
+    yield db
+    db.drop_tables()
+
+
+def place_order(session, restaurant_id=1, minutes_ago=0):
+    order = Order(user_id=1, restaurant_id=restaurant_id, total_price=12.99,
+                  created_at=datetime.utcnow() - timedelta(minutes=minutes_ago))
+    order.items.append(OrderItem(menu_item_name='Margherita Pizza', restaurant_id=restaurant_id,
+                                 quantity=2, unit_price=6.5))
+    session.add(order)
+    session.flush()
+    record_created(session, order)
+    session.commit()
+    return order.id
+
+
+def later():
+    """A time by which every event written so far has settled"""
+    return datetime.utcnow() + timedelta(seconds=kitchen_queue.SETTLE_SECONDS + 1)
+
+
+class TestSnapshot:
+    """Test the full queue"""
+
+    def test_active_orders_in_arrival_order(self, kitchen_db):
+        session = kitchen_db.get_session()
+        newer = place_order(session, minutes_ago=1)
+        older = place_order(session, minutes_ago=5)
+        done = place_order(session, minutes_ago=3)
+        place_order(session, restaurant_id=2)
+        for status in (OrderStatus.CONFIRMED, OrderStatus.PREPARING, OrderStatus.READY, OrderStatus.DELIVERED):
+            transition(session, done, status)
+        session.commit()
+
+        queue = snapshot(session, 1)
+        assert queue['reset'] is True
+        assert [order['id'] for order in queue['orders']] == [older, newer]
+        assert queue['orders'][0]['items'] == [
+            {'name': 'Margherita Pizza', 'quantity': 2, 'special_instructions': None}
+        ]
+        assert queue['cursor'] == 0  # nothing has settled yet
+        assert snapshot(session, 1, now=later())['cursor'] > 0
+        session.close()
+
+    def test_served_by_partial_index(self, kitchen_db):
+        """The active-orders query matches ix_orders_kitchen_queue"""
+        session = kitchen_db.get_session()
+        statement = select(Order.id).where(
+            Order.restaurant_id == 1, kitchen_queue._active()
+        ).order_by(Order.created_at, Order.id)
+        compiled = statement.compile(kitchen_db.engine, compile_kwargs={'literal_binds': True})
+        plan = session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+        assert 'ix_orders_kitchen_queue' in str(plan)
+        session.close()
+
+
+class TestChangesSince:
+    """Test incremental polling"""
+
+    def test_changes_and_removals(self, kitchen_db):
+        session = kitchen_db.get_session()
+        first = place_order(session)
+        cancelled = place_order(session)
+        cursor = snapshot(session, 1, now=later())['cursor']
+
+        transition(session, first, OrderStatus.CONFIRMED)
+        transition(session, cancelled, OrderStatus.CANCELLED)
+        new = place_order(session)
+        session.commit()
+
+        queue = changes_since(session, 1, cursor, now=later())
+        assert queue['reset'] is False
+        assert [(order['id'], order['status']) for order in queue['orders']] == [
+            (first, 'confirmed'), (new, 'pending')
+        ]
+        assert queue['removed'] == [cancelled]
+        assert queue['cursor'] > cursor
+
+        quiet = changes_since(session, 1, queue['cursor'], now=later())
+        assert (quiet['orders'], quiet['removed'], quiet['cursor']) == ([], [], queue['cursor'])
+        session.close()
+
+    def test_recent_events_are_sent_again(self, kitchen_db):
+        """The cursor doesn't pass events that may still have late-committing neighbours"""
+        session = kitchen_db.get_session()
+        cursor = snapshot(session, 1)['cursor']
+        order_id = place_order(session)
+
+        queue = changes_since(session, 1, cursor)
+        assert [order['id'] for order in queue['orders']] == [order_id]
+        assert queue['cursor'] == cursor
+        assert changes_since(session, 1, cursor, now=later())['cursor'] > cursor
+        session.close()
+
+    def test_other_restaurants_are_ignored(self, kitchen_db):
+        session = kitchen_db.get_session()
+        cursor = snapshot(session, 1)['cursor']
+        place_order(session, restaurant_id=2)
+        assert changes_since(session, 1, cursor, now=later())['orders'] == []
+        session.close()
+
+    def test_large_backlog_resets_to_snapshot(self, kitchen_db, monkeypatch):
+        monkeypatch.setattr(kitchen_queue, 'MAX_CHANGES', 3)
+        session = kitchen_db.get_session()
+        order_ids = [place_order(session) for _ in range(3)]
+        transition_many(session, order_ids, OrderStatus.CONFIRMED)
+        session.commit()
+
+        queue = changes_since(session, 1, 0, now=later())
+        assert queue['reset'] is True
+        assert len(queue['orders']) == 3
+        session.close()
+
+    def test_empty_poll_is_one_query(self, kitchen_db):
+        session = kitchen_db.get_session()
+        place_order(session)
+        cursor = changes_since(session, 1, 0, now=later())['cursor']
+
+        statements = []
+        listener = lambda conn, cursor_, statement, *args: statements.append(statement)
+        event.listen(kitchen_db.engine, 'before_cursor_execute', listener)
+        try:
+            changes_since(session, 1, cursor, now=later())
+        finally:
+            event.remove(kitchen_db.engine, 'before_cursor_execute', listener)
+        assert len(statements) == 1
+        session.close()
+
+
+class TestKitchenQueueRoute:
+    """Test the admin endpoint"""
+
+    def test_snapshot_then_poll(self, client, kitchen_db, monkeypatch, admin_user):
+        from database import postgres
+        monkeypatch.setattr(postgres, '_db_instance', kitchen_db)
+        session = kitchen_db.get_session()
+        order_id = place_order(session)
+        session.close()
+
+        first = client.get('/admin/restaurants/1/kitchen-queue').get_json()
+        poll = client.get(f"/admin/restaurants/1/kitchen-queue?cursor={first['cursor']}").get_json()
+
+        assert first['reset'] is True
+        assert [order['id'] for order in first['orders']] == [order_id]
+        # The new order's event hasn't settled, so it is sent again
+        assert poll['reset'] is False
+        assert [order['id'] for order in poll['orders']] == [order_id]
+        assert poll['cursor'] == first['cursor']
@@ -0,0 +1,274 @@
+"""Tests for the notification service and its sinks"""
+import pytest
+import json
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from app.services.notifications import NotificationDispatcher
+from app.services.notification_sinks import NotificationSink, WebhookSink, SmtpSink
+from app.services import notification_log
+from app.services.notification_log import NotificationLog, StructuredLogSink
+
+
+def entry(n):
+    return {'timestamp': '2026-01-01T00:00:00', 'message': f'entry {n}'}
+
+
+class RecordingSink(NotificationSink):
+    """Sink that records batches and rejects any batch holding an entry `reject` matches"""
+    name = 'recording'
+
+    def __init__(self, reject=None):
+        self.batches = []
+        self.reject = reject
+
+    def send_batch(self, entries):
+        if self.reject and any(self.reject(entry) for entry in entries):
+            raise ConnectionError('receiver unavailable')
+        self.batches.append(list(entries))
+
+
+class TestNotificationDispatcher:
+    """Test per-sink delivery"""
+
+    def test_send_reports_each_entry(self):
+        """A rejected batch is retried entry by entry, so one bad entry doesn't fail the rest"""
+        sink = RecordingSink(reject=lambda e: e['message'] == 'entry 1')
+        dispatcher = NotificationDispatcher(sink)
+
+        errors = dispatcher.send([entry(0), entry(1), entry(2)])
+
+        assert [error is None for error in errors] == [True, False, True]
+        assert sink.batches == [[entry(0)], [entry(2)]]
+        stats = dispatcher.stats()
+        assert (stats['written'], stats['failed'], stats['batches']) == (2, 1, 1)
+
+    def test_workers_drain_until_shutdown(self):
+        """Workers run the drain function back to back while it fills batches, then poll"""
+        sink = RecordingSink()
+        backlog = [[entry(n) for n in range(3)], [entry(3)]]
+        drained = threading.Event()
+
+        def drain(dispatcher):
+            if not backlog:
+                drained.set()
+                return 0, 0
+            errors = dispatcher.send(backlog.pop(0))
+            return len(errors), 0
+
+        dispatcher = NotificationDispatcher(sink, batch_size=3, poll_interval=0.01)
+        dispatcher.start(drain)
+        assert drained.wait(5)
+        dispatcher.shutdown()
+
+        assert sink.batches == [[entry(0), entry(1), entry(2)], [entry(3)]]
+        assert not any(thread.is_alive() for thread in dispatcher._threads)
+
+
+def order_entry(order_id, n):
+    return {'timestamp': '2026-01-01T00:00:00', 'message': f'order {order_id} event {n}',
+            'event': 'ORDER_STATUS_UPDATED', 'order_id': order_id}
+
+
+class TestNotificationLog:
+    """Test the segmented, indexed notification log"""
+
+    def test_timeline_returns_only_the_orders_entries(self, tmp_path):
+        """Entries are indexed by order id and read back in write order"""
+        log = NotificationLog(str(tmp_path), fsync_policy='never')
+        log.append([order_entry(order_id, n) for n in range(3) for order_id in (1, 2, 3)])
+        log.append([entry('no order'), order_entry(2, 3)])
+
+        assert log.timeline(2) == [order_entry(2, n) for n in range(4)]
+        assert log.timeline(99) == []
+
+    def test_size_rotation_compresses_closed_segments(self, tmp_path):
+        """Full segments are gzipped and still readable through the index"""
+        log = NotificationLog(str(tmp_path), max_bytes=500, fsync_policy='never')
+        for n in range(20):
+            log.append([order_entry(n % 2, n)])
+
+        files = os.listdir(tmp_path)
+        compressed = [name for name in files if name.endswith('.jsonl.gz')]
+        assert len(compressed) > 1
+        assert len([name for name in files if name.startswith('segment-') and name.endswith('.jsonl')]) <= 1
+        assert log.timeline(1) == [order_entry(1, n) for n in range(1, 20, 2)]
+
+    def test_age_rotation_starts_new_segment(self, tmp_path):
+        """A segment older than max_age is closed before the next write"""
+        log = NotificationLog(str(tmp_path), max_age=0, fsync_policy='never')
+        log.append([order_entry(1, 0)])
+        log.append([order_entry(1, 1)])
+
+        assert len([name for name in os.listdir(tmp_path) if name.endswith('.gz')]) == 1
+        assert log.timeline(1) == [order_entry(1, 0), order_entry(1, 1)]
+
+    def test_index_is_shared_between_instances(self, tmp_path):
+        """A reader in another process sees entries written after its first query"""
+        writer = NotificationLog(str(tmp_path), fsync_policy='never')
+        reader = NotificationLog(str(tmp_path), fsync_policy='never')
+
+        writer.append([order_entry(7, 0)])
+        assert reader.timeline(7) == [order_entry(7, 0)]
+        writer.append([order_entry(7, 1)])
+        assert reader.timeline(7) == [order_entry(7, 0), order_entry(7, 1)]
+
+    def test_nothing_touches_disk_before_first_write(self, tmp_path):
+        """Creating the log (at import) doesn't create its directory"""
+        directory = tmp_path / 'notifications'
+        log = NotificationLog(str(directory))
+        assert log.timeline(1) == []
+        assert not directory.exists()
+
+        log.append([order_entry(1, 0)])
+        assert log.timeline(1) == [order_entry(1, 0)]
+
+    def test_compressed_reads_start_at_the_right_member(self, tmp_path):
+        """Closed segments are split into gzip members recorded in their index"""
+        padded = lambda n: dict(order_entry(n % 3, n), padding='x' * 500)
+        log = NotificationLog(str(tmp_path), max_bytes=400 * 1024, fsync_policy='never')
+        for n in range(0, 1000, 50):
+            log.append([padded(m) for m in range(n, n + 50)])
+
+        assert [name for name in os.listdir(tmp_path) if name.endswith('.gz')] != []
+        log.timeline(0)
+        first = log._indexes[min(log._indexes)]
+        segment = first.segment
+        assert len(first.members) > 3
+        assert log.timeline(2) == [padded(n) for n in range(2, 1000, 3)]
+        # Without a member table the whole segment is decompressed, with the same result
+        assert log._read_ranges(segment, [(0, len(json.dumps(padded(0), separators=(',', ':'))) + 1)]) == [padded(0)]
+
+    def test_old_segments_are_pruned_with_their_index(self, tmp_path):
+        """max_segments keeps the newest closed segments and drops the rest from the index"""
+        log = NotificationLog(str(tmp_path), max_bytes=500, max_segments=2, fsync_policy='never')
+        reader = NotificationLog(str(tmp_path), fsync_policy='never')
+        log.append([order_entry(1, 0)])
+        assert reader.timeline(1) == [order_entry(1, 0)]
+        for n in range(1, 30):
+            log.append([order_entry(n % 2, n)])
+
+        files = os.listdir(tmp_path)
+        assert len([name for name in files if name.endswith('.gz')]) == 2
+        assert len([name for name in files if name.startswith('index-')]) <= 3
+        timeline = reader.timeline(1)
+        assert order_entry(1, 0) not in timeline
+        assert timeline == [order_entry(1, n) for n in range(1, 30, 2)][-len(timeline):]
+
+    def test_index_cache_is_bounded(self, tmp_path):
+        """Only the most recently read segment indexes stay in memory"""
+        log = NotificationLog(str(tmp_path), max_bytes=500, fsync_policy='never', index_cache_segments=2)
+        for n in range(30):
+            log.append([order_entry(n % 3, n)])
+        segments = len([name for name in os.listdir(tmp_path) if name.startswith('index-')])
+        assert segments > 2
+
+        assert log.timeline(1) == [order_entry(1, n) for n in range(1, 30, 3)]
+        assert len(log._indexes) == 2
+        log.append([order_entry(1, 30)])
+        assert log.timeline(1)[-1] == order_entry(1, 30)
+        assert len(log._indexes) == 2
+
+    def test_fsync_policies(self, tmp_path, monkeypatch):
+        """interval fsyncs at most once per interval; unknown policies are rejected"""
+        synced = []
+        monkeypatch.setattr(notification_log.os, 'fsync', synced.append)
+        log = NotificationLog(str(tmp_path), fsync_policy='interval', fsync_interval=3600)
+        log.append([entry(0)])
+        log.append([entry(1)])
+        assert len(synced) == 1
+
+        with pytest.raises(ValueError):
+            NotificationLog(str(tmp_path), fsync_policy='always')
+
+    def test_dispatcher_writes_through_structured_sink(self, tmp_path):
+        """The log works as a regular dispatcher sink"""
+        log = NotificationLog(str(tmp_path), fsync_policy='never')
+        dispatcher = NotificationDispatcher(StructuredLogSink(log))
+
+        for n in range(0, 50, 10):
+            dispatcher.send([order_entry(m % 5, m) for m in range(n, n + 10)])
+        dispatcher.shutdown()
+
+        assert [e['message'] for e in log.timeline(3)] == [f'order 3 event {n}' for n in range(3, 50, 5)]
+
+
+class StubWebhookHandler(BaseHTTPRequestHandler):
+    """Local stand-in for a webhook receiver"""
+    received = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        StubWebhookHandler.received.append(json.loads(body))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP conversation, enough for smtplib.send_message"""
+    messages = []
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.reply('220 localhost stub')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line.split(' ')[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                data = []
+                while True:
+                    data_line = self.rfile.readline().decode()
+                    if data_line.strip() == '.':
+                        break
+                    data.append(data_line)
+                StubSMTPHandler.messages.append(''.join(data))
+                self.reply('250 queued')
+            elif command == 'QUIT' or not line:
+                self.reply('221 bye')
+                break
+            else:
+                self.reply('250 ok')
+
+
+class TestSinks:
+    """Test network sinks against local stand-in servers"""
+
+    def test_webhook_sink_posts_batch(self):
+        """Webhook sink POSTs entries as JSON"""
+        server = HTTPServer(('127.0.0.1', 0), StubWebhookHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        StubWebhookHandler.received = []
+        try:
+            sink = WebhookSink(f'http://127.0.0.1:{server.server_port}/hook')
+            sink.send_batch([entry(1), entry(2)])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert StubWebhookHandler.received == [{'notifications': [entry(1), entry(2)]}]
+
+    def test_smtp_sink_sends_digest(self):
+        """SMTP sink sends one digest email per batch"""
+        server = socketserver.TCPServer(('127.0.0.1', 0), StubSMTPHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        StubSMTPHandler.messages = []
+        try:
+            sink = SmtpSink('127.0.0.1', server.server_address[1], 'orders@example.com', ['ops@example.com'])
+            sink.send_batch([entry(1), entry(2)])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert len(StubSMTPHandler.messages) == 1
+        assert 'entry 1' in StubSMTPHandler.messages[0]
+        assert 'entry 2' in StubSMTPHandler.messages[0]
@@ -0,0 +1,174 @@
+"""Tests for order status history and stage-duration analytics"""
+from datetime import datetime, timedelta
+import pytest
+
+from database.postgres import PostgresDB
+from database.models import Restaurant, Order, OrderStatus, OrderStatusEvent, OrderStageRollup
+from app.services.order_state import transition, transition_many
+from app.services.order_history import (
+    BUCKET_BOUNDS, bucket_for, hour_of, record_created, stage_durations
+)
+
+
+@pytest.fixture
+def history_db():
+    db = PostgresDB('sqlite:///:memory:')
+    db.create_tables()
+    session = db.get_session()
+    session.add(Restaurant(id=1, name='Pizza Palace', city='New York'))
+    session.add(Restaurant(id=2, name='Sushi Bar', city='New York'))
+    session.commit()
+    session.close()
+    yield db
+    db.drop_tables()
+
+
+def place_order(session, restaurant_id=1, waited=0):
+    """A pending order that entered PENDING `waited` seconds ago"""
+    order = Order(user_id=1, restaurant_id=restaurant_id, total_price=10,
+                  status_changed_at=datetime.utcnow() - timedelta(seconds=waited))
+    session.add(order)
+    session.flush()
+    record_created(session, order)
+    return order
+
+
+def age_stage(session, order, seconds):
+    """Pretend the order has been in its current status for `seconds`"""
+    order.status_changed_at = datetime.utcnow() - timedelta(seconds=seconds)
+    session.flush()
+
+
+class TestBuckets:
+    """Test the duration histogram layout"""
+
+    def test_bounds_grow_geometrically_to_a_week(self):
+        assert BUCKET_BOUNDS[0] == 1.0
+        assert BUCKET_BOUNDS[-1] < 7 * 24 * 3600 <= BUCKET_BOUNDS[-1] * 1.25
+        assert bucket_for(0.5) == 0
+        assert bucket_for(1.1) == 1
+        assert bucket_for(10 ** 9) == len(BUCKET_BOUNDS)
+
+
+class TestStatusHistory:
+    """Test that every transition is recorded"""
+
+    def test_events_follow_the_order(self, history_db):
+        session = history_db.get_session()
+        order = place_order(session, waited=120)
+        assert transition(session, order.id, OrderStatus.CONFIRMED).ok
+        assert not transition(session, order.id, OrderStatus.DELIVERED).ok
+        session.commit()
+
+        events = session.query(OrderStatusEvent).order_by(OrderStatusEvent.id).all()
+        assert [(e.from_status, e.to_status) for e in events] == [
+            (None, OrderStatus.PENDING), (OrderStatus.PENDING, OrderStatus.CONFIRMED)
+        ]
+        assert events[0].stage_seconds is None
+        assert 119 < events[1].stage_seconds < 130
+        assert events[1].restaurant_id == 1
+        session.close()
+
+    def test_rolled_back_transition_leaves_no_history(self, history_db):
+        session = history_db.get_session()
+        order = place_order(session)
+        session.commit()
+        transition(session, order.id, OrderStatus.CONFIRMED)
+        session.rollback()
+
+        assert session.query(OrderStatusEvent).count() == 1
+        assert session.query(OrderStageRollup).count() == 0
+        session.close()
+
+    def test_bulk_transitions_share_rollup_rows(self, history_db):
+        """Orders that waited about as long increment one histogram bucket"""
+        session = history_db.get_session()
+        order_ids = [place_order(session, waited=600).id for _ in range(5)]
+        transition_many(session, order_ids, OrderStatus.CONFIRMED)
+        session.commit()
+
+        rollups = session.query(OrderStageRollup).all()
+        assert len(rollups) == 1
+        assert (rollups[0].stage, rollups[0].count) == (OrderStatus.PENDING, 5)
+        assert rollups[0].hour <= hour_of(datetime.utcnow())
+        assert session.query(OrderStatusEvent).filter(OrderStatusEvent.from_status.isnot(None)).count() == 5
+        session.close()
+
+
+class TestStageDurations:
+    """Test percentiles read from the rollups"""
+
+    def test_percentiles_per_stage_and_restaurant(self, history_db):
+        session = history_db.get_session()
+        for waited in range(1, 101):  # 1..100 minutes in PENDING
+            place_order(session, waited=waited * 60)
+        place_order(session, restaurant_id=2, waited=5)
+        session.flush()
+
+        orders = session.query(Order).filter_by(restaurant_id=1).all()
+        transition_many(session, [order.id for order in orders], OrderStatus.CONFIRMED)
+        for order in orders[:10]:
+            age_stage(session, order, 30)
+        transition_many(session, [order.id for order in orders[:10]], OrderStatus.PREPARING)
+        session.commit()
+
+        stats = stage_durations(session, 1, datetime.utcnow() - timedelta(hours=1))['stages']
+        assert set(stats) == {'pending', 'confirmed'}
+        assert stats['pending']['count'] == 100
+        assert stats['confirmed']['count'] == 10
+        # Estimates are within one bucket (25%) of the exact values
+        assert 50 * 60 * 0.8 <= stats['pending']['p50'] <= 50 * 60 * 1.25
+        assert 90 * 60 * 0.8 <= stats['pending']['p90'] <= 90 * 60 * 1.25
+        assert 30 * 0.8 <= stats['confirmed']['p99'] <= 30 * 1.25
+
+        assert stage_durations(session, 2, datetime.utcnow() - timedelta(hours=1))['stages'] == {}
+        session.close()
+
+    def test_window_and_series(self, history_db):
+        session = history_db.get_session()
+        now = datetime.utcnow()
+        session.add_all([
+            OrderStageRollup(restaurant_id=1, stage=OrderStatus.READY, hour=hour_of(now),
+                             bucket=bucket_for(300), count=4),
+            OrderStageRollup(restaurant_id=1, stage=OrderStatus.READY, hour=hour_of(now) - timedelta(hours=5),
+                             bucket=bucket_for(60), count=2),
+            OrderStageRollup(restaurant_id=1, stage=OrderStatus.READY, hour=hour_of(now) - timedelta(days=3),
+                             bucket=bucket_for(60), count=50),
+        ])
+        session.commit()
+
+        until = hour_of(now) + timedelta(hours=1)
+        result = stage_durations(session, 1, until - timedelta(hours=6), until=until, interval=timedelta(hours=3))
+        assert result['stages']['ready']['count'] == 6
+        assert [entry['stages']['ready']['count'] for entry in result['series']] == [2, 4]
+        assert result['series'][1]['stages']['ready']['p50'] <= 300 * 1.25
+        session.close()
+
+
+class TestStageDurationRoute:
+    """Test the admin analytics endpoint"""
+
+    @pytest.fixture
+    def app_history(self, history_db, monkeypatch):
+        """history_db as the app database, holding one confirmed order"""
+        from database import postgres
+        monkeypatch.setattr(postgres, '_db_instance', history_db)
+
+        session = history_db.get_session()
+        order = place_order(session, waited=90)
+        transition(session, order.id, OrderStatus.CONFIRMED)
+        session.commit()
+        session.close()
+        return history_db
+
+    def test_requires_admin(self, client, app_history, regular_user):
+        assert client.get('/admin/restaurants/1/stage-durations').status_code == 403
+
+    def test_reports_stages(self, client, app_history, admin_user):
+        response = client.get('/admin/restaurants/1/stage-durations?hours=24&interval=6')
+        invalid = client.get('/admin/restaurants/1/stage-durations?hours=0')
+
+        data = response.get_json()
+        assert data['stages']['pending']['count'] == 1
+        assert len(data['series']) == 4
+        assert invalid.status_code == 400
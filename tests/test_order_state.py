@@ -0,0 +1,301 @@
+"""Tests for the order status state machine"""
+import threading
+import pytest
+from sqlalchemy import event
+
+from database.postgres import PostgresDB
+from database.models import User, Restaurant, Order, Payment, OrderStatus, PaymentStatus, OutboxEvent
+from app.services.order_state import transition, transition_many, OK, NOT_FOUND, CONFLICT
+
+
+@pytest.fixture
+def orders_db(tmp_path):
+    """File-backed database (so threads really use separate connections) with one pending order"""
+    db = PostgresDB(f"sqlite:///{tmp_path / 'orders.db'}")
+    db.create_tables()
+    session = db.get_session()
+    session.add(User(id=1, email='a@example.com', username='alice', password_hash='x'))
+    session.add(Restaurant(id=1, name='Pizza Palace', city='New York'))
+    session.add(Order(id=1, user_id=1, restaurant_id=1, status=OrderStatus.PENDING, total_price=12.99))
+    session.add(Payment(order_id=1, amount=12.99, status=PaymentStatus.COMPLETED))
+    session.commit()
+    session.close()
+    yield db
+    db.engine.dispose()
+
+
+def order_row(db, order_id=1):
+    session = db.get_session()
+    try:
+        return session.query(Order).filter_by(id=order_id).one()
+    finally:
+        session.close()
+
+
+class TestTransition:
+    """Test single transitions"""
+
+    def test_success_bumps_version_and_records_previous_status(self, orders_db):
+        session = orders_db.get_session()
+        result = transition(session, 1, OrderStatus.CONFIRMED)
+        session.commit()
+        session.close()
+
+        assert result.outcome == OK
+        assert (result.old_status, result.version) == (OrderStatus.PENDING, 2)
+        order = order_row(orders_db)
+        assert (order.status, order.previous_status, order.version) == (
+            OrderStatus.CONFIRMED, OrderStatus.PENDING, 2
+        )
+
+    def test_invalid_transition_reports_current_status(self, orders_db):
+        session = orders_db.get_session()
+        result = transition(session, 1, OrderStatus.DELIVERED)
+        session.close()
+
+        assert result.outcome == CONFLICT
+        assert result.current_status == OrderStatus.PENDING
+        assert not result.stale
+        assert result.message == 'Cannot transition from pending to delivered'
+
+    def test_missing_or_foreign_order_is_not_found(self, orders_db):
+        session = orders_db.get_session()
+        assert transition(session, 99, OrderStatus.CONFIRMED).outcome == NOT_FOUND
+        assert transition(session, 1, OrderStatus.CANCELLED, user_id=2).outcome == NOT_FOUND
+        session.close()
+        assert order_row(orders_db).status == OrderStatus.PENDING
+
+    def test_stale_version_is_a_conflict(self, orders_db):
+        session = orders_db.get_session()
+        result = transition(session, 1, OrderStatus.CONFIRMED, expected_version=7)
+        session.close()
+
+        assert result.outcome == CONFLICT
+        assert result.stale
+        assert result.version == 1
+
+    def test_allowed_from_narrows_sources(self, orders_db):
+        """Customers may only cancel pending orders"""
+        session = orders_db.get_session()
+        transition(session, 1, OrderStatus.CONFIRMED)
+        result = transition(session, 1, OrderStatus.CANCELLED, allowed_from=[OrderStatus.PENDING])
+        session.close()
+
+        assert result.outcome == CONFLICT
+        assert result.current_status == OrderStatus.CONFIRMED
+
+    def test_success_needs_no_select(self, orders_db):
+        """The check and the write are a single UPDATE; only history inserts follow"""
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(orders_db.engine, 'before_cursor_execute', listener)
+        try:
+            session = orders_db.get_session()
+            assert transition(session, 1, OrderStatus.CONFIRMED).ok
+            session.close()
+        finally:
+            event.remove(orders_db.engine, 'before_cursor_execute', listener)
+        verbs = [statement.lstrip().split()[0].upper() for statement in statements]
+        assert verbs[0] == 'UPDATE'
+        assert 'SELECT' not in verbs
+
+
+class TestTransitionMany:
+    """Test set-wise transitions"""
+
+    def add_orders(self, db, statuses):
+        session = db.get_session()
+        orders = [Order(user_id=1, restaurant_id=1, status=status, total_price=10) for status in statuses]
+        session.add_all(orders)
+        session.commit()
+        order_ids = [order.id for order in orders]
+        session.close()
+        return order_ids
+
+    def test_per_order_results_in_request_order(self, orders_db):
+        ready, pending = self.add_orders(orders_db, [OrderStatus.READY, OrderStatus.PENDING])
+        session = orders_db.get_session()
+        results = transition_many(session, [ready, 99, 1, pending, 1], OrderStatus.CONFIRMED)
+        session.commit()
+        session.close()
+
+        assert [(r.order_id, r.outcome) for r in results] == [
+            (ready, CONFLICT), (99, NOT_FOUND), (1, OK), (pending, OK)
+        ]
+        assert results[0].current_status == OrderStatus.READY
+        assert results[2].old_status == OrderStatus.PENDING
+        assert order_row(orders_db, pending).version == 2
+
+    def test_statement_count_independent_of_batch_size(self, orders_db):
+        """One UPDATE for the winners, one SELECT to explain the rest, plus the history writes"""
+        order_ids = self.add_orders(orders_db, [OrderStatus.PENDING] * 30 + [OrderStatus.READY] * 10)
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(orders_db.engine, 'before_cursor_execute', listener)
+        try:
+            session = orders_db.get_session()
+            results = transition_many(session, order_ids, OrderStatus.CONFIRMED)
+            session.close()
+        finally:
+            event.remove(orders_db.engine, 'before_cursor_execute', listener)
+        assert sum(result.ok for result in results) == 30
+        verbs = [statement.lstrip().split()[0].upper() for statement in statements]
+        assert verbs == ['UPDATE', 'INSERT', 'INSERT', 'SELECT']
+
+
+class TestConcurrentTransitions:
+    """Test that racing requests can't both win"""
+
+    def test_many_threads_one_winner(self, orders_db):
+        threads_count = 16
+        barrier = threading.Barrier(threads_count)
+        results = []
+        lock = threading.Lock()
+
+        def worker(n):
+            # Admins confirming while the customer cancels
+            session = orders_db.get_session()
+            try:
+                barrier.wait()
+                if n % 2:
+                    result = transition(session, 1, OrderStatus.CONFIRMED)
+                else:
+                    result = transition(session, 1, OrderStatus.CANCELLED, allowed_from=[OrderStatus.PENDING])
+                session.commit()
+            finally:
+                session.close()
+            with lock:
+                results.append(result)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = [result for result in results if result.ok]
+        assert len(results) == threads_count
+        assert len(winners) == 1
+        order = order_row(orders_db)
+        assert order.status == winners[0].new_status
+        assert order.version == 2
+        assert all(result.current_status == order.status for result in results if not result.ok)
+
+    def test_workflow_chain_under_contention(self, orders_db):
+        """Threads pushing every step still move the order through each step exactly once"""
+        steps = [OrderStatus.CONFIRMED, OrderStatus.PREPARING, OrderStatus.READY, OrderStatus.DELIVERED]
+        wins = []
+        lock = threading.Lock()
+
+        def worker():
+            for _ in range(20):
+                for step in steps:
+                    session = orders_db.get_session()
+                    try:
+                        result = transition(session, 1, step)
+                        session.commit()
+                    finally:
+                        session.close()
+                    if result.ok:
+                        with lock:
+                            wins.append((result.old_status, step))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(wins, key=lambda win: steps.index(win[1])) == [
+            (OrderStatus.PENDING, OrderStatus.CONFIRMED),
+            (OrderStatus.CONFIRMED, OrderStatus.PREPARING),
+            (OrderStatus.PREPARING, OrderStatus.READY),
+            (OrderStatus.READY, OrderStatus.DELIVERED),
+        ]
+        assert order_row(orders_db).version == 5
+
+
+class TestTransitionRoutes:
+    """Test the admin and cancel routes on top of the state machine"""
+
+    def test_admin_update_reports_conflict(self, client, auth_user, checkout_order, admin_user):
+        db, order_id = checkout_order
+        first = client.post(f'/admin/orders/{order_id}/status', json={'status': 'confirmed', 'version': 1})
+        assert first.status_code == 200
+        assert first.get_json()['version'] == 2
+
+        stale = client.post(f'/admin/orders/{order_id}/status', json={'status': 'cancelled', 'version': 1})
+        assert stale.status_code == 409
+        assert stale.get_json()['status'] == 'confirmed'
+
+        repeat = client.post(f'/admin/orders/{order_id}/status', json={'status': 'confirmed'})
+        assert repeat.status_code == 400
+
+        invalid = client.post(f'/admin/orders/{order_id}/status', json={'status': 'preparing', 'version': 'two'})
+        assert invalid.status_code == 400
+        assert invalid.get_json()['message'] == 'version must be an integer'
+
+        session = db.get_session()
+        try:
+            events = session.query(OutboxEvent).filter_by(order_id=order_id).all()
+            assert len(events) == 1
+            assert session.query(Order).filter_by(id=order_id).one().status == OrderStatus.CONFIRMED
+        finally:
+            session.close()
+
+    def test_bulk_update(self, client, auth_user, checkout_order, admin_user):
+        db, order_id = checkout_order
+        session = db.get_session()
+        session.add(Order(user_id=auth_user.id, restaurant_id=1, status=OrderStatus.DELIVERED, total_price=5))
+        session.commit()
+        session.close()
+
+        response = client.post('/admin/orders/status', json={
+            'order_ids': [order_id, order_id + 1, 999], 'status': 'confirmed'
+        })
+        invalid = client.post('/admin/orders/status', json={'order_ids': ['x'], 'status': 'confirmed'})
+
+        assert invalid.status_code == 400
+        data = response.get_json()
+        assert data['updated'] == 1
+        assert [result['outcome'] for result in data['results']] == ['ok', 'conflict', 'not_found']
+        assert data['results'][1]['status'] == 'delivered'
+
+        session = db.get_session()
+        try:
+            assert session.query(OutboxEvent).count() == 1
+        finally:
+            session.close()
+
+    def test_cancel_refunds_payment(self, client, auth_user, checkout_order):
+        db, order_id = checkout_order
+        client.post(f'/orders/{order_id}/cancel')
+
+        session = db.get_session()
+        try:
+            order = session.query(Order).filter_by(id=order_id).one()
+            payment = session.query(Payment).filter_by(order_id=order_id).one()
+            assert (order.status, order.previous_status) == (OrderStatus.CANCELLED, OrderStatus.PENDING)
+            assert payment.status == PaymentStatus.REFUNDED
+        finally:
+            session.close()
+
+
+@pytest.fixture
+def checkout_order(monkeypatch, auth_user):
+    """App database holding one pending, paid order owned by the test user"""
+    from database import postgres
+    db = PostgresDB('sqlite:///:memory:')
+    db.create_tables()
+    session = db.get_session()
+    session.add(Restaurant(id=1, name='Pizza Palace', city='New York'))
+    order = Order(user_id=auth_user.id, restaurant_id=1, status=OrderStatus.PENDING, total_price=12.99)
+    session.add(order)
+    session.flush()
+    session.add(Payment(order_id=order.id, amount=12.99, status=PaymentStatus.COMPLETED))
+    session.commit()
+    order_id = order.id
+    session.close()
+
+    monkeypatch.setattr(postgres, '_db_instance', db)
+    yield db, order_id
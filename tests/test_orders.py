@@ -1,6 +1,15 @@
 """Tests for order creation and management"""
 import pytest
-from database.models import Order, OrderItem, Payment, OrderStatus, PaymentStatus
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from database import postgres
+from database.postgres import PostgresDB
+from database.models import Order, OrderItem, Payment, OrderStatus, PaymentStatus, Restaurant, IdempotencyKey
+from app.services import idempotency
+from app.services.price_index import price_index
+from app.services.order_detail import load_order_detail
+from flask import render_template
 
 
 class TestOrderCreation:
@@ -347,3 +356,151 @@ class TestOrderHistory:
         response = client.post(f'/orders/{order_id}/cancel', follow_redirects=True)
         assert response.status_code == 200
         assert b'cannot' in response.data.lower() or b'error' in response.data.lower()
+
+
+@pytest.fixture
+def checkout_db(monkeypatch):
+    """App database with one restaurant whose menu the price index can load"""
+    db = PostgresDB('sqlite:///:memory:')
+    db.create_tables()
+    session = db.get_session()
+    session.add(Restaurant(id=1, name='Pizza Palace', city='New York'))
+    session.commit()
+    session.close()
+    
+    monkeypatch.setattr(postgres, '_db_instance', db)
+    monkeypatch.setattr(price_index, 'loader', lambda rid: {'pizza_1': ('Margherita Pizza', 1299)})
+    price_index.invalidate()
+    yield db
+    price_index.invalidate()
+
+
+class TestIdempotentOrders:
+    """Test that repeated order submits create one order"""
+    
+    ORDER_FORM = {'delivery_address': '123 Main Street, New York, NY 10001', 'notes': ''}
+    
+    def fill_cart(self, client):
+        client.post('/cart/add', json={
+            'restaurant_id': 1, 'item_id': 'pizza_1', 'name': 'Margherita Pizza', 'price': 12.99, 'quantity': 2
+        })
+    
+    def order_count(self, db):
+        session = db.get_session()
+        try:
+            return session.query(Order).count()
+        finally:
+            session.close()
+    
+    def test_double_submit_returns_first_order(self, client, auth_user, checkout_db):
+        """The second submit of one checkout page redirects to the first order"""
+        self.fill_cart(client)
+        form = {**self.ORDER_FORM, 'idempotency_key': 'page-token-1'}
+        
+        first = client.post('/orders/create', data=form)
+        second = client.post('/orders/create', data=form)
+        
+        assert first.status_code == second.status_code == 302
+        assert first.location == second.location
+        assert '/orders/' in first.location
+        assert self.order_count(checkout_db) == 1
+    
+    def test_header_key_replay(self, client, auth_user, checkout_db):
+        """A retried API POST with the same Idempotency-Key gets the original order"""
+        self.fill_cart(client)
+        headers = {'Idempotency-Key': 'retry-abc'}
+        
+        first = client.post('/orders/create', data=self.ORDER_FORM, headers=headers)
+        self.fill_cart(client)  # even with a new cart the key maps to the first order
+        second = client.post('/orders/create', data=self.ORDER_FORM, headers=headers)
+        
+        assert second.location == first.location
+        assert self.order_count(checkout_db) == 1
+        
+        third = client.post('/orders/create', data=self.ORDER_FORM, headers={'Idempotency-Key': 'retry-def'})
+        assert third.location != first.location
+        assert self.order_count(checkout_db) == 2
+    
+    def test_checkout_page_renders_key(self, client, auth_user, checkout_db):
+        self.fill_cart(client)
+        response = client.get('/orders/create')
+        assert b'name="idempotency_key"' in response.data
+    
+    def test_keys_unique_per_user_and_purged(self):
+        db = PostgresDB('sqlite:///:memory:')
+        db.create_tables()
+        session = db.get_session()
+        idempotency.claim(session, 1, 'k', order_id=10)
+        idempotency.claim(session, 2, 'k', order_id=11)
+        with pytest.raises(IntegrityError):
+            idempotency.claim(session, 1, 'k', order_id=12)
+        session.rollback()
+        
+        session.add(IdempotencyKey(user_id=1, key='old', order_id=9, created_at=datetime.utcnow() - timedelta(hours=30)))
+        session.add(IdempotencyKey(user_id=1, key='new', order_id=10))
+        session.commit()
+        assert idempotency.purge_expired(session, retention_hours=24) == 1
+        session.commit()
+        assert idempotency.find_order_id(session, 1, 'new') == 10
+        assert idempotency.find_order_id(session, 1, 'old') is None
+        session.close()
+
+
+class TestOrderDetailQueries:
+    """Test that order detail pages load in at most two queries"""
+    
+    def make_order(self, db, user_id, items=5):
+        session = db.get_session()
+        order = Order(user_id=user_id, restaurant_id=1, total_price=items * 12.99,
+                      delivery_address='123 Main Street, New York', status=OrderStatus.PENDING)
+        session.add(order)
+        session.flush()
+        for n in range(items):
+            session.add(OrderItem(order_id=order.id, menu_item_name=f'Item {n}', restaurant_id=1,
+                                  quantity=1, unit_price=12.99))
+        session.add(Payment(order_id=order.id, amount=order.total_price, status=PaymentStatus.PENDING))
+        session.commit()
+        order_id = order.id
+        session.close()
+        return order_id
+    
+    def count_queries(self, db):
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        return statements
+    
+    def test_customer_detail_page(self, client, auth_user, checkout_db):
+        order_id = self.make_order(checkout_db, auth_user.id)
+        statements = self.count_queries(checkout_db)
+        
+        response = client.get(f'/orders/{order_id}')
+        
+        assert response.status_code == 200
+        assert b'Item 4' in response.data
+        assert b'Pizza Palace' in response.data
+        assert len(statements) <= 2
+    
+    def test_other_users_order_not_found(self, client, auth_user, checkout_db):
+        order_id = self.make_order(checkout_db, auth_user.id + 1000)
+        assert client.get(f'/orders/{order_id}').status_code == 404
+    
+    def test_admin_detail_template(self, app, checkout_db):
+        """Everything the admin page renders comes from the two loads"""
+        from database.models import User
+        session = checkout_db.get_session()
+        session.add(User(id=77, email='customer@example.com', username='customer', password_hash='x'))
+        session.commit()
+        session.close()
+        order_id = self.make_order(checkout_db, 77, items=20)
+        statements = self.count_queries(checkout_db)
+        
+        session = checkout_db.get_session()
+        order = load_order_detail(session, order_id)
+        with app.test_request_context():
+            html = render_template('admin/order_detail.html', order=order, user=order.user)
+        session.close()
+        
+        assert 'customer@example.com' in html
+        assert 'Item 19' in html
+        assert len(statements) == 2
+
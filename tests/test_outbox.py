@@ -0,0 +1,301 @@
+"""Tests for the order event outbox"""
+import pytest
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database.postgres import PostgresDB
+from database.models import User, Restaurant, Order, OrderStatus, OutboxEvent, OutboxDelivery
+from app.services import outbox
+from app.services.notifications import NotificationDispatcher, NotificationHub
+from app.services.notification_sinks import NotificationSink
+from app.services import notification_log
+from app.services.notification_log import NotificationLog, StructuredLogSink
+
+
+@pytest.fixture
+def db():
+    """Fresh in-memory database per test"""
+    db = PostgresDB('sqlite:///:memory:')
+    db.create_tables()
+    yield db
+    db.drop_tables()
+
+
+@pytest.fixture
+def order_id(db):
+    """A pending order owned by a user"""
+    session = db.get_session()
+    user = User(email='outbox@example.com', username='outbox', password_hash='hash')
+    restaurant = Restaurant(name='Outbox Diner')
+    session.add_all([user, restaurant])
+    session.flush()
+    order = Order(user_id=user.id, restaurant_id=restaurant.id, total_price=20.0, status=OrderStatus.PENDING)
+    session.add(order)
+    session.commit()
+    order_id = order.id
+    session.close()
+    return order_id
+
+
+class RecordingSink(NotificationSink):
+    """Sink that records entries and rejects the ones `reject` matches"""
+
+    def __init__(self, name='recording', reject=None):
+        self.name = name
+        self.entries = []
+        self.reject = reject
+
+    def send_batch(self, entries):
+        if self.reject and any(self.reject(entry) for entry in entries):
+            raise ConnectionError('sink down')
+        self.entries.extend(entries)
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    """Deliver to a recording sink instead of the configured ones"""
+    sink = RecordingSink()
+    monkeypatch.setattr(outbox.notifications, 'hub', NotificationHub([NotificationDispatcher(sink)]))
+    return sink
+
+
+def deliver(db, dispatcher=None):
+    """Send one batch of a sink's deliveries (the only sink's by default)"""
+    return outbox.deliver_once(db.get_session, dispatcher or outbox.notifications.hub.dispatchers[0])
+
+
+class TestOutbox:
+    """Test writing and draining outbox events"""
+
+    def test_event_rolls_back_with_transaction(self, db, order_id):
+        """An uncommitted change leaves no outbox row behind"""
+        session = db.get_session()
+        order = session.query(Order).filter_by(id=order_id).first()
+        order.status = OrderStatus.CONFIRMED
+        outbox.record_order_event(session, outbox.ORDER_STATUS_CHANGED, order,
+                                  old_status='pending', new_status='confirmed')
+        session.rollback()
+
+        assert outbox.pending_count(session) == 0
+        session.close()
+
+    def test_drain_delivers_and_marks_events(self, db, order_id, sink):
+        """Pending events are handed to the sinks once, then delivered once"""
+        session = db.get_session()
+        order = session.query(Order).filter_by(id=order_id).first()
+        outbox.record_order_event(session, outbox.ORDER_CREATED, order)
+        outbox.record_order_event(session, outbox.ORDER_CANCELLED, order,
+                                  old_status='pending', new_status='cancelled')
+        session.commit()
+        session.close()
+
+        assert outbox.drain_once(db.get_session) == (2, 0)
+        assert outbox.drain_once(db.get_session) == (0, 0)
+        assert sink.entries == []
+        assert deliver(db) == (2, 0)
+        assert deliver(db) == (0, 0)
+
+        assert [(entry['event'], entry['order_id']) for entry in sink.entries] == [
+            ('ORDER_CREATED', order_id), ('ORDER_STATUS_UPDATED', order_id)
+        ]
+        assert sink.entries[0]['email'] == 'outbox@example.com'
+        assert (sink.entries[1]['old_status'], sink.entries[1]['new_status']) == ('pending', 'cancelled')
+
+    def test_failed_delivery_is_retried_later(self, db, order_id, sink):
+        """An entry the sink rejected stays pending with a backoff delay; the rest are delivered"""
+        sink.reject = lambda entry: entry['event'] == 'ORDER_CREATED'
+
+        session = db.get_session()
+        order = session.query(Order).filter_by(id=order_id).first()
+        outbox.record_order_event(session, outbox.ORDER_CREATED, order)
+        outbox.record_order_event(session, outbox.ORDER_STATUS_CHANGED, order,
+                                  old_status='pending', new_status='confirmed')
+        session.commit()
+        session.close()
+
+        assert outbox.drain_once(db.get_session) == (2, 0)
+        assert deliver(db) == (1, 1)
+        assert [entry['event'] for entry in sink.entries] == ['ORDER_STATUS_UPDATED']
+
+        session = db.get_session()
+        rejected = session.query(OutboxDelivery).filter(OutboxDelivery.delivered_at.is_(None)).one()
+        assert rejected.attempts == 1
+        assert rejected.last_error == 'sink down'
+        assert rejected.available_at > datetime.utcnow()
+        assert outbox.delivery_counts(session) == {'recording': {'pending': 1, 'dead': 0}}
+        # Not claimable again until the backoff expires
+        assert outbox.claim_deliveries(session, 'recording') == []
+        assert len(outbox.claim_deliveries(session, 'recording', now=datetime.utcnow() + timedelta(minutes=1))) == 1
+        session.close()
+
+    def test_only_failed_sinks_are_retried(self, db, order_id, monkeypatch):
+        """A sink that accepted an entry never gets it again while another sink retries"""
+        log, webhook = RecordingSink('log'), RecordingSink('webhook', reject=lambda entry: True)
+        hub = NotificationHub([NotificationDispatcher(log), NotificationDispatcher(webhook)])
+        monkeypatch.setattr(outbox.notifications, 'hub', hub)
+
+        session = db.get_session()
+        outbox.record_order_event(session, outbox.ORDER_CREATED, order_id)
+        session.commit()
+        session.close()
+
+        assert outbox.drain_once(db.get_session) == (1, 0)
+        assert deliver(db, hub.dispatchers[0]) == (1, 0)
+        assert deliver(db, hub.dispatchers[1]) == (0, 1)
+
+        webhook.reject = None
+        session = db.get_session()
+        session.query(OutboxDelivery).update({'available_at': datetime.utcnow() - timedelta(seconds=1)})
+        session.commit()
+        session.close()
+        assert deliver(db, hub.dispatchers[0]) == (0, 0)
+        assert deliver(db, hub.dispatchers[1]) == (1, 0)
+
+        assert len(log.entries) == 1
+        assert webhook.entries == log.entries
+
+    def test_unrenderable_event_stays_pending(self, db, order_id, sink):
+        """An event whose order is gone isn't handed off, and retries with a backoff"""
+        session = db.get_session()
+        outbox.record_order_event(session, outbox.ORDER_CREATED, order_id + 1)
+        session.commit()
+        session.close()
+
+        assert outbox.drain_once(db.get_session) == (0, 1)
+        session = db.get_session()
+        event = session.query(OutboxEvent).one()
+        assert (event.delivered_at, event.attempts) == (None, 1)
+        assert session.query(OutboxDelivery).count() == 0
+        session.close()
+
+    def test_poison_delivery_is_dead_lettered(self, db, order_id, sink, monkeypatch):
+        """After MAX_ATTEMPTS failures a delivery is parked instead of retried forever"""
+        monkeypatch.setattr(outbox, 'MAX_ATTEMPTS', 3)
+        sink.reject = lambda entry: True
+
+        session = db.get_session()
+        outbox.record_order_event(session, outbox.ORDER_CREATED, order_id)
+        session.commit()
+        session.close()
+        outbox.drain_once(db.get_session)
+
+        for attempt in range(3):
+            session = db.get_session()
+            session.query(OutboxDelivery).update({'available_at': datetime.utcnow() - timedelta(seconds=1)})
+            session.commit()
+            session.close()
+            assert deliver(db) == (0, 1)
+
+        session = db.get_session()
+        assert session.query(OutboxDelivery).one().dead_at is not None
+        assert (outbox.pending_count(session), outbox.dead_count(session)) == (0, 1)
+        assert outbox.delivery_counts(session) == {'recording': {'pending': 0, 'dead': 1}}
+        assert outbox.claim_deliveries(session, 'recording', now=datetime.utcnow() + timedelta(days=1)) == []
+
+        assert outbox.requeue_dead(session) == 1
+        session.commit()
+        assert outbox.dead_count(session) == 0
+        session.close()
+
+        sink.reject = None
+        assert deliver(db) == (1, 0)
+
+
+    def test_sinks_get_their_own_batches_and_fsyncs(self, db, order_id, tmp_path, monkeypatch):
+        """Each claim is one batch for the sink; the log fsyncs once per batch"""
+        log = NotificationLog(str(tmp_path), fsync_policy='batch')
+        log_dispatcher = NotificationDispatcher(StructuredLogSink(log), batch_size=2)
+        monkeypatch.setattr(outbox.notifications, 'hub', NotificationHub([log_dispatcher]))
+        synced = []
+        monkeypatch.setattr(notification_log.os, 'fsync', synced.append)
+
+        session = db.get_session()
+        for _ in range(5):
+            outbox.record_order_event(session, outbox.ORDER_CREATED, order_id)
+        session.commit()
+        session.close()
+        outbox.drain_once(db.get_session)
+
+        assert [deliver(db, log_dispatcher) for _ in range(4)] == [(2, 0), (2, 0), (1, 0), (0, 0)]
+        assert len(log.timeline(order_id)) == 5
+        assert log_dispatcher.stats()['batches'] == 3
+        assert len(synced) == 3 * 2  # segment and index, per batch
+
+
+    def test_admin_status_reports_backlog_per_sink(self, client, admin_user, db, order_id, monkeypatch):
+        from database import postgres
+        monkeypatch.setattr(postgres, '_db_instance', db)
+        session = db.get_session()
+        outbox.record_order_event(session, outbox.ORDER_CREATED, order_id)
+        outbox.record_order_event(session, outbox.ORDER_CREATED, order_id)
+        session.commit()
+        session.close()
+        assert client.get('/admin/notifications').get_json() == {
+            'pending_events': 2, 'sinks': {'log': {'pending': 0, 'dead': 0}}
+        }
+
+        outbox.drain_once(db.get_session, sinks=['log'])
+        assert client.get('/admin/notifications').get_json() == {
+            'pending_events': 0, 'sinks': {'log': {'pending': 2, 'dead': 0}}
+        }
+
+
+class BlockingSink(RecordingSink):
+    """Sink whose sends hang until `release` is set, like a webhook that stopped answering"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.release = threading.Event()
+
+    def send_batch(self, entries):
+        self.release.wait(10)
+        super().send_batch(entries)
+
+
+class TestSinkWorkers:
+    """Test that every sink is drained on its own threads"""
+
+    def test_blocked_webhook_does_not_delay_the_log(self, tmp_path, monkeypatch):
+        db = PostgresDB(f"sqlite:///{tmp_path / 'outbox.db'}")  # file-backed, so threads share it
+        db.create_tables()
+        session = db.get_session()
+        user = User(email='outbox@example.com', username='outbox', password_hash='hash')
+        restaurant = Restaurant(name='Outbox Diner')
+        session.add_all([user, restaurant])
+        session.flush()
+        session.add_all([
+            Order(user_id=user.id, restaurant_id=restaurant.id, total_price=10.0 + n) for n in range(5)
+        ])
+        session.commit()
+        for order in session.query(Order):
+            outbox.record_order_event(session, outbox.ORDER_CREATED, order)
+        session.commit()
+        session.close()
+
+        log = NotificationLog(str(tmp_path / 'log'), fsync_policy='never')
+        webhook = BlockingSink('webhook')
+        hub = NotificationHub([
+            NotificationDispatcher(webhook, poll_interval=0.01),
+            NotificationDispatcher(StructuredLogSink(log), poll_interval=0.01),
+        ])
+        assert outbox.drain_once(db.get_session, sinks=hub.sink_names()) == (5, 0)
+
+        outbox.start_delivery(db.get_session, hub)
+        try:
+            deadline = time.monotonic() + 5
+            while hub.stats()['log']['written'] < 5 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert hub.stats()['log']['written'] == 5
+            assert [entry['event'] for entry in log.timeline(1)] == ['ORDER_CREATED']
+            assert webhook.entries == []
+        finally:
+            webhook.release.set()
+            hub.shutdown()
+
+        assert len(webhook.entries) == 5
+        session = db.get_session()
+        assert outbox.delivery_counts(session) == {}
+        session.close()
+        db.engine.dispose()
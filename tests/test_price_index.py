@@ -0,0 +1,221 @@
+"""Tests for the menu price index and server-side repricing"""
+import threading
+import time
+import pytest
+
+from app.services.cart import Cart
+from app.services.events import bus, MenuChanged
+from app.services.price_index import (
+    MenuPriceIndex, MenuUnavailable, UnknownRestaurant, price_index, reprice_cart
+)
+
+MENU = {'pizza_1': ('Margherita Pizza', 1299), 'pizza_2': ('Pepperoni Pizza', 1499)}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def menu_source():
+    """Serve MENU for restaurant 1 through the global index"""
+    loads = []
+
+    def loader(restaurant_id):
+        loads.append(restaurant_id)
+        return dict(MENU) if restaurant_id == '1' else None
+
+    original = price_index.loader
+    price_index.loader = loader
+    price_index.invalidate()
+    yield loads
+    price_index.loader = original
+    price_index.invalidate()
+
+
+class TestMenuPriceIndex:
+    """Test loading, expiry and invalidation"""
+
+    def test_menu_loaded_once_until_ttl(self):
+        loads = []
+        clock = FakeClock()
+        index = MenuPriceIndex(lambda rid: loads.append(rid) or dict(MENU), ttl=60, clock=clock)
+
+        assert index.lookup(1, 'pizza_2') == ('Pepperoni Pizza', 1499)
+        assert index.lookup('1', 'missing') is None
+        assert loads == ['1']
+
+        clock.now = 61
+        index.lookup(1, 'pizza_1')
+        assert loads == ['1', '1']
+        assert index.stats()['hits'] == 1
+
+    def test_unavailable_menu_raises_and_is_not_cached(self):
+        def outage(restaurant_id):
+            raise MenuUnavailable('firestore down')
+
+        index = MenuPriceIndex(outage)
+        with pytest.raises(MenuUnavailable):
+            index.menu(1)
+        assert index.stats()['failures'] == 1
+        assert index.stats()['restaurants'] == 0
+
+    def test_unknown_restaurant_is_not_an_outage(self):
+        index = MenuPriceIndex(lambda rid: None)
+        with pytest.raises(UnknownRestaurant):
+            index.menu(999)
+        assert index.stats()['failures'] == 0
+        assert index.stats()['restaurants'] == 0
+
+    def test_empty_menu_is_cached(self):
+        loads = []
+        index = MenuPriceIndex(lambda rid: loads.append(rid) or {})
+        assert index.lookup(1, 'pizza_1') is None
+        assert index.lookup(1, 'pizza_1') is None
+        assert loads == ['1']
+
+    def test_concurrent_misses_share_one_load(self):
+        loads = []
+
+        def slow_loader(restaurant_id):
+            loads.append(restaurant_id)
+            time.sleep(0.05)
+            return dict(MENU)
+
+        index = MenuPriceIndex(slow_loader)
+        threads = [threading.Thread(target=index.menu, args=(1,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert loads == ['1']
+
+    def test_menu_changed_event_invalidates(self, menu_source):
+        price_index.menu(1)
+        bus.publish(MenuChanged(1))
+        price_index.menu(1)
+        assert menu_source == ['1', '1']
+
+
+class TestRepricing:
+    """Test that carts and checkout use menu prices"""
+
+    def test_reprice_cart_fixes_prices_and_drops_unknown_items(self):
+        index = MenuPriceIndex(lambda rid: dict(MENU))
+        cart = Cart()
+        cart.add(1, 'pizza_1', 'Cheap Pizza', 0.01, 2)
+        cart.add(1, 'pizza_2', 'Pepperoni Pizza', 14.99)
+        cart.add(1, 'gone', 'Old Special', 5.00)
+
+        repriced, removed = reprice_cart(cart, 1, index)
+
+        assert repriced == ['Margherita Pizza']
+        assert removed == ['Old Special']
+        assert cart.total_cents == 2 * 1299 + 1499
+        assert cart.item_count == 2
+
+    def test_reprice_cart_keeps_lines_while_menu_unavailable(self):
+        def outage(restaurant_id):
+            raise MenuUnavailable('firestore down')
+
+        cart = Cart()
+        cart.add(1, 'pizza_1', 'Margherita Pizza', 12.99)
+        with pytest.raises(MenuUnavailable):
+            reprice_cart(cart, 1, MenuPriceIndex(outage))
+        assert cart.item_count == 1
+
+        # A restaurant that no longer exists can't be ordered from
+        assert reprice_cart(cart, 1, MenuPriceIndex(lambda rid: None)) == ([], ['Margherita Pizza'])
+        assert cart.item_count == 0
+
+    def test_load_menu_reports_outages(self, monkeypatch):
+        """A failed Firestore read raises instead of looking like an empty menu"""
+        from app.services import price_index as module
+        from database.firestore import FirestoreUnavailable
+
+        class Restaurant:
+            slug = 'pizza_palace'
+
+        class Session:
+            def query(self, model):
+                return self
+
+            def filter_by(self, **kwargs):
+                return self
+
+            def first(self):
+                return Restaurant()
+
+            def close(self):
+                pass
+
+        def unavailable(slug):
+            raise FirestoreUnavailable('breaker open')
+
+        monkeypatch.setattr(module, 'SessionLocal', Session)
+        monkeypatch.setattr(module.firestore_db, 'read_menu_items', unavailable)
+        with pytest.raises(MenuUnavailable):
+            module.load_menu(1)
+        assert module.load_menu('abc') is None
+
+        # Without a slug the menu can't be found, which mustn't read as empty
+        monkeypatch.setattr(Restaurant, 'slug', None)
+        with pytest.raises(MenuUnavailable):
+            module.load_menu(1)
+
+    def test_add_uses_menu_price(self, client, auth_user, menu_source):
+        """Client-supplied name and price are replaced"""
+        response = client.post('/cart/add', json={
+            'restaurant_id': 1, 'item_id': 'pizza_1', 'name': 'Free Pizza', 'price': 0.01, 'quantity': 2
+        })
+        assert response.get_json()['cart_total'] == 25.98
+
+        response = client.post('/cart/batch', json={'ops': [
+            {'op': 'add', 'restaurant_id': 1, 'item_id': 'pizza_2', 'name': 'x', 'price': 0.01}
+        ]})
+        assert response.get_json()['cart']['1']['items'][1] == {
+            'item_id': 'pizza_2', 'name': 'Pepperoni Pizza', 'price': 14.99, 'quantity': 1
+        }
+
+        # Name and price aren't needed at all
+        response = client.post('/cart/batch', json={'ops': [
+            {'op': 'add', 'restaurant_id': 1, 'item_id': 'pizza_2'}
+        ]})
+        assert response.get_json()['cart']['1']['items'][1]['quantity'] == 2
+
+    def test_adds_wait_for_the_menu_during_an_outage(self, client, auth_user, monkeypatch):
+        """Without the menu nothing can be priced, so adds fail with 503 rather than trust the client"""
+        def outage(restaurant_id):
+            raise ConnectionError('firestore down')
+        monkeypatch.setattr(price_index, 'loader', outage)
+        price_index.invalidate()
+
+        item = {'restaurant_id': 1, 'item_id': 'pizza_1', 'name': 'Free Pizza', 'price': 0.01}
+        assert client.post('/cart/add', json=item).status_code == 503
+        assert client.post('/cart/batch', json={'ops': [{'op': 'add', **item}]}).status_code == 503
+        assert client.post('/cart/batch', json={'ops': []}).get_json()['item_count'] == 0
+        price_index.invalidate()
+
+    def test_items_not_on_menu_are_rejected(self, client, auth_user, menu_source):
+        response = client.post('/cart/add', json={
+            'restaurant_id': 1, 'item_id': 'secret', 'name': 'Secret', 'price': 1.00
+        })
+        assert response.status_code == 400
+        assert response.get_json()['message'] == 'Item is not on the menu'
+
+    def test_unknown_or_invalid_restaurant_is_rejected(self, client, auth_user, menu_source):
+        item = {'item_id': 'pizza_1', 'name': 'Pizza', 'price': 1.00}
+        for restaurant_id in (999, 'abc', None, -1):
+            response = client.post('/cart/add', json={'restaurant_id': restaurant_id, **item})
+            assert response.status_code == 400
+
+            response = client.post('/cart/batch', json={'ops': [
+                {'op': 'add', 'restaurant_id': restaurant_id, **item}
+            ]})
+            assert response.status_code == 400
+        assert client.post('/cart/add', json={'restaurant_id': 999, **item}).get_json()['message'] == 'Unknown restaurant'
+        assert client.get('/cart').status_code == 200
@@ -0,0 +1,119 @@
+"""Tests for sliding-window rate limiting"""
+import pytest
+
+from app_factory import create_app
+from database.postgres import PostgresDB, init_db
+from app.services import rate_limit
+from app.services.rate_limit import (
+    RateLimiter, MemoryBackend, DatabaseBackend, Policy, sliding_window
+)
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestSlidingWindow:
+    """Test the two-window estimate"""
+
+    def test_previous_window_weighted_by_overlap(self):
+        """Half way into a window, half the previous count still applies"""
+        assert sliding_window(previous=10, current=5, elapsed=5, limit=10, window=10) == (True, 0)
+        allowed, retry_after = sliding_window(previous=10, current=6, elapsed=5, limit=10, window=10)
+        assert allowed is False
+        assert retry_after == 1
+
+    def test_over_limit_in_current_window_waits_for_next(self):
+        """Exceeding the limit within one window waits out the window"""
+        assert sliding_window(previous=0, current=11, elapsed=2, limit=10, window=10) == (False, 8)
+
+
+class TestRateLimiter:
+    """Test limiter backends"""
+
+    def test_memory_backend_blocks_then_recovers(self):
+        """Hits over the limit are refused until the window slides on"""
+        clock = FakeClock()
+        limiter = RateLimiter(MemoryBackend(), clock=clock)
+
+        results = [limiter.hit('login:ip:1.2.3.4', 3, 10)[0] for _ in range(4)]
+        assert results == [True, True, True, False]
+
+        clock.now += 20
+        assert limiter.hit('login:ip:1.2.3.4', 3, 10) == (True, 0)
+        assert limiter.hit('login:ip:5.6.7.8', 3, 10) == (True, 0)
+        assert limiter.limited == 1
+
+    def test_database_backend_shares_counters(self):
+        """Two limiters (workers) on one database see each other's hits"""
+        db = PostgresDB('sqlite:///:memory:')
+        db.create_tables()
+        clock = FakeClock()
+        worker_a = RateLimiter(DatabaseBackend(db.get_session), clock=clock)
+        worker_b = RateLimiter(DatabaseBackend(db.get_session), clock=clock)
+
+        assert worker_a.hit('cart:user:1', 2, 60)[0] is True
+        assert worker_b.hit('cart:user:1', 2, 60)[0] is True
+        allowed, retry_after = worker_a.hit('cart:user:1', 2, 60)
+
+        assert allowed is False
+        assert retry_after > 0
+        db.drop_tables()
+
+
+class TestRateLimitedRoutes:
+    """Test the decorator on real routes"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        app = create_app('testing')
+        app.config['RATELIMIT_ENABLED'] = True
+        with app.app_context():
+            init_db()
+        monkeypatch.setattr(rate_limit, 'limiter', RateLimiter(MemoryBackend()))
+        monkeypatch.setitem(rate_limit.POLICIES, 'login', [Policy('email', 2, 60)])
+        return app.test_client()
+
+    def test_login_attempts_limited_per_email(self, client):
+        """Repeated logins for one email get 429 with Retry-After"""
+        data = {'email': 'victim@example.com', 'password': 'guess'}
+        statuses = [client.post('/auth/login', data=data).status_code for _ in range(3)]
+
+        assert statuses[:2] == [200, 200]
+        assert statuses[2] == 429
+
+        response = client.post('/auth/login', data=data)
+        assert int(response.headers['Retry-After']) > 0
+
+        other = client.post('/auth/login', data={'email': 'other@example.com', 'password': 'x'})
+        assert other.status_code == 200
+
+    def test_form_page_not_limited(self, client):
+        """Only POSTs count; loading the login page doesn't"""
+        for _ in range(5):
+            assert client.get('/auth/login').status_code == 200
+
+    def test_ip_limit_uses_trusted_forwarded_address(self, monkeypatch):
+        """Behind one proxy, clients are told apart by X-Forwarded-For, and can't spoof it"""
+        from config import TestingConfig
+        monkeypatch.setattr(TestingConfig, 'TRUSTED_PROXY_HOPS', 1)
+        app = create_app('testing')
+        app.config['RATELIMIT_ENABLED'] = True
+        with app.app_context():
+            init_db()
+        monkeypatch.setattr(rate_limit, 'limiter', RateLimiter(MemoryBackend()))
+        monkeypatch.setitem(rate_limit.POLICIES, 'login', [Policy('ip', 1, 60)])
+        client = app.test_client()
+
+        def login(forwarded_for):
+            return client.post('/auth/login', data={'email': 'a@example.com', 'password': 'x'},
+                               headers={'X-Forwarded-For': forwarded_for}).status_code
+
+        assert login('203.0.113.1') == 200
+        assert login('203.0.113.2') == 200
+        # A client-supplied entry in front of the proxy's is ignored
+        assert login('198.51.100.9, 203.0.113.1') == 429